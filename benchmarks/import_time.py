@@ -0,0 +1,61 @@
+"""Benchmark how long ``import wbpy`` takes in a fresh interpreter.
+
+Each run starts a new Python process, so nothing is already imported or
+cached in memory. To compare against another version, check it out somewhere
+and pass its directory, eg.::
+
+    git worktree add /tmp/wbpy-old <commit>
+    python benchmarks/import_time.py . /tmp/wbpy-old
+
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Slow-to-import modules that ``import wbpy`` shouldn't need to load.
+HEAVY_MODULES = ["pycountry", "asyncio", "pprint", "wbpy.aio"]
+
+SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import wbpy
+elapsed = time.perf_counter() - start
+loaded = [m for m in {modules!r} if m in sys.modules]
+print(elapsed, ",".join(loaded))
+"""
+
+
+def time_import(source_dir, runs):
+    # ``python -c`` puts the working directory first on sys.path.
+    source_dir = os.path.abspath(source_dir)
+    script = SCRIPT.format(modules=HEAVY_MODULES)
+    timings = []
+    loaded = ""
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, "-c", script],
+            cwd=source_dir, universal_newlines=True)
+        elapsed, _, loaded = output.strip().partition(" ")
+        timings.append(float(elapsed) * 1000)
+    return timings, loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source_dirs", nargs="*", default=["."],
+        help="Directories containing the wbpy package (default: .)")
+    parser.add_argument("-n", "--runs", type=int, default=20,
+        help="Number of fresh interpreters to time per directory")
+    args = parser.parse_args(argv)
+
+    print("{0:<30} {1:>9} {2:>9}  {3}".format("source", "min ms", "median ms",
+        "heavy modules loaded"))
+    for source_dir in args.source_dirs:
+        timings, loaded = time_import(source_dir, args.runs)
+        print("{0:<30} {1:>9.1f} {2:>9.1f}  {3}".format(source_dir,
+            min(timings), statistics.median(timings), loaded or "-"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
-from wbpy.indicators import IndicatorAPI, IndicatorDataset
+import sys
+
+from wbpy.indicators import IndicatorAPI, IndicatorDataset, IndicatorPanel
 from wbpy.climate import ClimateAPI, InstrumentalDataset, ModelledDataset
+from wbpy.cache import FileCache, SQLiteCache, CacheMissError
 
 __name__ = "wbpy"
 __version__ = "3.0.0"
@@ -8,9 +11,28 @@ __maintainer__ = "Matthew Duck"
 __license__ = "MIT"
 
 __all__ = [
-    IndicatorAPI,
-    IndicatorDataset,
-    ClimateAPI,
-    InstrumentalDataset,
-    ModelledDataset,
+    "IndicatorAPI",
+    "IndicatorDataset",
+    "IndicatorPanel",
+    "ClimateAPI",
+    "InstrumentalDataset",
+    "ModelledDataset",
+    "AsyncIndicatorAPI",
+    "AsyncClimateAPI",
+    "FileCache",
+    "SQLiteCache",
+    "CacheMissError",
 ]
+
+
+# The async classes are imported on first use, so that asyncio isn't loaded
+# by ``import wbpy``.
+def __getattr__(name):
+    if name in ("AsyncIndicatorAPI", "AsyncClimateAPI"):
+        from wbpy import aio
+        return getattr(aio, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+if sys.version_info < (3, 7):
+    from wbpy.aio import AsyncIndicatorAPI, AsyncClimateAPI
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""asyncio versions of the API classes.
+
+The methods mirror ``IndicatorAPI`` and ``ClimateAPI``, but are coroutines,
+and independent requests (eg. the pages of a response, or the URLs of a
+climate dataset) are made concurrently.
+"""
+import asyncio
+import datetime
+import json
+import weakref
+
+from . import utils
+from .indicators import IndicatorAPI
+from .climate import ClimateAPI, InstrumentalDataset, ModelledDataset
+
+# asyncio.get_running_loop() is new in Python 3.7. In a coroutine on 3.6,
+# get_event_loop() returns the running loop.
+_get_running_loop = getattr(asyncio, "get_running_loop",
+    asyncio.get_event_loop)
+
+
+class _AsyncRequests(object):
+
+    """Shared request handling for the async API classes."""
+
+    def _setup_async(self, fetch, max_concurrency):
+        self.max_concurrency = max_concurrency
+        # The base class __init__ has already set up a blocking fetcher.
+        self._blocking_fetch = self.fetch
+        self.fetch = fetch if fetch else self._fetch_in_thread
+        # Semaphores belong to one event loop, so keep one per loop.
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    async def _fetch_in_thread(self, url):
+        """Default ``fetch``, which runs the blocking fetcher (and its
+        cache) in the event loop's default executor."""
+        loop = _get_running_loop()
+        return await loop.run_in_executor(None, self._blocking_fetch, url)
+
+    def _semaphore(self):
+        loop = _get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def _fetch_text(self, url):
+        async with self._semaphore():
+            return await self.fetch(url)
+
+    async def _fetch_json(self, url):
+        if self.fetch != self._fetch_in_thread:
+            return json.loads(await self._fetch_text(url))
+        # With the default fetcher, parse in the executor too, so large
+        # responses don't block the loop (and parsed responses held in the
+        # memory cache can be used).
+        async with self._semaphore():
+            loop = _get_running_loop()
+            return await loop.run_in_executor(None, utils.load_json,
+                self._blocking_fetch, url)
+
+    async def _fetch_chunks(self, url):
+        if self.fetch != self._fetch_in_thread:
+            return [await self._fetch_text(url)]
+        async with self._semaphore():
+            loop = _get_running_loop()
+            return await loop.run_in_executor(None, utils.load_chunks,
+                self._blocking_fetch, url)
+
+    async def _fetch_all_json(self, urls):
+        return await asyncio.gather(*[self._fetch_json(url) for url in urls])
+
+
+class AsyncIndicatorAPI(_AsyncRequests, IndicatorAPI):
+
+    """Request data from the World Bank Indicators API using asyncio.
+
+    Has the same methods as ``IndicatorAPI``, but they return awaitables.
+
+    :param fetch:
+        An async function which requests a URL and returns the response as a
+        string. By default, the blocking tempfile-cached ``fetch`` is run in
+        the event loop's executor.
+
+    :param max_concurrency:
+        Maximum number of requests in flight at once for this instance.
+
+    :param offline:
+        Passed to the default fetcher; see ``IndicatorAPI``.
+
+    """
+
+    def __init__(self, fetch=None, max_concurrency=8, offline=None):
+        IndicatorAPI.__init__(self, offline=offline)
+        self._setup_async(fetch, max_concurrency)
+
+    async def get_dataset(self, indicator, country_codes=None,
+            keep_response=True, **kwargs):
+        """See ``IndicatorAPI.get_dataset()``."""
+        url = self._dataset_url(indicator, country_codes, **kwargs)
+        urls = self._dataset_urls(indicator, country_codes, **kwargs)
+        call_date = datetime.datetime.now().date()
+        if keep_response:
+            responses = await asyncio.gather(*[self._get_page(chunk_url,
+                allow_empty=True) for chunk_url in urls])
+            return self._merged_dataset(responses, urls, url, call_date)
+
+        streams = await asyncio.gather(*[self._fetch_chunks(chunk_url) for
+            chunk_url in urls])
+        if self.fetch != self._fetch_in_thread:
+            return self._dataset_from_streams(streams, urls, url, call_date)
+        # With the default fetcher, the parsing is run in the executor too.
+        loop = _get_running_loop()
+        return await loop.run_in_executor(None, self._dataset_from_streams,
+            streams, urls, url, call_date)
+
+    async def get_datasets(self, indicators, country_codes=None, **kwargs):
+        """See ``IndicatorAPI.get_datasets()``."""
+        urls = [url for indicator in indicators for url in
+            self._dataset_urls(indicator, country_codes, **kwargs)]
+        call_date = datetime.datetime.now().date()
+        streams = await asyncio.gather(*[self._fetch_chunks(url) for url in
+            urls])
+        if self.fetch != self._fetch_in_thread:
+            return self._panel_from_streams(streams, urls, call_date)
+        loop = _get_running_loop()
+        return await loop.run_in_executor(None, self._panel_from_streams,
+            streams, urls, call_date)
+
+    async def iter_dataset_rows(self, indicator, country_codes=None,
+            per_page=1000, **kwargs):
+        """See ``IndicatorAPI.iter_dataset_rows()``. This is an async
+        generator, for use with ``async for``."""
+        # A chunk of countries without any data is skipped, unless every
+        # chunk is empty.
+        found_rows = False
+        for url in self._dataset_urls(indicator, country_codes,
+                per_page=per_page, **kwargs):
+            page_url = url
+            page = 1
+            while True:
+                # Each page is downloaded, then parsed as its rows are used.
+                header, rows = self._parse_page_stream(
+                    await self._fetch_chunks(page_url), page_url,
+                    allow_empty=True)
+                for row in rows:
+                    found_rows = True
+                    yield self._dataset_row(row)
+                if page >= int(header["pages"]):
+                    break
+                page += 1
+                page_url = url + "&page={0}".format(page)
+        if not found_rows:
+            raise ValueError(utils.EXC_MSG % (self._dataset_url(indicator,
+                country_codes, per_page=per_page, **kwargs), [header]))
+
+    async def get_indicators(self, indicator_codes=None, search=None,
+            search_full=False, common_only=False, **kwargs):
+        """See ``IndicatorAPI.get_indicators()``."""
+        func_params = {
+            "response_key": "id",
+            "rest_url": "indicator",
+            "search_key": "name",
+            }
+        results = await self._get_indicator_data(func_params,
+            indicator_codes, search=search, search_full=search_full,
+            **kwargs)
+
+        if common_only:
+            page = await self._fetch_text(self.COMMON_INDICATORS_URL)
+            return self._filter_common_indicators(results, page)
+        else:
+            return results
+
+    # The other ``get_`` methods return ``_get_indicator_data()`` directly, so
+    # they return its coroutine without needing to be redefined here.
+
+    async def _get_indicator_data(self, func_params, api_ids, search=None,
+            search_full=False, **kwargs):
+        url = self._indicator_data_url(func_params, api_ids, **kwargs)
+        world_bank_response = await self._get_api_response_as_json(url)
+        return self._filter_indicator_data(func_params, world_bank_response,
+            search=search, search_full=search_full)
+
+    async def _get_api_response_as_json(self, url):
+        json_resp = await self._get_page(url)
+        header = json_resp[0]
+        content = list(json_resp[1])
+        page_urls = [url + "&page={0}".format(page) for page in
+            range(int(header["page"]) + 1, int(header["pages"]) + 1)]
+        pages = await asyncio.gather(*[self._get_page(page_url) for
+            page_url in page_urls])
+        for page_resp in pages:
+            content.extend(page_resp[1])
+        return content
+
+    async def _get_page(self, url, allow_empty=False):
+        json_resp = await self._fetch_json(url)
+        self._raise_if_bad_response(json_resp, url, allow_empty)
+        return json_resp
+
+
+class AsyncClimateAPI(_AsyncRequests, ClimateAPI):
+
+    """Request data from the World Bank Climate API using asyncio.
+
+    Has the same methods as ``ClimateAPI``, but they return awaitables. All
+    URLs for a dataset are requested concurrently.
+
+    :param fetch:
+        An async function which requests a URL and returns the response as a
+        string. By default, the blocking tempfile-cached ``fetch`` is run in
+        the event loop's executor.
+
+    :param max_concurrency:
+        Maximum number of requests in flight at once for this instance.
+
+    :param offline:
+        Passed to the default fetcher; see ``ClimateAPI``.
+
+    """
+
+    def __init__(self, fetch=None, max_concurrency=8, offline=None):
+        ClimateAPI.__init__(self, offline=offline)
+        self._setup_async(fetch, max_concurrency)
+
+    async def get_instrumental(self, data_type, interval, locations):
+        """See ``ClimateAPI.get_instrumental()``."""
+        data_type, interval = self._clean_instrumental_args(data_type,
+            interval)
+        urls = self._instrumental_urls(data_type, interval, locations)
+        resps = await self._fetch_all_json(urls)
+        api_calls = self._api_calls(urls, resps)
+
+        call_date = datetime.datetime.now().date()
+        return InstrumentalDataset(api_calls, data_interval=interval,
+            data_type=data_type, call_date=call_date)
+
+    async def get_modelled(self, data_type, interval, locations):
+        """See ``ClimateAPI.get_modelled()``."""
+        data_type, interval = self._clean_modelled_args(data_type, interval)
+        urls = self._modelled_urls(data_type, interval, locations)
+        resps = await self._fetch_all_json(urls)
+        api_calls = self._api_calls(urls, resps)
+
+        call_date = datetime.datetime.now().date()
+        return ModelledDataset(api_calls, data_interval=interval,
+            data_type=data_type, call_date=call_date)
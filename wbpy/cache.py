@@ -0,0 +1,801 @@
+# -*- coding: utf-8 -*-
+"""Cache backends for ``utils.fetch()``.
+
+A backend stores response bodies (as bytes) by URL. ``SQLiteCache`` is the
+default. It keeps every response in one indexed database file.
+``FileCache`` is the older layout, with one file per URL.
+
+Both backends can compress entries with zlib or lzma (``compression``), and
+can be given a ``max_entries`` and/or ``max_bytes`` budget. When
+a new entry takes the cache over budget, the least recently used entries are
+evicted.
+
+``MemoryCache`` is a small in-process tier that ``fetch()`` checks before the
+backend. ``MEMORY_CACHE`` is shared by all API instances.
+
+``TTLPolicy`` decides how long each response stays fresh, based on its URL.
+
+In offline mode (``fetch(offline=True)``, or the ``WBPY_OFFLINE`` environment
+variable), responses only come from the cache, however old they are, and a
+URL that isn't cached raises ``CacheMissError``.
+"""
+import abc
+import collections
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+import six
+
+logger = logging.getLogger(__name__)
+
+# Cached responses are considered fresh for one day by default.
+DEFAULT_TTL = 86400
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "wbpy")
+
+# Size budget of the default cache, so long-lived processes don't fill up the
+# tempdir.
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# ``etag`` and ``last_modified`` are the response validators, used to make a
+# conditional request when the entry has expired. Either may be None.
+CacheEntry = collections.namedtuple("CacheEntry",
+    ["url", "body", "fetched_at", "ttl", "etag", "last_modified"])
+
+
+class CacheMissError(IOError):
+
+    """Raised in offline mode when a URL isn't in the cache.
+
+    It's an ``IOError``, so code that already handles network errors handles
+    it too.
+    """
+
+    def __init__(self, url):
+        super(CacheMissError, self).__init__(
+            "Offline, and no cached response for %s" % url)
+        self.url = url
+
+
+def offline_from_env():
+    """Return True if the ``WBPY_OFFLINE`` environment variable is set to
+    anything other than "", "0" or "false"."""
+    return os.environ.get("WBPY_OFFLINE", "").lower() not in ("", "0",
+        "false")
+
+
+def url_hash(url):
+    # Python3 hashlib requires bytestring
+    return hashlib.md5(url.encode("utf-8")).hexdigest()
+
+
+class TTLPolicy(object):
+
+    """Choose the cache TTL for a URL.
+
+    :param rules:
+        List of ``(pattern, ttl)`` pairs, checked in order. The first pattern
+        that matches the URL (using ``re.search``, ignoring case) gives the
+        TTL in seconds. A pattern can also be the name of an API method, eg.
+        ``"get_topics"``, which matches the URLs that method requests. If
+        None, ``DEFAULT_TTL_RULES`` are used.
+
+    :param default:
+        TTL for URLs that don't match any rule.
+
+    """
+
+    # URL patterns for the API methods. Language, source and topic prefixes
+    # may come before the endpoint in Indicators API URLs.
+    METHOD_PATTERNS = dict(
+        get_dataset=r"/countries/[^/?]+/indicators/",
+        get_indicators=r"/indicator(/[^/?]+)?\?",
+        get_countries=r"/country(/[^/?]+)?\?",
+        get_income_levels=r"/incomelevel(/[^/?]+)?\?",
+        get_lending_types=r"/lendingtype(/[^/?]+)?\?",
+        get_regions=r"/region(/[^/?]+)?\?",
+        get_topics=r"/topic(/[^/?]+)?\?",
+        get_sources=r"/source(/[^/?]+)?\?",
+        get_instrumental=r"/climateweb/rest/v1/(country|basin)/cru/",
+        get_modelled=r"/climateweb/rest/v1/(country|basin)/"
+            r"(mavg|annualavg|manom|annualanom)/",
+        )
+
+    def __init__(self, rules=None, default=DEFAULT_TTL):
+        self.default = default
+        self._rules = []
+        for pattern, ttl in (DEFAULT_TTL_RULES if rules is None else rules):
+            self._rules.append(self._compile(pattern, ttl))
+
+    def add(self, pattern, ttl):
+        """Add a rule, which takes precedence over the existing rules."""
+        self._rules.insert(0, self._compile(pattern, ttl))
+
+    def ttl_for(self, url):
+        """Return the TTL in seconds for a URL."""
+        for regexp, ttl in self._rules:
+            if regexp.search(url):
+                return ttl
+        return self.default
+
+    def _compile(self, pattern, ttl):
+        pattern = self.METHOD_PATTERNS.get(pattern, pattern)
+        return re.compile(pattern, flags=re.IGNORECASE), ttl
+
+
+DEFAULT_TTL_RULES = [
+    # The most recent value of a dataset changes whenever new data is added.
+    (r"[?&]mrv=1(&|$)", DEFAULT_TTL / 4),
+    # Reference lists hardly ever change.
+    ("get_topics", 30 * DEFAULT_TTL),
+    ("get_sources", 30 * DEFAULT_TTL),
+    ("get_regions", 30 * DEFAULT_TTL),
+    ("get_income_levels", 30 * DEFAULT_TTL),
+    ("get_lending_types", 30 * DEFAULT_TTL),
+    # Historical CRU data is effectively immutable.
+    ("get_instrumental", 365 * DEFAULT_TTL),
+    ]
+
+DEFAULT_TTL_POLICY = TTLPolicy()
+
+
+COMPRESSIONS = (None, "zlib", "lzma")
+
+
+def compress(body, compression):
+    """Compress a bytestring with ``"zlib"``, ``"lzma"``, or None."""
+    if compression == "zlib":
+        return zlib.compress(body)
+    if compression == "lzma":
+        import lzma
+        return lzma.compress(body)
+    return body
+
+
+def decompress(data, compression):
+    """Reverse ``compress()``. Raises ``ValueError`` if the data is
+    corrupt."""
+    if compression == "zlib":
+        try:
+            return zlib.decompress(data)
+        except zlib.error as e:
+            raise ValueError("Corrupt zlib data: %s" % e)
+    if compression == "lzma":
+        import lzma
+        try:
+            return lzma.decompress(data)
+        except lzma.LZMAError as e:
+            raise ValueError("Corrupt lzma data: %s" % e)
+    return bytes(data)
+
+
+@six.add_metaclass(abc.ABCMeta)
+class BaseCache(object):
+
+    """Interface for ``fetch()`` cache backends.
+
+    :param default_ttl:
+        Seconds that entries stay fresh for, if ``set()`` isn't given a TTL.
+
+    :param max_entries:
+        Maximum number of entries to keep. None for no limit.
+
+    :param max_bytes:
+        Maximum total size of the stored entries. None for no limit.
+
+    :param compression:
+        ``"zlib"``, ``"lzma"`` or None. Entries are compressed when stored,
+        and decompressed transparently by ``get()``.
+
+    """
+
+    def __init__(self, default_ttl=DEFAULT_TTL, max_entries=None,
+            max_bytes=None, compression=None):
+        if compression not in COMPRESSIONS:
+            raise ValueError("Unknown compression %r" % compression)
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.compression = compression
+
+    @abc.abstractmethod
+    def get(self, url):
+        """Return the ``CacheEntry`` for a URL, or None if not cached.
+
+        Expired entries are still returned; it's up to the caller to check
+        ``fetched_at`` and ``ttl``.
+        """
+        raise NotImplementedError
+
+    def fetched_at(self, url):
+        """Return the fetch time of the entry for a URL, or None if not
+        cached. Backends can override this to avoid reading the body."""
+        entry = self.get(url)
+        return entry.fetched_at if entry is not None else None
+
+    @abc.abstractmethod
+    def set(self, url, body, ttl=None, fetched_at=None, etag=None,
+            last_modified=None):
+        """Store the response body (a bytestring) for a URL, along with the
+        ``ETag`` and ``Last-Modified`` response headers, if any."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def touch(self, url, fetched_at=None, etag=None, last_modified=None):
+        """Reset the fetch time of an entry, eg. after the server has
+        confirmed that it's still valid. Validators sent with that
+        confirmation replace the stored ones; any not given are kept."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete(self, url):
+        """Remove a URL from the cache, if present."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def expire(self, now=None):
+        """Remove all expired entries, and return how many were removed."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def clear(self):
+        """Remove all entries."""
+        raise NotImplementedError
+
+    def _over_budget(self, entries, size):
+        """Return how many (entries, bytes) have to be evicted."""
+        excess_entries = excess_bytes = 0
+        if self.max_entries is not None:
+            excess_entries = max(0, entries - self.max_entries)
+        if self.max_bytes is not None:
+            excess_bytes = max(0, size - self.max_bytes)
+        return excess_entries, excess_bytes
+
+
+class FileCache(BaseCache):
+
+    """Store each response in its own file, named by the MD5 of the URL.
+
+    The file modification time is used as the fetch time. An entry's TTL, if
+    it isn't ``default_ttl``, and its response validators are kept in a
+    ``<hash>.validators`` file next to the response. Both files count towards
+    ``max_bytes``.
+
+    Compressed files start with a marker line naming the compression, eg.
+    ``\x00wbpy:zlib\n``. Files without a marker are read as uncompressed, so
+    caches written by older versions still work.
+
+    Access order for LRU eviction is tracked in memory. The directory is
+    scanned once, the first time the cache is used, and ordered by file
+    access time. Other processes sharing the directory aren't seen after that
+    scan.
+
+    :param directory:
+        Where to keep the files. Defaults to ``wbpy`` in the system tempdir.
+
+    """
+
+    # A JSON response can't start with a null byte.
+    MARKER = b"\x00wbpy:"
+
+    def __init__(self, directory=None, default_ttl=DEFAULT_TTL,
+            max_entries=None, max_bytes=None, compression=None):
+        super(FileCache, self).__init__(default_ttl, max_entries, max_bytes,
+            compression)
+        self.directory = directory or DEFAULT_CACHE_DIR
+        # url hash -> file size, in least to most recently used order.
+        self._index = None
+        self._index_bytes = 0
+        self._lock = threading.RLock()
+
+    def get(self, url):
+        name = url_hash(url)
+        path = os.path.join(self.directory, name)
+        try:
+            fetched_at = os.path.getmtime(path)
+            with open(path, "rb") as f:
+                body = self._decode(f.read())
+        except (IOError, OSError):
+            return None
+        except ValueError as e:
+            logger.warning("Removing corrupt cache file %s: %s", name, e)
+            self._remove(name)
+            return None
+        with self._lock:
+            index = self._load_index()
+            if name in index:
+                index.move_to_end(name)
+        validators = self._read_validators(path)
+        return CacheEntry(url, body, fetched_at, self._ttl(validators),
+            validators.get("etag"), validators.get("last_modified"))
+
+    def fetched_at(self, url):
+        try:
+            return os.path.getmtime(os.path.join(self.directory,
+                url_hash(url)))
+        except OSError:
+            return None
+
+    def set(self, url, body, ttl=None, fetched_at=None, etag=None,
+            last_modified=None):
+        self._ensure_directory()
+        name = url_hash(url)
+        path = os.path.join(self.directory, name)
+        validators = b""
+        if etag or last_modified or ttl is not None:
+            validators = json.dumps(dict(etag=etag,
+                last_modified=last_modified, ttl=ttl)).encode("utf-8")
+            self._write(path + ".validators", validators)
+        else:
+            self._remove_file(path + ".validators")
+        stored = self._encode(body)
+        self._write(path, stored)
+        if fetched_at is not None:
+            os.utime(path, (fetched_at, fetched_at))
+        with self._lock:
+            self._index_add(name, len(stored) + len(validators))
+            self._evict()
+
+    def touch(self, url, fetched_at=None, etag=None, last_modified=None):
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        path = os.path.join(self.directory, url_hash(url))
+        try:
+            os.utime(path, (fetched_at, fetched_at))
+        except OSError:
+            return
+        if etag or last_modified:
+            validators = self._read_validators(path)
+            if etag:
+                validators["etag"] = etag
+            if last_modified:
+                validators["last_modified"] = last_modified
+            validators = json.dumps(validators).encode("utf-8")
+            self._write(path + ".validators", validators)
+            try:
+                size = os.path.getsize(path) + len(validators)
+            except OSError:
+                return
+            with self._lock:
+                self._index_add(os.path.basename(path), size)
+                self._evict()
+
+    def delete(self, url):
+        self._remove(url_hash(url))
+
+    def expire(self, now=None):
+        now = time.time() if now is None else now
+        removed = 0
+        for path in self._paths():
+            try:
+                age = now - os.path.getmtime(path)
+            except OSError:
+                continue
+            expired = age >= self._ttl(self._read_validators(path))
+            if expired:
+                self._remove(os.path.basename(path))
+                removed += 1
+        return removed
+
+    def clear(self):
+        for path in self._paths():
+            self._remove(os.path.basename(path))
+
+    def _remove(self, name):
+        path = os.path.join(self.directory, name)
+        self._remove_file(path)
+        self._remove_file(path + ".validators")
+        with self._lock:
+            self._index_remove(name)
+
+    def _encode(self, body):
+        if self.compression is None:
+            return body
+        marker = self.MARKER + self.compression.encode("ascii") + b"\n"
+        return marker + compress(body, self.compression)
+
+    def _decode(self, data):
+        if not data.startswith(self.MARKER):
+            return data
+        marker, _, payload = data.partition(b"\n")
+        compression = marker[len(self.MARKER):].decode("ascii")
+        return decompress(payload, compression)
+
+    def _write(self, path, data):
+        fd, tempname = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.rename(tempname, path)
+
+    def _ttl(self, validators):
+        ttl = validators.get("ttl")
+        return self.default_ttl if ttl is None else ttl
+
+    @staticmethod
+    def _read_validators(path):
+        try:
+            with open(path + ".validators", "rb") as f:
+                return json.loads(f.read().decode("utf-8"))
+        except (IOError, OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _index_add(self, name, size):
+        """Record an entry's total size, body and sidecar, as most recently
+        used."""
+        self._index_remove(name)
+        self._load_index()[name] = size
+        self._index_bytes += size
+
+    def _index_remove(self, name):
+        size = self._load_index().pop(name, None)
+        if size is not None:
+            self._index_bytes -= size
+
+    def _load_index(self):
+        if self._index is None:
+            stats = []
+            for path in self._paths():
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                try:
+                    sidecar_size = os.path.getsize(path + ".validators")
+                except OSError:
+                    sidecar_size = 0
+                stats.append((st.st_atime, os.path.basename(path),
+                    st.st_size + sidecar_size))
+            stats.sort()
+            self._index = collections.OrderedDict(
+                (name, size) for _, name, size in stats)
+            self._index_bytes = sum(self._index.values())
+        return self._index
+
+    def _evict(self):
+        index = self._load_index()
+        excess_entries, excess_bytes = self._over_budget(len(index),
+            self._index_bytes)
+        while index and (excess_entries > 0 or excess_bytes > 0):
+            name = next(iter(index))
+            excess_entries -= 1
+            excess_bytes -= index[name]
+            logger.debug("Evicting cache file %s", name)
+            self._remove(name)
+
+    def _paths(self):
+        if not os.path.isdir(self.directory):
+            return []
+        # Only the 32-character hash names are cache entries.
+        return [os.path.join(self.directory, name) for name in
+            os.listdir(self.directory) if len(name) == 32 and "." not in name]
+
+    def _ensure_directory(self):
+        if not os.path.exists(self.directory):
+            try:
+                os.makedirs(self.directory)
+                logger.debug("Created cache directory " + self.directory)
+            except OSError:
+                # Another process may have just created it.
+                if not os.path.isdir(self.directory):
+                    raise
+
+
+class SQLiteCache(BaseCache):
+
+    """Store all responses in a single SQLite database file.
+
+    Bodies are zlib-compressed by default, and the ``encoding`` column
+    records how each one was stored. The table is indexed by URL, expiry time and
+    last access time, so lookups, ``expire()``, ``delete_prefix()`` and LRU
+    eviction don't need to scan every entry. The entry count and total size
+    are kept up to date by triggers.
+
+    :param path:
+        Path of the database file. Defaults to ``wbpy/cache.sqlite3`` in the
+        system tempdir.
+
+    """
+
+    # Bump this when the schema changes. Older cache files are then dropped
+    # and recreated, rather than migrated.
+    SCHEMA_VERSION = 3
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS responses (
+            url TEXT PRIMARY KEY,
+            body BLOB NOT NULL,
+            encoding TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            fetched_at REAL NOT NULL,
+            ttl REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            etag TEXT,
+            last_modified TEXT
+        )""",
+        """CREATE INDEX IF NOT EXISTS responses_expires_at
+            ON responses (expires_at)""",
+        """CREATE INDEX IF NOT EXISTS responses_accessed_at
+            ON responses (accessed_at)""",
+        """CREATE TABLE IF NOT EXISTS totals (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            entries INTEGER NOT NULL,
+            bytes INTEGER NOT NULL
+        )""",
+        "INSERT OR IGNORE INTO totals (id, entries, bytes) VALUES (0, 0, 0)",
+        """CREATE TRIGGER IF NOT EXISTS responses_insert
+            AFTER INSERT ON responses BEGIN
+                UPDATE totals SET entries = entries + 1,
+                    bytes = bytes + NEW.size;
+            END""",
+        """CREATE TRIGGER IF NOT EXISTS responses_delete
+            AFTER DELETE ON responses BEGIN
+                UPDATE totals SET entries = entries - 1,
+                    bytes = bytes - OLD.size;
+            END""",
+        ]
+
+    def __init__(self, path=None, default_ttl=DEFAULT_TTL, max_entries=None,
+            max_bytes=None, compression="zlib"):
+        super(SQLiteCache, self).__init__(default_ttl, max_entries, max_bytes,
+            compression)
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "cache.sqlite3")
+        self._conn = None
+        self._lock = threading.RLock()
+
+    def get(self, url):
+        rows = self._query(
+            "SELECT body, encoding, fetched_at, ttl, etag, last_modified "
+            "FROM responses WHERE url = ?", (url,))
+        if not rows:
+            return None
+        self._execute("UPDATE responses SET accessed_at = ? WHERE url = ?",
+            (time.time(), url))
+        body, encoding, fetched_at, ttl, etag, last_modified = rows[0]
+        try:
+            body = self._decode(body, encoding)
+        except ValueError as e:
+            logger.warning("Removing corrupt cache entry for %s: %s", url, e)
+            self.delete(url)
+            return None
+        return CacheEntry(url, body, fetched_at, ttl, etag, last_modified)
+
+    def fetched_at(self, url):
+        rows = self._query("SELECT fetched_at FROM responses WHERE url = ?",
+            (url,))
+        return rows[0][0] if rows else None
+
+    def set(self, url, body, ttl=None, fetched_at=None, etag=None,
+            last_modified=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        stored = compress(body, self.compression)
+        with self._lock:
+            self._execute(
+                "INSERT OR REPLACE INTO responses (url, body, encoding, "
+                "size, fetched_at, ttl, expires_at, accessed_at, etag, "
+                "last_modified) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, sqlite3.Binary(stored), self.compression or "identity",
+                    len(stored), fetched_at, ttl, fetched_at + ttl,
+                    time.time(), etag, last_modified))
+            self._evict()
+
+    def touch(self, url, fetched_at=None, etag=None, last_modified=None):
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        self._execute(
+            "UPDATE responses SET fetched_at = ?, expires_at = ? + ttl, "
+            "accessed_at = ?, etag = COALESCE(?, etag), "
+            "last_modified = COALESCE(?, last_modified) WHERE url = ?",
+            (fetched_at, fetched_at, time.time(), etag or None,
+                last_modified or None, url))
+
+    def delete(self, url):
+        self._execute("DELETE FROM responses WHERE url = ?", (url,))
+
+    def delete_prefix(self, prefix):
+        """Remove all entries whose URL starts with ``prefix``, and return how
+        many were removed."""
+        if not prefix:
+            return self._execute("DELETE FROM responses")
+        # A range comparison (rather than LIKE) can use the primary key index.
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return self._execute(
+            "DELETE FROM responses WHERE url >= ? AND url < ?",
+            (prefix, upper))
+
+    def expire(self, now=None):
+        now = time.time() if now is None else now
+        return self._execute("DELETE FROM responses WHERE expires_at <= ?",
+            (now,))
+
+    def clear(self):
+        self._execute("DELETE FROM responses")
+
+    def totals(self):
+        """Return (number of entries, total stored bytes)."""
+        return tuple(self._query("SELECT entries, bytes FROM totals")[0])
+
+    def _evict(self):
+        excess_entries, excess_bytes = self._over_budget(*self.totals())
+        if excess_entries <= 0 and excess_bytes <= 0:
+            return
+        victims = []
+        with self._lock:
+            cursor = self._connection().execute(
+                "SELECT url, size FROM responses ORDER BY accessed_at")
+            for url, size in cursor:
+                if excess_entries <= 0 and excess_bytes <= 0:
+                    break
+                victims.append((url,))
+                excess_entries -= 1
+                excess_bytes -= size
+            cursor.close()
+            logger.debug("Evicting %d cache entries", len(victims))
+            self._connection().executemany(
+                "DELETE FROM responses WHERE url = ?", victims)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @staticmethod
+    def _decode(body, encoding):
+        return decompress(body, None if encoding == "identity" else encoding)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def _execute(self, sql, params=()):
+        """Run a statement, and return the number of rows it changed."""
+        with self._lock:
+            return self._connection().execute(sql, params).rowcount
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            # Autocommit mode; each statement is its own transaction.
+            conn = sqlite3.connect(self.path, timeout=30,
+                isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Make INSERT OR REPLACE fire the delete trigger for the old row.
+            conn.execute("PRAGMA recursive_triggers=ON")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != self.SCHEMA_VERSION:
+                conn.execute("DROP TABLE IF EXISTS responses")
+                conn.execute("DROP TABLE IF EXISTS totals")
+                conn.execute("PRAGMA user_version = %d" % self.SCHEMA_VERSION)
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+
+class MemoryCache(object):
+
+    """Bounded in-process LRU cache of decoded responses.
+
+    It sits in front of the disk cache, so repeated requests for the same
+    URL in one process skip reading and decoding the cached file. ``fetch()``
+    keys entries by the URL, the cache backend and the URL's TTL, so fetchers
+    with different backends or TTL policies don't share entries.
+
+    :param ttl:
+        Maximum number of seconds that entries stay in memory for. An entry
+        also expires when its response would be stale in the backend.
+
+    :param max_entries:
+        Maximum number of responses to hold.
+
+    :param max_bytes:
+        Maximum total size in memory of the held response text, as given by
+        ``sys.getsizeof()``. Parsed JSON isn't counted.
+
+    :param parse_json:
+        If True, ``fetch_json()`` also keeps the parsed response, so later
+        calls skip ``json.loads``. The same object is then returned to every
+        caller, so it must not be modified.
+
+    """
+
+    def __init__(self, ttl=300, max_entries=256, max_bytes=64 * 1024 * 1024,
+            parse_json=False):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.parse_json = parse_json
+        # key -> [expires_at, text, parsed JSON or None, size of text]
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the response text for a key, or None."""
+        entry = self._get_entry(key)
+        return entry[1] if entry else None
+
+    def get_json(self, key):
+        """Return the parsed response for a key, or None."""
+        entry = self._get_entry(key)
+        return entry[2] if entry else None
+
+    def set(self, key, text, expires_at=None):
+        """Hold the response text for a key, until ``ttl`` seconds from now
+        or ``expires_at`` (a timestamp), whichever is sooner."""
+        expires_at = min(time.time() + self.ttl,
+            float("inf") if expires_at is None else expires_at)
+        # Non-ASCII text takes up to 4 bytes per character.
+        size = sys.getsizeof(text)
+        if size > self.max_bytes or expires_at <= time.time():
+            return
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = [expires_at, text, None, size]
+            self._bytes += size
+            while (len(self._entries) > self.max_entries or
+                    self._bytes > self.max_bytes):
+                self._pop(next(iter(self._entries)))
+
+    def set_json(self, key, parsed):
+        """Attach the parsed response to an existing entry."""
+        if not self.parse_json:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[2] = parsed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _get_entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() >= entry[0]:
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[3]
+
+
+MEMORY_CACHE = MemoryCache()
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """Return the cache that ``fetch()`` uses when none is given."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SQLiteCache(max_bytes=DEFAULT_MAX_BYTES)
+        return _default_cache
@@ -1,16 +1,40 @@
 # -*- coding: utf-8 -*-
 import re
 import datetime
-import pprint
 import json
 import itertools
 
-import pycountry
 import six
 
 from . import utils
 
 
+def _frame(pd, labels, index, values, wide):
+    """Build a DataFrame with one row per value.
+
+    :param labels:
+        List of ``(name, codes)`` pairs, giving a categorical column with a
+        code for each row, eg. the region codes.
+
+    :param index:
+        Index with an entry for each row.
+
+    :param wide:
+        Unstack the label columns, to give one column of values per label.
+
+    """
+    columns = dict((name, pd.Categorical(codes, categories=sorted(set(codes))))
+        for name, codes in labels)
+    columns["value"] = pd.array(values, dtype="float64")
+    frame = pd.DataFrame(columns, index=index)
+
+    names = [name for name, _ in labels]
+    frame = frame.sort_index(kind="stable").sort_values(names, kind="stable")
+    if wide:
+        frame = frame.set_index(names, append=True)["value"].unstack(names)
+    return frame
+
+
 class ClimateDataset(object):
 
     def __init__(self, api_calls, data_type, data_interval, call_date):
@@ -36,19 +60,9 @@ class ClimateDataset(object):
 
         for resp in self.api_calls:
             region = str(resp["url"].split("/")[-1])
-            try:
-                code = utils.convert_country_code(region.upper(), "alpha2")
-                # This is a bit ugly. It's because of two breaking changes in
-                # old pycountry versions - one to raise a KeyError instead of
-                # returning None, and one to replace alpha2 with alpha_2.
-                try:
-                    country = pycountry.countries.get(alpha_2=code)
-                except KeyError:
-                    country = pycountry.countries.get(alpha2=code)
-                if country is None:
-                    raise KeyError
-                val = country.name
-            except KeyError:  # If not country code, assume it's a basin
+            code = utils.convert_country_code(region, "alpha2")
+            val = utils.COUNTRY_CODES.iso_names.get(code)
+            if val is None:  # If not country code, assume it's a basin
                 code = region
                 val = "http://data.worldbank.org/sites/default/files"
                 "/climate_data_api_basins.pdf"
@@ -65,6 +79,7 @@ class ClimateDataset(object):
             )
 
     def __str__(self):
+        import pprint
         return pprint.pformat(self.as_dict())
 
 
@@ -118,6 +133,37 @@ class InstrumentalDataset(ClimateDataset):
                     this_region[key] = float(row["data"])
         return results
 
+    def to_frame(self, wide=False, period=False):
+        """Return dataset data as a pandas DataFrame. Requires pandas.
+
+        :param wide:
+            If False, return one row per value, with ``region`` (categorical)
+            and ``value`` columns, sorted by region. If True, return a table
+            with one column of values per region.
+
+        :param period:
+            Index by a yearly PeriodIndex, rather than a DatetimeIndex.
+            Monthly datasets are always indexed by month number (1-12).
+
+        """
+        pd = utils.import_optional("pandas", "pandas")
+        regions, keys, values = [], [], []
+        for call in self.api_calls:
+            region_code = call["region"][0]
+            for row in call["resp"]:
+                regions.append(region_code)
+                if self.interval == "month":
+                    keys.append(int(row["month"]) + 1)
+                else:
+                    keys.append(str(row["year"]))
+                values.append(row["data"])
+
+        if self.interval == "month":
+            index = pd.Index(keys, name="month")
+        else:
+            index = utils.date_index(pd, keys, period)
+        return _frame(pd, [("region", regions)], index, values, wide)
+
 
 class ModelledDataset(ClimateDataset):
 
@@ -179,6 +225,191 @@ class ModelledDataset(ClimateDataset):
 
         """
         results = {}
+        for gcm_key, region_code, year, val in self._iter_rows(sres):
+            if use_datetime:
+                year = utils.worldbank_date_to_datetime(year)
+            results.setdefault(gcm_key, {}).setdefault(region_code, {})[
+                year] = val
+        return results
+
+    def to_frame(self, sres="a2", wide=False, period=False):
+        """Return dataset data as a pandas DataFrame. Requires pandas.
+
+        The index is the end year of each period. Monthly datasets have an
+        extra ``month`` index level (1-12).
+
+        :param sres:
+            Which SRES to use for future values, as for ``as_dict()``.
+
+        :param wide:
+            If False, return one row per value, with ``gcm`` and ``region``
+            (categorical) and ``value`` columns, sorted by GCM and region. If
+            True, return a table with one column of values per (gcm, region)
+            pair.
+
+        :param period:
+            Index by a yearly PeriodIndex, rather than a DatetimeIndex.
+
+        """
+        pd = utils.import_optional("pandas", "pandas")
+        gcms, regions, years, months, values = [], [], [], [], []
+        for gcm_key, region_code, year, val in self._iter_rows(sres):
+            if not isinstance(val, list):
+                val = [val]
+            for month, month_val in enumerate(val, 1):
+                gcms.append(gcm_key)
+                regions.append(region_code)
+                years.append(year)
+                months.append(month)
+                values.append(month_val)
+
+        index = utils.date_index(pd, years, period)
+        if "annual" not in self._interval_arg:
+            index = pd.MultiIndex.from_arrays([index, pd.Index(months,
+                name="month")])
+        return _frame(pd, [("gcm", gcms), ("region", regions)], index,
+            values, wide)
+
+    def to_arrow(self):
+        """Return all of the dataset's values as a pyarrow Table. Requires
+        pyarrow.
+
+        The table has one row per value, with ``gcm``, ``region``, ``period``
+        (eg. ``2020/2039``) and ``sres`` dictionary columns, a ``month``
+        column (1-12 for monthly data, otherwise null) and a float64
+        ``value`` column. Values for both SRES scenarios are included. The
+        dataset's metadata is kept in the schema metadata, so
+        ``from_arrow()`` can rebuild the dataset.
+
+        """
+        pa = utils.import_optional("pyarrow", "arrow")
+        gcms, regions, periods, scenarios, months, values = \
+            [], [], [], [], [], []
+        for call in self.api_calls:
+            region_code = call["region"][0]
+            for row in call["resp"]:
+                if "percentile" in row:
+                    gcm_key = "ensemble_%d" % row["percentile"]
+                else:
+                    gcm_key = row["gcm"]
+                period = "%s/%s" % (row["fromYear"], row["toYear"])
+                if "monthVals" in row:
+                    row_values = row["monthVals"]
+                    row_months = range(1, len(row_values) + 1)
+                else:
+                    row_values = row.get("annualData", row.get("annualVal"))
+                    row_months = [None]
+                for month, value in zip(row_months, row_values):
+                    gcms.append(gcm_key)
+                    regions.append(region_code)
+                    periods.append(period)
+                    scenarios.append(row.get("scenario"))
+                    months.append(month)
+                    values.append(value)
+
+        metadata = dict(
+            data_type=self._data_type_arg,
+            interval=self._interval_arg,
+            call_date=(self.api_call_date.isoformat() if
+                self.api_call_date else None),
+            calls=[[call["url"], call["region"][0]] for call in
+                self.api_calls],
+            )
+        table = pa.table([
+            pa.array(gcms, pa.string()).dictionary_encode(),
+            pa.array(regions, pa.string()).dictionary_encode(),
+            pa.array(periods, pa.string()).dictionary_encode(),
+            pa.array(scenarios, pa.string()).dictionary_encode(),
+            pa.array(months, pa.int8()),
+            pa.array(values, pa.float64()),
+            ], names=["gcm", "region", "period", "sres", "month", "value"])
+        return table.replace_schema_metadata({"wbpy": json.dumps(metadata)})
+
+    def to_parquet(self, path, **kwargs):
+        """Write the dataset to a Parquet file, in the ``to_arrow()`` format.
+        Requires pyarrow.
+
+        :param path:
+            File path or writable file object.
+
+        :param kwargs:
+            Passed to ``pyarrow.parquet.write_table()``, eg. ``compression``.
+
+        """
+        pq = utils.import_optional("pyarrow.parquet", "arrow")
+        pq.write_table(self.to_arrow(), path, **kwargs)
+
+    @classmethod
+    def from_arrow(cls, table):
+        """Return a dataset from a pyarrow Table in the ``to_arrow()``
+        format. Requires pyarrow.
+
+        """
+        utils.import_optional("pyarrow", "arrow")
+        metadata = json.loads(table.schema.metadata[b"wbpy"])
+
+        # Rows are matched back to their API call by region, period and
+        # whether they're ensemble values.
+        api_calls = []
+        calls_by_key = {}
+        for url, region_code in metadata["calls"]:
+            call = dict(url=url, resp=[])
+            api_calls.append(call)
+            period = re.findall(r"\d+/\d+", url)[0]
+            calls_by_key[(region_code, period, "ensemble" in url)] = call
+
+        annual = "annual" in metadata["interval"]
+        rows = zip(*[table.column(name).to_pylist() for name in
+            ["gcm", "region", "period", "sres", "month", "value"]])
+        resp_row = None
+        for gcm_key, region_code, period, sres, month, value in rows:
+            if month is not None and month > 1:
+                resp_row["monthVals"].append(value)
+                continue
+
+            ensemble = gcm_key.startswith("ensemble")
+            from_year, to_year = period.split("/")
+            resp_row = dict(fromYear=int(from_year), toYear=int(to_year))
+            if ensemble:
+                resp_row["percentile"] = int(gcm_key.split("_")[-1])
+            else:
+                resp_row["gcm"] = gcm_key
+                resp_row["variable"] = metadata["data_type"]
+            if sres is not None:
+                resp_row["scenario"] = sres
+            if not annual:
+                resp_row["monthVals"] = [value]
+            elif ensemble:
+                resp_row["annualVal"] = [value]
+            else:
+                resp_row["annualData"] = [value]
+            calls_by_key[(region_code, period, ensemble)]["resp"].append(
+                resp_row)
+
+        call_date = metadata["call_date"]
+        if call_date:
+            call_date = datetime.datetime.strptime(call_date,
+                "%Y-%m-%d").date()
+        return cls(api_calls, metadata["data_type"], metadata["interval"],
+            call_date)
+
+    @classmethod
+    def from_parquet(cls, path, **kwargs):
+        """Return a dataset from a Parquet file written by ``to_parquet()``.
+        Requires pyarrow.
+
+        :param kwargs:
+            Passed to ``pyarrow.parquet.read_table()``.
+
+        """
+        pq = utils.import_optional("pyarrow.parquet", "arrow")
+        return cls.from_arrow(pq.read_table(path, **kwargs))
+
+    def _iter_rows(self, sres):
+        """Yield ``(gcm, region, year, value)`` for each value in the
+        dataset, where ``value`` is a float, or a list of 12 floats for
+        monthly data."""
+        seen = set()
         for call in self.api_calls:
             if "ensemble" in call["url"]:
                 get_gcm_key = lambda row: "ensemble_%d" % row["percentile"]
@@ -198,26 +429,17 @@ class ModelledDataset(ClimateDataset):
                     continue
 
                 gcm_key = get_gcm_key(row)
-                if gcm_key not in results:
-                    results[gcm_key] = {}
-
-                if region_code not in results[gcm_key]:
-                    results[gcm_key][region_code] = {}
-                region_dict = results[gcm_key][region_code]
-
                 year = str(row["toYear"])
-                if use_datetime:
-                    year = utils.worldbank_date_to_datetime(year)
-
-                if year not in region_dict:
-                    if "annual" in call["url"]:
-                        val = float(row[annual_data_key][0])
-                    else:
-                        # Assume they are monthly values
-                        val = row["monthVals"]
-                    region_dict[year] = val
+                if (gcm_key, region_code, year) in seen:
+                    continue
+                seen.add((gcm_key, region_code, year))
 
-        return results
+                if "annual" in call["url"]:
+                    val = float(row[annual_data_key][0])
+                else:
+                    # Assume they are monthly values
+                    val = row["monthVals"]
+                yield gcm_key, region_code, year, val
 
 
 class ClimateAPI(object):
@@ -226,6 +448,19 @@ class ClimateAPI(object):
 
     You can override the default tempfile cache by passing a function
     ``fetch``, which requests a URL and returns the response as a string.
+
+    The URLs for a dataset are requested using up to ``max_workers`` threads.
+    ``api_calls`` on the returned dataset is always in the same order,
+    regardless of which requests finish first.
+
+    The default fetcher keeps HTTP connections alive and reuses them for
+    every request made by this instance. ``api.fetch.pool.stats`` has the
+    counts of new and reused connections.
+
+    With ``offline=True``, the default fetcher only returns cached responses
+    (however old), and raises ``wbpy.cache.CacheMissError`` for URLs that
+    aren't cached. Setting the ``WBPY_OFFLINE`` environment variable does the
+    same for every instance.
     """
 
     _gcm = dict(
@@ -328,8 +563,10 @@ class ClimateAPI(object):
 
     BASE_URL = "http://climatedataapi.worldbank.org/climateweb/rest/"
 
-    def __init__(self, fetch=None):
-        self.fetch = fetch if fetch else utils.fetch
+    def __init__(self, fetch=None, max_workers=utils.DEFAULT_MAX_WORKERS,
+            offline=None):
+        self.fetch = fetch if fetch else utils.Fetcher(offline=offline)
+        self.max_workers = max_workers
 
     @staticmethod
     def _clean_api_code(code):
@@ -350,35 +587,13 @@ class ClimateAPI(object):
             country codes, or basin ID numbers.
 
         """
-        data_type = self._clean_api_code(data_type)
-        interval = self._clean_api_code(interval)
-
-        assert data_type in self.ARG_DEFINITIONS["instrumental_types"]
-        assert interval in self.ARG_DEFINITIONS["instrumental_intervals"]
-
-        # Construct URLs
-        urls = []
-        for loc in locations:
-            try:
-                int(loc)
-                loc_type = "basin"
-            except ValueError:
-                loc = utils.convert_country_code(loc, "alpha3")
-                loc_type = "country"
-
-            data_url = "v1/{0}/cru/{1}/{2}/{3}".format(loc_type, data_type,
-                interval, str(loc))
-            full_url = "".join([self.BASE_URL, data_url])
-            urls.append((loc, full_url))
+        data_type, interval = self._clean_instrumental_args(data_type,
+            interval)
+        urls = self._instrumental_urls(data_type, interval, locations)
 
         # If no exception from URL construction, make requests
-        api_calls = []
-        for loc, url in urls:
-            resp = json.loads(self.fetch(url))
-            api_calls.append(dict(
-                url=url,
-                resp=resp,
-                ))
+        resps = self._fetch_all_json(urls)
+        api_calls = self._api_calls(urls, resps)
 
         call_date = datetime.datetime.now().date()
         return InstrumentalDataset(api_calls, data_interval=interval,
@@ -400,12 +615,55 @@ class ClimateAPI(object):
             country codes, or basin ID numbers.
 
         """
+        data_type, interval = self._clean_modelled_args(data_type, interval)
+        urls = self._modelled_urls(data_type, interval, locations)
+
+        resps = self._fetch_all_json(urls)
+        api_calls = self._api_calls(urls, resps)
+
+        call_date = datetime.datetime.now().date()
+        return ModelledDataset(api_calls, data_interval=interval,
+            data_type=data_type, call_date=call_date)
+
+    def _clean_instrumental_args(self, data_type, interval):
+        data_type = self._clean_api_code(data_type)
+        interval = self._clean_api_code(interval)
+
+        assert data_type in self.ARG_DEFINITIONS["instrumental_types"]
+        assert interval in self.ARG_DEFINITIONS["instrumental_intervals"]
+        return data_type, interval
+
+    def _clean_modelled_args(self, data_type, interval):
         data_type = self._clean_api_code(data_type)
         interval = self._clean_api_code(interval)
 
         assert data_type in self.ARG_DEFINITIONS["modelled_types"]
         assert interval in self.ARG_DEFINITIONS["modelled_intervals"]
+        return data_type, interval
+
+    @staticmethod
+    def _location_type(loc):
+        """Return (loc_type, loc) for a location argument, converting country
+        codes to alpha-3.
+        """
+        try:
+            int(loc)  # basin ids are ints
+            return "basin", loc
+        except ValueError:
+            return "country", utils.convert_country_code(loc, "alpha3")
+
+    def _instrumental_urls(self, data_type, interval, locations):
+        """Return the API URLs for a ``get_instrumental()`` call."""
+        urls = []
+        for loc in locations:
+            loc_type, loc = self._location_type(loc)
+            data_url = "v1/{0}/cru/{1}/{2}/{3}".format(loc_type, data_type,
+                interval, str(loc))
+            urls.append("".join([self.BASE_URL, data_url]))
+        return urls
 
+    def _modelled_urls(self, data_type, interval, locations):
+        """Return the API URLs for a ``get_modelled()`` call."""
         # As there aren't many variants of each data type, it's simplest to
         # always call both GCM and ensemble data, for all dates, and not offer
         # any filtering options.
@@ -420,28 +678,24 @@ class ClimateAPI(object):
             all_urls = ["v1/{0}/{1}/ensemble/{2}/{3}/{4}/{5}"]
             all_dates = self._valid_stat_dates
 
-        api_calls = []
+        urls = []
         for loc in locations:
-            try:
-                int(loc)  # basin ids are ints
-                loc_type = "basin"
-            except ValueError:
-                loc = utils.convert_country_code(loc, "alpha3")
-                loc_type = "country"
-
+            loc_type, loc = self._location_type(loc)
             for dates, url in itertools.product(all_dates, all_urls):
                 start_date = dates[0]
                 end_date = dates[1]
                 rest_url = url.format(loc_type, interval, data_type,
                     start_date, end_date, loc)
-                full_url = "".join([self.BASE_URL, rest_url])
+                urls.append("".join([self.BASE_URL, rest_url]))
+        return urls
 
-                resp = json.loads(self.fetch(full_url))
-                api_calls.append(dict(
-                    url=full_url,
-                    resp=resp,
-                    ))
+    def _fetch_json(self, url):
+        return utils.load_json(self.fetch, url)
 
-        call_date = datetime.datetime.now().date()
-        return ModelledDataset(api_calls, data_interval=interval,
-            data_type=data_type, call_date=call_date)
+    def _fetch_all_json(self, urls):
+        return utils.map_concurrently(self._fetch_json, urls,
+            self.max_workers)
+
+    @staticmethod
+    def _api_calls(urls, resps):
+        return [dict(url=url, resp=resp) for url, resp in zip(urls, resps)]
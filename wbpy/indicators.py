@@ -1,39 +1,333 @@
 # -*- coding: utf-8 -*-
 import re
 import datetime
-import pprint
+import functools
+import itertools
+import json
+from array import array
 from six.moves.urllib.parse import urlencode
-try:
-    import simplejson as json
-except ImportError:
-    import json
 
 from . import utils
 
 
+class _NonStandardRegions(object):
+
+    """Class attribute for the non-ISO region codes, which are only read from
+    disk when it's first accessed."""
+
+    def __get__(self, instance, owner):
+        return utils.non_standard_regions()
+
+
+def _is_empty_response(header):
+    """Return True if a response header is for a response without any rows
+    (eg. for countries with no data), rather than for an error message."""
+    return header.get("pages") == 0 and not header.get("message")
+
+
+def _sorted_codes(np, labels, codes):
+    """Sort ``labels``, and remap ``codes`` (indexes into ``labels``) to
+    indexes into the sorted labels."""
+    order = np.argsort(labels, kind="stable")
+    positions = np.empty(len(order), dtype=np.intp)
+    positions[order] = np.arange(len(order))
+    return labels[order], positions[codes]
+
+
+def _dictionary_column(table, name):
+    """Return a table column as a single DictionaryArray."""
+    column = table.column(name).combine_chunks()
+    if not hasattr(column, "indices"):
+        column = column.dictionary_encode()
+    return column
+
+
+class _IndicatorColumns(object):
+
+    """Columnar store of the rows of an indicator response.
+
+    Each observation is held in three parallel arrays: the index of its
+    country in ``country_ids``, the index of its date in ``dates``, and its
+    float value, with missing values stored as NaN. Countries and dates are
+    in order of first appearance.
+
+    The sorted dates, and the dates converted to datetime.date(), are worked
+    out once when first needed.
+    """
+
+    def __init__(self):
+        self.country_ids = []
+        self.country_names = []
+        self.dates = []
+        self.country_idx = array("i")
+        self.date_idx = array("i")
+        self.values = array("d")
+        self._country_index = {}
+        self._date_index = {}
+        # Series key -> bytearray with a flag for each date index that has a
+        # stored value. Columns loaded from arrays only build this if rows
+        # are added to them.
+        self._seen = {}
+        self._sorted_dates = None
+        self._datetimes = []
+        self._sorted_datetimes = None
+
+    @classmethod
+    def from_rows(cls, rows):
+        columns = cls()
+        for row in rows:
+            columns.add_row(row)
+        return columns
+
+    @classmethod
+    def from_arrays(cls, country_ids, country_names, dates, country_idx,
+            date_idx, values):
+        """Build the columns from existing labels, and NumPy arrays of
+        codes and values. Each array is copied into its column as a single
+        block, rather than row by row."""
+        columns = cls()
+        columns.country_ids = list(country_ids)
+        columns.country_names = list(country_names)
+        columns.dates = list(dates)
+        columns.country_idx.frombytes(country_idx.astype("intc").tobytes())
+        columns.date_idx.frombytes(date_idx.astype("intc").tobytes())
+        columns.values.frombytes(values.astype("float64").tobytes())
+        columns._country_index = dict((country, i) for i, country in
+            enumerate(columns.country_ids))
+        columns._date_index = dict((date, i) for i, date in
+            enumerate(columns.dates))
+        columns._seen = None
+        return columns
+
+    def add_row(self, row):
+        country = row["country"]
+        ci = self._country_index.get(country["id"])
+        if ci is None:
+            ci = self._country_index[country["id"]] = len(self.country_ids)
+            self.country_ids.append(country["id"])
+            self.country_names.append(country["value"])
+
+        date = row["date"]
+        di = self._date_index.get(date)
+        if di is None:
+            di = self._date_index[date] = len(self.dates)
+            self.dates.append(date)
+            self._sorted_dates = self._sorted_datetimes = None
+
+        # Only the first value for a country and date is used.
+        if self._seen is None:
+            self._seen = {}
+            for series, stored_di in self._keys():
+                self._mark_seen(series, stored_di)
+        if not self._mark_seen(self._series_key(row, ci), di):
+            return False
+
+        self.country_idx.append(ci)
+        self.date_idx.append(di)
+        # Sometimes values are missing
+        value = row["value"]
+        self.values.append(float(value) if value else float("nan"))
+        return True
+
+    def _series_key(self, row, ci):
+        """Return the key of the series that a row's value belongs to. Only
+        the first value for each series and date is kept."""
+        return ci
+
+    def _keys(self):
+        """Return the ``(series key, date index)`` of the stored values."""
+        return zip(self.country_idx, self.date_idx)
+
+    def _mark_seen(self, series, di):
+        """Flag a series as having a value for a date index. Returns False if
+        it already had one."""
+        flags = self._seen.get(series)
+        if flags is None:
+            flags = self._seen[series] = bytearray()
+        if di >= len(flags):
+            flags.extend(bytearray(di + 1 - len(flags)))
+        elif flags[di]:
+            return False
+        flags[di] = 1
+        return True
+
+    def to_arrays(self, np, use_datetime=False):
+        """Return ``(countries, country_codes, dates, date_codes, values)``
+        NumPy arrays, where the labels are sorted and the codes give each
+        value's position in them."""
+        countries, country_codes = _sorted_codes(np,
+            np.array(self.country_ids),
+            np.frombuffer(self.country_idx, dtype=np.intc))
+        if use_datetime:
+            dates = np.array(self.datetimes(), dtype="datetime64[D]")
+        else:
+            dates = np.array(self.dates)
+        dates, date_codes = _sorted_codes(np, dates,
+            np.frombuffer(self.date_idx, dtype=np.intc))
+        values = np.frombuffer(self.values, dtype=np.float64).copy()
+        return countries, country_codes, dates, date_codes, values
+
+    def to_rows(self, indicator):
+        """Return rows in the format of the API response, for ``indicator``
+        (a dict with the indicator's ``id`` and ``value``)."""
+        rows = []
+        for ci, di, value in zip(self.country_idx, self.date_idx,
+                self.values):
+            rows.append(dict(
+                indicator=indicator,
+                country=dict(id=self.country_ids[ci],
+                    value=self.country_names[ci]),
+                date=self.dates[di],
+                value=None if value != value else value,
+                ))
+        return rows
+
+    def sorted_dates(self):
+        if self._sorted_dates is None:
+            self._sorted_dates = sorted(self.dates)
+        return self._sorted_dates
+
+    def datetimes(self):
+        """Return ``dates`` converted to datetime.date() objects."""
+        # Each distinct date string is only converted once.
+        for date in self.dates[len(self._datetimes):]:
+            self._datetimes.append(utils.worldbank_date_to_datetime(date))
+        return self._datetimes
+
+    def sorted_datetimes(self):
+        if self._sorted_datetimes is None:
+            self._sorted_datetimes = sorted(self.datetimes())
+        return self._sorted_datetimes
+
+
+class _PanelColumns(_IndicatorColumns):
+
+    """Columnar store of the rows of several indicators' responses.
+
+    All the indicators share one country and date index. Each observation also
+    has the index of its indicator in ``indicator_ids``, in a fourth parallel
+    array.
+    """
+
+    def __init__(self):
+        super(_PanelColumns, self).__init__()
+        self.indicator_ids = []
+        self.indicator_names = []
+        self.indicator_idx = array("i")
+        self._indicator_index = {}
+
+    def add_row(self, row):
+        if super(_PanelColumns, self).add_row(row):
+            self.indicator_idx.append(
+                self._indicator_index[row["indicator"]["id"]])
+            return True
+        return False
+
+    def _series_key(self, row, ci):
+        indicator = row["indicator"]
+        ii = self._indicator_index.get(indicator["id"])
+        if ii is None:
+            ii = self._indicator_index[indicator["id"]] = len(
+                self.indicator_ids)
+            self.indicator_ids.append(indicator["id"])
+            self.indicator_names.append(indicator["value"])
+        # One int rather than a tuple, as there's a key per series.
+        return ii << 32 | ci
+
+    def _keys(self):
+        return ((ii << 32 | ci, di) for ii, ci, di in zip(self.indicator_idx,
+            self.country_idx, self.date_idx))
+
+    def indicator_rows(self, indicator_code):
+        """Yield the rows for one indicator, in the format of the API
+        response."""
+        ii = self._indicator_index[indicator_code]
+        indicator = dict(id=indicator_code, value=self.indicator_names[ii])
+        for row_ii, ci, di, value in zip(self.indicator_idx,
+                self.country_idx, self.date_idx, self.values):
+            if row_ii == ii:
+                yield dict(
+                    indicator=indicator,
+                    country=dict(id=self.country_ids[ci],
+                        value=self.country_names[ci]),
+                    date=self.dates[di],
+                    value=None if value != value else value,
+                    )
+
+
 class IndicatorDataset(object):
 
     def __init__(self, json_resp, url=None, date_of_call=None):
+        indicator = json_resp[1][0]["indicator"]
+        # Parse the response once. The data accessors are built from these
+        # columns, rather than from the response rows.
+        self._setup(_IndicatorColumns.from_rows(json_resp[1]),
+            indicator["id"], indicator["value"], url, date_of_call)
+        self._api_response = json_resp
+
+    def _setup(self, columns, indicator_code, indicator_name, url,
+            date_of_call):
         self.api_url = url
+        # The URLs actually requested. Requests for many countries are split
+        # between several URLs, and ``api_url`` is the unsplit URL.
+        self.api_urls = [url] if url else []
         self.api_call_date = date_of_call
-        self.api_response = json_resp
+        self._api_response = None
+        self._columns = columns
 
         # The country codes and names
-        self.countries = {}
-        for country_data in self.api_response[1]:
-            country_id = country_data["country"]["id"]
-            country_val = country_data["country"]["value"]
-            if country_id not in self.countries:
-                self.countries[country_id] = country_val
+        self.countries = dict(zip(columns.country_ids,
+            columns.country_names))
 
-        self.indicator_code = self.api_response[1][0]["indicator"]["id"]
-        self.indicator_name = self.api_response[1][0]["indicator"]["value"]
+        self.indicator_code = indicator_code
+        self.indicator_name = indicator_name
 
         # For some use cases, it's nice to have direct access to all the
         # `get_indicator()` metadata (eg. the sources, full description).
         # It won't always be wanted, so it's requested lazily.
         self._indicator_response = None
 
+    @classmethod
+    def from_rows(cls, rows, url=None, date_of_call=None):
+        """Return a dataset built from an iterable of response rows.
+
+        Each row is added to the dataset as it's reached, and the rows aren't
+        kept, so they can be parsed from a stream (see
+        ``utils.parse_response_stream()``). ``api_response`` is rebuilt from
+        the dataset if it's needed.
+
+        """
+        columns = _IndicatorColumns()
+        indicator = None
+        for row in rows:
+            if indicator is None:
+                indicator = row["indicator"]
+            columns.add_row(row)
+        if indicator is None:
+            raise ValueError("The response has no rows.")
+
+        dataset = cls.__new__(cls)
+        dataset._setup(columns, indicator["id"], indicator["value"], url,
+            date_of_call)
+        return dataset
+
+    @property
+    def api_response(self):
+        """The API response the dataset was built from. For datasets loaded
+        with ``from_arrow()`` or ``from_rows()``, an equivalent single-page
+        response is built when first needed."""
+        if self._api_response is None:
+            rows = self._columns.to_rows(dict(id=self.indicator_code,
+                value=self.indicator_name))
+            header = dict(page=1, pages=1, per_page=len(rows),
+                total=len(rows))
+            self._api_response = [header, rows]
+        return self._api_response
+
+    @api_response.setter
+    def api_response(self, json_resp):
+        self._api_response = json_resp
+
     def __repr__(self):
         s = "<%s.%s(%r, %r) with id: %r>"
         return s % (
@@ -45,6 +339,7 @@ class IndicatorDataset(object):
             )
 
     def __str__(self):
+        import pprint
         return pprint.pformat(self.as_dict())
 
     def dates(self, use_datetime=False):
@@ -55,16 +350,9 @@ class IndicatorDataset(object):
             strings.
 
         """
-        dates = []
-        for country_data in self.as_dict().values():
-            for date in country_data.keys():
-                if date not in dates:
-                    dates.append(date)
-
         if use_datetime:
-            dates = [utils.worldbank_date_to_datetime(d) for d in dates]
-
-        return sorted(dates)
+            return list(self._columns.sorted_datetimes())
+        return list(self._columns.sorted_dates())
 
     @property
     def _indicator(self):
@@ -91,6 +379,156 @@ class IndicatorDataset(object):
     def indicator_topics(self):
         return self._indicator["topics"]
 
+    def to_numpy(self, use_datetime=False):
+        """Return the dataset's data as NumPy arrays. Requires numpy.
+
+        The matrix is built straight from the parsed columns, without
+        building the ``as_dict()`` dictionaries.
+
+        :param use_datetime:
+            Return the dates as a ``datetime64[D]`` array, rather than
+            strings.
+
+        :returns:
+            Tuple of ``(values, countries, dates)``. ``values`` is a float64
+            array of shape ``(len(countries), len(dates))``, with NaN for
+            missing values. ``countries`` holds the sorted country codes, and
+            ``dates`` the sorted dates, as in ``dates()``.
+
+        """
+        np = utils.import_optional("numpy", "numpy")
+        countries, country_codes, dates, date_codes, values = \
+            self._columns.to_arrays(np, use_datetime)
+        matrix = np.full((len(countries), len(dates)), np.nan)
+        matrix[country_codes, date_codes] = values
+        return matrix, countries, dates
+
+    def to_frame(self, wide=False, period=False):
+        """Return the dataset's data as a pandas DataFrame. Requires pandas.
+
+        :param wide:
+            If False, return one row per value, indexed by date, with
+            ``country`` (categorical) and ``value`` columns, sorted by country
+            and date. If True, return a date-by-country table of values.
+
+        :param period:
+            Index by a PeriodIndex (yearly, quarterly or monthly, to match the
+            data), rather than a DatetimeIndex.
+
+        """
+        pd = utils.import_optional("pandas", "pandas")
+        np = utils.import_optional("numpy", "numpy")
+        countries, country_codes, dates, date_codes, values = \
+            self._columns.to_arrays(np)
+        index = utils.date_index(pd, dates, period)
+
+        if wide:
+            matrix = np.full((len(dates), len(countries)), np.nan)
+            matrix[date_codes, country_codes] = values
+            columns = pd.CategoricalIndex(countries, name="country")
+            return pd.DataFrame(matrix, index=index, columns=columns)
+
+        order = np.lexsort((date_codes, country_codes))
+        country = pd.Categorical.from_codes(country_codes[order],
+            categories=countries)
+        return pd.DataFrame({"country": country, "value": values[order]},
+            index=index.take(date_codes[order]))
+
+    def to_arrow(self):
+        """Return the dataset's data as a pyarrow Table. Requires pyarrow.
+
+        The table has one row per value, with ``indicator``, ``country`` and
+        ``date`` dictionary columns, and a float64 ``value`` column (null for
+        missing values). The dataset's metadata is kept in the schema
+        metadata, so ``from_arrow()`` can rebuild the dataset.
+
+        """
+        pa = utils.import_optional("pyarrow", "arrow")
+        np = utils.import_optional("numpy", "numpy")
+        columns = self._columns
+        values = np.frombuffer(columns.values, dtype=np.float64)
+
+        metadata = dict(
+            indicator_code=self.indicator_code,
+            indicator_name=self.indicator_name,
+            api_url=self.api_url,
+            api_call_date=(self.api_call_date.isoformat() if
+                self.api_call_date else None),
+            countries=self.countries,
+            )
+        table = pa.table([
+            pa.DictionaryArray.from_arrays(
+                np.zeros(len(values), dtype=np.int32),
+                pa.array([self.indicator_code], pa.string())),
+            pa.DictionaryArray.from_arrays(
+                np.frombuffer(columns.country_idx, dtype=np.intc).astype(
+                    np.int32),
+                pa.array(columns.country_ids, pa.string())),
+            pa.DictionaryArray.from_arrays(
+                np.frombuffer(columns.date_idx, dtype=np.intc).astype(
+                    np.int32),
+                pa.array(columns.dates, pa.string())),
+            pa.array(values, mask=np.isnan(values)),
+            ], names=["indicator", "country", "date", "value"])
+        return table.replace_schema_metadata({"wbpy": json.dumps(metadata)})
+
+    def to_parquet(self, path, **kwargs):
+        """Write the dataset to a Parquet file, in the ``to_arrow()`` format.
+        Requires pyarrow.
+
+        :param path:
+            File path or writable file object.
+
+        :param kwargs:
+            Passed to ``pyarrow.parquet.write_table()``, eg. ``compression``.
+
+        """
+        pq = utils.import_optional("pyarrow.parquet", "arrow")
+        pq.write_table(self.to_arrow(), path, **kwargs)
+
+    @classmethod
+    def from_arrow(cls, table):
+        """Return a dataset from a pyarrow Table in the ``to_arrow()``
+        format. Requires pyarrow.
+
+        The columns are read directly into the dataset, rather than being
+        converted to an API response and parsed.
+
+        """
+        utils.import_optional("pyarrow", "arrow")
+        metadata = json.loads(table.schema.metadata[b"wbpy"])
+        country = _dictionary_column(table, "country")
+        date = _dictionary_column(table, "date")
+
+        country_ids = country.dictionary.to_pylist()
+        countries = metadata["countries"]
+        columns = _IndicatorColumns.from_arrays(country_ids,
+            [countries.get(code) for code in country_ids],
+            date.dictionary.to_pylist(), country.indices.to_numpy(),
+            date.indices.to_numpy(), table.column("value").to_numpy())
+
+        call_date = metadata["api_call_date"]
+        if call_date:
+            call_date = datetime.datetime.strptime(call_date,
+                "%Y-%m-%d").date()
+
+        dataset = cls.__new__(cls)
+        dataset._setup(columns, metadata["indicator_code"],
+            metadata["indicator_name"], metadata["api_url"], call_date)
+        return dataset
+
+    @classmethod
+    def from_parquet(cls, path, **kwargs):
+        """Return a dataset from a Parquet file written by ``to_parquet()``.
+        Requires pyarrow.
+
+        :param kwargs:
+            Passed to ``pyarrow.parquet.read_table()``.
+
+        """
+        pq = utils.import_optional("pyarrow.parquet", "arrow")
+        return cls.from_arrow(pq.read_table(path, **kwargs))
+
     def as_dict(self, use_datetime=False):
         """Return dictionary of the dataset's data.
 
@@ -100,24 +538,203 @@ class IndicatorDataset(object):
             Use datetime.date() object as the date key, rather than string.
 
         """
-        clean_dict = {}
-        response_data = self.api_response[1]
-        for row in response_data:
-            country_id = row["country"]["id"]
-            date = row["date"]
-            if use_datetime:
-                date = utils.worldbank_date_to_datetime(date)
-
-            if country_id not in clean_dict:
-                clean_dict[country_id] = {}
-            if date not in clean_dict[country_id]:
-                # Sometimes values are missing
-                if row["value"]:
-                    clean_dict[country_id][date] = float(row["value"])
-                else:
-                    clean_dict[country_id][date] = None
-
-        return clean_dict
+        columns = self._columns
+        dates = columns.datetimes() if use_datetime else columns.dates
+
+        country_dicts = [{} for _ in columns.country_ids]
+        for ci, di, value in zip(columns.country_idx, columns.date_idx,
+                columns.values):
+            # Missing values are stored as NaN.
+            country_dicts[ci][dates[di]] = None if value != value else value
+        return dict(zip(columns.country_ids, country_dicts))
+
+
+class IndicatorPanel(object):
+
+    """Data for several indicators, over the same countries and dates.
+
+    Returned by ``IndicatorAPI.get_datasets()``. The values for all the
+    indicators are held together, with one country and date index shared by
+    all of them. ``panel[indicator_code]`` returns an ``IndicatorDataset`` for
+    one of the indicators.
+
+    Indicators that have no data for the requested countries and dates
+    aren't included, so ``code in panel`` is False for them.
+
+    :param json_resps:
+        List of API responses, eg. one per indicator.
+
+    :param urls:
+        The URLs the responses were requested from.
+
+    :param date_of_call:
+        Date of the requests.
+
+    """
+
+    def __init__(self, json_resps, urls=None, date_of_call=None):
+        # Responses without any rows have null in place of the rows.
+        rows = itertools.chain.from_iterable(json_resp[1] or [] for json_resp
+            in json_resps)
+        self._setup(_PanelColumns.from_rows(rows), urls, date_of_call)
+
+    def _setup(self, columns, urls, date_of_call):
+        self.api_urls = list(urls or [])
+        self.api_call_date = date_of_call
+        self._columns = columns
+
+        # The indicator and country codes and names
+        self.indicators = dict(zip(columns.indicator_ids,
+            columns.indicator_names))
+        self.countries = dict(zip(columns.country_ids,
+            columns.country_names))
+
+    @classmethod
+    def from_rows(cls, rows, urls=None, date_of_call=None):
+        """Return a panel built from an iterable of response rows, for any
+        number of indicators. Each row is added as it's reached, and the rows
+        aren't kept."""
+        panel = cls.__new__(cls)
+        panel._setup(_PanelColumns.from_rows(rows), urls, date_of_call)
+        return panel
+
+    def __repr__(self):
+        s = "<%s.%s(%r) with id: %r>"
+        return s % (
+            self.__class__.__module__,
+            self.__class__.__name__,
+            self._columns.indicator_ids,
+            id(self),
+            )
+
+    def __str__(self):
+        import pprint
+        return pprint.pformat(self.as_dict())
+
+    def __len__(self):
+        return len(self._columns.indicator_ids)
+
+    def __iter__(self):
+        return iter(self._columns.indicator_ids)
+
+    def __contains__(self, indicator_code):
+        return indicator_code in self.indicators
+
+    def __getitem__(self, indicator_code):
+        """Return an ``IndicatorDataset`` of one indicator's data. Its
+        ``api_url`` is None if the indicator's countries were split between
+        several requests."""
+        if indicator_code not in self.indicators:
+            raise KeyError(indicator_code)
+        dataset = IndicatorDataset.from_rows(
+            self._columns.indicator_rows(indicator_code),
+            date_of_call=self.api_call_date)
+        path = "/indicators/{0}?".format(indicator_code).lower()
+        dataset.api_urls = [url for url in self.api_urls if path in
+            url.lower()]
+        if len(dataset.api_urls) == 1:
+            dataset.api_url = dataset.api_urls[0]
+        return dataset
+
+    def dates(self, use_datetime=False):
+        """Return the sorted list of dates used by any of the indicators.
+
+        :param use_datetime:
+            If True, return dates as datetime.date() objects, rather than
+            strings.
+
+        """
+        if use_datetime:
+            return list(self._columns.sorted_datetimes())
+        return list(self._columns.sorted_dates())
+
+    def as_dict(self, use_datetime=False):
+        """Return dictionary of the panel's data.
+
+        Keys are: data[indicator_code][country_code][date]
+
+        :param use_datetime:
+            Use datetime.date() object as the date key, rather than string.
+
+        """
+        columns = self._columns
+        dates = columns.datetimes() if use_datetime else columns.dates
+
+        results = dict((code, {}) for code in columns.indicator_ids)
+        indicator_dicts = [results[code] for code in columns.indicator_ids]
+        for ii, ci, di, value in zip(columns.indicator_idx,
+                columns.country_idx, columns.date_idx, columns.values):
+            country_dict = indicator_dicts[ii].setdefault(
+                columns.country_ids[ci], {})
+            # Missing values are stored as NaN.
+            country_dict[dates[di]] = None if value != value else value
+        return results
+
+    def to_numpy(self, use_datetime=False):
+        """Return the panel's data as NumPy arrays. Requires numpy.
+
+        :param use_datetime:
+            Return the dates as a ``datetime64[D]`` array, rather than
+            strings.
+
+        :returns:
+            Tuple of ``(values, indicators, countries, dates)``. ``values`` is
+            a float64 array of shape ``(len(indicators), len(countries),
+            len(dates))``, with NaN for missing values. ``indicators`` is in
+            the order their rows first appear, which for ``get_datasets()``
+            is the order requested, leaving out any indicators without data.
+            ``countries`` and ``dates`` are sorted.
+
+        """
+        np = utils.import_optional("numpy", "numpy")
+        countries, country_codes, dates, date_codes, values = \
+            self._columns.to_arrays(np, use_datetime)
+        indicators = np.array(self._columns.indicator_ids)
+        matrix = np.full((len(indicators), len(countries), len(dates)),
+            np.nan)
+        matrix[np.frombuffer(self._columns.indicator_idx, dtype=np.intc),
+            country_codes, date_codes] = values
+        return matrix, indicators, countries, dates
+
+    def to_frame(self, wide=False, period=False):
+        """Return the panel's data as a pandas DataFrame. Requires pandas.
+
+        :param wide:
+            If False, return one row per value, indexed by date, with
+            ``indicator`` and ``country`` (categorical) and ``value`` columns,
+            sorted by indicator, country and date. If True, return a table
+            indexed by country and date, with one column per indicator.
+
+        :param period:
+            Use a PeriodIndex for the dates, rather than a DatetimeIndex.
+
+        """
+        pd = utils.import_optional("pandas", "pandas")
+        np = utils.import_optional("numpy", "numpy")
+        countries, country_codes, dates, date_codes, values = \
+            self._columns.to_arrays(np)
+        indicators = np.array(self._columns.indicator_ids)
+        indicator_idx = np.frombuffer(self._columns.indicator_idx,
+            dtype=np.intc)
+        index = utils.date_index(pd, dates, period)
+
+        if wide:
+            table = np.full((len(countries), len(dates), len(indicators)),
+                np.nan)
+            table[country_codes, date_codes, indicator_idx] = values
+            rows = pd.MultiIndex.from_product([
+                pd.CategoricalIndex(countries, name="country"), index])
+            return pd.DataFrame(table.reshape(len(rows), len(indicators)),
+                index=rows, columns=pd.Index(indicators, name="indicator"))
+
+        order = np.lexsort((date_codes, country_codes, indicator_idx))
+        return pd.DataFrame({
+            "indicator": pd.Categorical.from_codes(indicator_idx[order],
+                categories=indicators),
+            "country": pd.Categorical.from_codes(country_codes[order],
+                categories=countries),
+            "value": values[order],
+            }, index=index.take(date_codes[order]))
 
 
 class IndicatorAPI(object):
@@ -126,17 +743,40 @@ class IndicatorAPI(object):
 
     You can override the default tempfile cache by passing a function
     ``fetch``, which requests a URL and returns the response as a string.
+
+    Multi-page responses are requested using up to ``max_workers`` threads.
+
+    Dataset requests for more countries than fit in a URL of
+    ``MAX_URL_LENGTH`` characters are split into several requests, which are
+    made concurrently and merged into one dataset.
+
+    The default fetcher keeps HTTP connections alive and reuses them for
+    every request made by this instance. ``api.fetch.pool.stats`` has the
+    counts of new and reused connections.
+
+    With ``offline=True``, the default fetcher only returns cached responses
+    (however old), and raises ``wbpy.cache.CacheMissError`` for URLs that
+    aren't cached. Setting the ``WBPY_OFFLINE`` environment variable does the
+    same for every instance.
     """
 
     BASE_URL = "http://api.worldbank.org/v2/"
 
+    # Lists the indicators that appear on the main World Bank website.
+    COMMON_INDICATORS_URL = "https://data.worldbank.org/indicator?tab=all"
+
     # The API uses some non-ISO 2-digit and 3-digit codes. Make them available.
-    NON_STANDARD_REGIONS = utils.NON_STANDARD_REGIONS
+    NON_STANDARD_REGIONS = _NonStandardRegions()
+
+    # Longer URLs are rejected, or handled slowly, by the API.
+    MAX_URL_LENGTH = 1000
 
-    def __init__(self, fetch=None):
-        self.fetch = fetch if fetch else utils.fetch
+    def __init__(self, fetch=None, max_workers=utils.DEFAULT_MAX_WORKERS,
+            offline=None):
+        self.fetch = fetch if fetch else utils.Fetcher(offline=offline)
+        self.max_workers = max_workers
 
-    def get_dataset(self, indicator, country_codes=None,
+    def get_dataset(self, indicator, country_codes=None, keep_response=True,
             **kwargs):
         """Request a dataset from the API.
 
@@ -147,6 +787,13 @@ class IndicatorAPI(object):
             List of ISO 1366 alpha-2 or alpha-3 country codes. If None, returns
             data for all countries.
 
+        :param keep_response:
+            If False, the response is parsed incrementally, with each row
+            added to the dataset as it's parsed, so the parsed response is
+            never held in memory. The dataset's ``api_response`` is then only
+            rebuilt (without any fields the dataset doesn't use) if it's
+            accessed. Useful for large requests.
+
         :param kwargs:
             The following map directly to the API query args:
             ``language``
@@ -159,20 +806,95 @@ class IndicatorAPI(object):
             IndicatorDataset instance containing the dataset and metadata.
 
         """
-        if country_codes:
-            country_codes = [utils.convert_country_code(c, "alpha3") for c in
-                country_codes]
-            country_string = ";".join(country_codes)
-        else:
-            country_string = "all"
+        url = self._dataset_url(indicator, country_codes, **kwargs)
+        urls = self._dataset_urls(indicator, country_codes, **kwargs)
+        call_date = datetime.datetime.now().date()
+        if not keep_response:
+            streams = utils.map_concurrently(
+                functools.partial(utils.load_chunks, self.fetch), urls,
+                self.max_workers)
+            return self._dataset_from_streams(streams, urls, url, call_date)
+        responses = utils.map_concurrently(
+            functools.partial(self._get_page, allow_empty=True), urls,
+            self.max_workers)
+        return self._merged_dataset(responses, urls, url, call_date)
+
+    def get_datasets(self, indicators, country_codes=None, **kwargs):
+        """Request several indicators for the same countries, concurrently.
+
+        :param indicators:
+            List of API indicator codes.
 
-        url = "countries/{0}/indicators/{1}?".format(country_string,
-                indicator)
-        url = self._generate_indicators_url(url, dataset_params=True, **kwargs)
+        :param country_codes:
+            List of ISO 1366 alpha-2 or alpha-3 country codes. If None, returns
+            data for all countries.
+
+        :param kwargs:
+            The same API query args as ``get_dataset()``, used for every
+            indicator.
+
+        :returns:
+            IndicatorPanel instance containing the data for all the
+            indicators. Indicators without any data for the countries and
+            dates are left out, rather than raising an error.
+
+        """
+        urls = [url for indicator in indicators for url in
+            self._dataset_urls(indicator, country_codes, **kwargs)]
         call_date = datetime.datetime.now().date()
-        json_resp = json.loads(self.fetch(url))
-        self._raise_if_bad_response(json_resp, url)
-        return IndicatorDataset(json_resp, url, call_date)
+        streams = utils.map_concurrently(
+            functools.partial(utils.load_chunks, self.fetch), urls,
+            self.max_workers)
+        return self._panel_from_streams(streams, urls, call_date)
+
+    def iter_dataset_rows(self, indicator, country_codes=None, per_page=1000,
+            **kwargs):
+        """Request a dataset from the API, yielding its values one at a time.
+
+        Unlike ``get_dataset()``, the whole response is never held in memory.
+        The response is requested in pages of ``per_page`` rows, each page is
+        parsed incrementally, and the next page is only requested once the
+        rows of the previous page have been used.
+
+        :param indicator:
+            The API indicator code, eg. SP.POP.TOTL for total population.
+
+        :param country_codes:
+            List of ISO 1366 alpha-2 or alpha-3 country codes. If None, returns
+            data for all countries.
+
+        :param per_page:
+            Number of rows to request per page.
+
+        :param kwargs:
+            The same API query args as ``get_dataset()``.
+
+        :returns:
+            Generator of ``(country_code, date, value)`` tuples, in the order
+            of the API response. Values are floats, or None if missing.
+
+        """
+        # A chunk of countries without any data is skipped, unless every
+        # chunk is empty.
+        found_rows = False
+        for url in self._dataset_urls(indicator, country_codes,
+                per_page=per_page, **kwargs):
+            page_url = url
+            page = 1
+            while True:
+                header, rows = self._parse_page_stream(
+                    utils.load_chunks(self.fetch, page_url), page_url,
+                    allow_empty=True)
+                for row in rows:
+                    found_rows = True
+                    yield self._dataset_row(row)
+                if page >= int(header["pages"]):
+                    break
+                page += 1
+                page_url = url + "&page={0}".format(page)
+        if not found_rows:
+            raise ValueError(utils.EXC_MSG % (self._dataset_url(indicator,
+                country_codes, per_page=per_page, **kwargs), [header]))
 
     def get_indicators(self, indicator_codes=None, search=None,
             search_full=False, common_only=False, **kwargs):
@@ -214,24 +936,8 @@ class IndicatorAPI(object):
             **kwargs)
 
         if common_only:
-            # Compile a list of codes that are on the main website (and have
-            # better data coverage), and filter out any results that cannot be
-            # found on the site.
-            page = self.fetch("https://data.worldbank.org/indicator?tab=all")
-            ind_codes = re.compile(r"(?<=/indicator/)[^?]+")
-            common_matches = {}
-            code_matches = set([code.lower() for code in
-                                ind_codes.findall(page)])
-            assert code_matches, "That common_matches search algorithm isn't fatally broken."
-
-            # If key matches common code, include in results.
-            for k, v in results.items():
-                low_k = k.lower()
-                for code_match in code_matches:
-                    if code_match in low_k:
-                        common_matches[k] = v
-                        break
-            return common_matches
+            page = self.fetch(self.COMMON_INDICATORS_URL)
+            return self._filter_common_indicators(results, page)
         else:
             return results
 
@@ -506,6 +1212,7 @@ class IndicatorAPI(object):
         self,
         rest_url,
         dataset_params=False,
+        per_page=10000,
         **kwargs):
         """Add API root and query string options to an otherwise complete
         endpoint.
@@ -516,12 +1223,15 @@ class IndicatorAPI(object):
         :param dataset_params:
             Add query values that are only relevant to the get_dataset() call.
 
+        :param per_page:
+            Number of rows per page of the response.
+
         """
         kwargs = dict([(k.lower(), v) for k, v in kwargs.items()])
         assert not ("topic" in kwargs and "source" in kwargs)
 
         # Fix any API options that shouldn't be accessible via wbpy.
-        fixed_options = {"format": "json", "per_page": "10000"}
+        fixed_options = {"format": "json", "per_page": str(per_page)}
         banned_options = ["page"]
         kwargs.update(fixed_options)
         for k in banned_options:
@@ -559,27 +1269,154 @@ class IndicatorAPI(object):
         query_string = urlencode(sorted_kwargs)
 
         new_url = "".join([self.BASE_URL, rest_url, query_string])
-        print(new_url)
         return new_url
 
+    def _dataset_url(self, indicator, country_codes=None, per_page=10000,
+            **kwargs):
+        """Return the API URL for a ``get_dataset()`` call."""
+        if country_codes:
+            country_string = ";".join([utils.convert_country_code(c,
+                "alpha3") for c in country_codes])
+        else:
+            country_string = "all"
+        return self._countries_dataset_url(indicator, country_string,
+            per_page=per_page, **kwargs)
+
+    def _countries_dataset_url(self, indicator, country_string, **kwargs):
+        """Return the dataset URL for an already joined string of alpha-3
+        country codes, eg. "GBR;FRA", or "all"."""
+        url = "countries/{0}/indicators/{1}?".format(country_string,
+                indicator)
+        return self._generate_indicators_url(url, dataset_params=True,
+            **kwargs)
+
+    def _dataset_urls(self, indicator, country_codes=None, **kwargs):
+        """Return the API URLs to request for a ``get_dataset()`` call, with
+        the countries split between as many URLs as are needed to keep each
+        one within ``MAX_URL_LENGTH``."""
+        if not country_codes:
+            return [self._dataset_url(indicator, **kwargs)]
+
+        country_codes = [utils.convert_country_code(c, "alpha3") for c in
+            country_codes]
+        # The rest of the URL is the same length for every chunk.
+        max_length = self.MAX_URL_LENGTH - (len(self._countries_dataset_url(
+            indicator, "all", **kwargs)) - len("all"))
+        chunks = [[]]
+        length = 0
+        for code in country_codes:
+            if chunks[-1] and length + len(code) + 1 > max_length:
+                chunks.append([])
+                length = 0
+            length += len(code) + (1 if chunks[-1] else 0)
+            chunks[-1].append(code)
+        return [self._countries_dataset_url(indicator, ";".join(chunk),
+            **kwargs) for chunk in chunks]
+
+    @staticmethod
+    def _merged_dataset(responses, urls, url, call_date):
+        """Return one dataset from the responses for each of ``urls``.
+        Responses without any rows are left out, but if none of them have
+        rows, ``ValueError`` is raised."""
+        with_rows = [response for response in responses if not
+            _is_empty_response(response[0])]
+        if not with_rows:
+            raise ValueError(utils.EXC_MSG % (url, responses[0]))
+        if len(with_rows) == 1:
+            json_resp = with_rows[0]
+        else:
+            rows = []
+            for response in with_rows:
+                rows.extend(response[1])
+            header = dict(with_rows[0][0], total=len(rows))
+            json_resp = [header, rows]
+        dataset = IndicatorDataset(json_resp, url, call_date)
+        dataset.api_urls = list(urls)
+        return dataset
+
+    def _filter_common_indicators(self, results, page):
+        """Filter ``get_indicators()`` results down to the indicators that
+        are linked from the given World Bank website page.
+        """
+        # Compile a list of codes that are on the main website (and have
+        # better data coverage), and filter out any results that cannot be
+        # found on the site.
+        ind_codes = re.compile(r"(?<=/indicator/)[^?]+")
+        common_matches = {}
+        code_matches = set([code.lower() for code in
+                            ind_codes.findall(page)])
+        assert code_matches, "That common_matches search algorithm isn't fatally broken."
+
+        # If key matches common code, include in results.
+        for k, v in results.items():
+            low_k = k.lower()
+            for code_match in code_matches:
+                if code_match in low_k:
+                    common_matches[k] = v
+                    break
+        return common_matches
+
     def _get_api_response_as_json(self, url):
         """Return JSON content from Indicators URL.
 
-        Concatenates the returned list if request requires multiple-page
-        responses.
+        If the response has multiple pages, the other pages are requested
+        concurrently once the first page has given the page count, and the
+        content of all pages is concatenated in page order.
 
         """
-        web_page = self.fetch(url)
-        json_resp = json.loads(web_page)
-        self._raise_if_bad_response(json_resp, url)
+        json_resp = self._get_page(url)
         header = json_resp[0]
-        content = json_resp[1]
-        current_page = header["page"]
-        if current_page < header["pages"]:
-            next_page = url + "&page={0}".format(current_page + 1)
-            content += self._get_api_response_as_json(next_page)
+        content = list(json_resp[1])
+        page_urls = [url + "&page={0}".format(page) for page in
+            range(int(header["page"]) + 1, int(header["pages"]) + 1)]
+        pages = utils.map_concurrently(self._get_page, page_urls,
+            self.max_workers)
+        for page_resp in pages:
+            content.extend(page_resp[1])
         return content
 
+    @staticmethod
+    def _dataset_row(row):
+        """Return the ``(country_code, date, value)`` tuple for a row of a
+        dataset response."""
+        # Sometimes values are missing
+        value = row["value"]
+        return (row["country"]["id"], row["date"],
+            float(value) if value else None)
+
+    def _get_page(self, url, allow_empty=False):
+        json_resp = utils.load_json(self.fetch, url)
+        self._raise_if_bad_response(json_resp, url, allow_empty)
+        return json_resp
+
+    def _parse_page_stream(self, chunks, url, allow_empty=False):
+        """Return the ``(header, rows)`` of a response from its text chunks,
+        where ``rows`` is parsed as it's iterated over."""
+        header, rows = utils.parse_response_stream(chunks)
+        self._raise_if_bad_response([header], url, allow_empty)
+        return header, rows
+
+    def _panel_from_streams(self, streams, urls, call_date):
+        """Return a panel from the response text chunks for each of
+        ``urls``, parsing each response incrementally. Responses without any
+        rows are skipped."""
+        rows = itertools.chain.from_iterable(
+            self._parse_page_stream(chunks, url, allow_empty=True)[1] for
+            chunks, url in zip(streams, urls))
+        return IndicatorPanel.from_rows(rows, urls, call_date)
+
+    def _dataset_from_streams(self, streams, urls, url, call_date):
+        """Return one dataset from the response text chunks for each of
+        ``urls``, parsing each response incrementally."""
+        # Chunks without any rows are skipped; from_rows() raises if there
+        # are no rows at all.
+        rows = itertools.chain.from_iterable(
+            self._parse_page_stream(chunks, chunk_url, allow_empty=True)[1]
+            for chunks, chunk_url in zip(streams, urls))
+        dataset = IndicatorDataset.from_rows(rows, url, call_date)
+        dataset.api_urls = list(urls)
+        return dataset
+
     def _get_indicator_data(self, func_params, api_ids, search=None,
             search_full=False, **kwargs):
         """
@@ -602,23 +1439,34 @@ class IndicatorAPI(object):
             Dictionary with keys that are the given response_key for the API
             response.
         """
-        # Make the URL and call the JSON data.
+        url = self._indicator_data_url(func_params, api_ids, **kwargs)
+        world_bank_response = self._get_api_response_as_json(url)
+        return self._filter_indicator_data(func_params, world_bank_response,
+            search=search, search_full=search_full)
+
+    def _indicator_data_url(self, func_params, api_ids, **kwargs):
+        """Return the API URL for a ``_get_indicator_data()`` call."""
         if api_ids:
             rest_string = ";".join([str(x) for x in api_ids])
             url = "{0}/{1}?".format(func_params["rest_url"], rest_string)
         else:
             url = "{0}?".format(func_params["rest_url"])
-        url = self._generate_indicators_url(url, **kwargs)
-        world_bank_response = self._get_api_response_as_json(url)
+        return self._generate_indicators_url(url, **kwargs)
 
+    def _filter_indicator_data(self, func_params, world_bank_response,
+            search=None, search_full=False):
+        """Key the API response rows by ``func_params["response_key"]``, and
+        apply any search filter.
+        """
         # Use the 'response_key' value as the top-level key for the dictionary.
         filtered_data = {}
+        response_key = func_params["response_key"]
         for row in world_bank_response:
-            filtered_data[row[func_params["response_key"]]] = row
-
-            # No point in keeping the key duplicated in the values, so delete
-            # it
-            del(row[func_params["response_key"]])
+            # No point in keeping the key duplicated in the values, so leave
+            # it out. The row is copied rather than modified, as the response
+            # may be shared through the memory cache.
+            filtered_data[row[response_key]] = dict(
+                (k, v) for k, v in row.items() if k != response_key)
 
         if search:
             # Either search everything, or just the main "name" value of the
@@ -630,6 +1478,9 @@ class IndicatorAPI(object):
                     func_params["search_key"])
         return filtered_data
 
-    def _raise_if_bad_response(self, json_resp, url):
-        if json_resp[0].get("pages") == 0 or json_resp[0].get("message"):
+    def _raise_if_bad_response(self, json_resp, url, allow_empty=False):
+        """Raise ``ValueError`` for an API error message, or for a response
+        without any rows unless ``allow_empty`` is True."""
+        if json_resp[0].get("message") or (json_resp[0].get("pages") == 0 and
+                not allow_empty):
             raise ValueError(utils.EXC_MSG % (url, json_resp))
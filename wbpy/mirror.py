@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""Keep a local mirror of Indicators API datasets, downloaded in bulk.
+
+``Mirror`` downloads every page of ``get_dataset()`` for a list of indicators
+(by default, all ~8000 of them) into a single SQLite file. Each page is a
+chunk. Its rows and its checkpoint are written in one transaction, so if
+the download is stopped, running it again carries on from the chunks that
+hadn't finished. Chunks that failed are retried on the next run too.
+
+The store keeps one row per observation, keyed by integer indicator and
+country IDs. Rows without a value aren't stored. ``dataset()`` and
+``panel()`` load the mirrored data back as ``IndicatorDataset`` and
+``IndicatorPanel`` objects.
+
+From the command line::
+
+    python -m wbpy.mirror /data/wbpy-mirror.sqlite3 --workers 4
+
+"""
+import argparse
+import collections
+import datetime
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from six.moves import http_client
+
+from . import utils
+from .indicators import IndicatorAPI, IndicatorDataset, IndicatorPanel
+
+# Errors that are worth retrying a chunk for. ValueError covers truncated
+# responses; API error messages aren't retried, as they won't change.
+RETRY_ERRORS = (IOError, OSError, http_client.HTTPException, ValueError)
+
+# ``done`` and ``skipped`` are the number of chunks downloaded by this run,
+# and those already done by an earlier one. ``failed`` is a list of
+# ``(indicator, url, error)`` tuples.
+MirrorResult = collections.namedtuple("MirrorResult",
+    ["done", "skipped", "failed"])
+
+
+class Mirror(object):
+
+    """A resumable bulk download of indicator datasets into a local store.
+
+    :param path:
+        Path of the SQLite file to store the mirror and its checkpoints in.
+
+    :param api:
+        The ``IndicatorAPI`` to build URLs and request data with.
+
+    :param max_workers:
+        Number of chunks to download at once.
+
+    :param retries:
+        Number of times to retry a chunk after an error, waiting
+        ``backoff * 2 ** attempt`` seconds before each retry.
+
+    :param progress:
+        Called as ``progress(done, total, indicator, url, status)`` after each
+        chunk, where ``status`` is "done" or "failed". ``total`` grows as
+        multi-page datasets are found. Calls are never made at the same time.
+
+    """
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS indicators (
+            id INTEGER PRIMARY KEY,
+            code TEXT NOT NULL UNIQUE,
+            name TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS countries (
+            id INTEGER PRIMARY KEY,
+            code TEXT NOT NULL UNIQUE,
+            name TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS observations (
+            indicator_id INTEGER NOT NULL,
+            country_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            value REAL NOT NULL,
+            PRIMARY KEY (indicator_id, country_id, date)
+        ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS chunks (
+            indicator TEXT NOT NULL,
+            url TEXT NOT NULL,
+            status TEXT NOT NULL,
+            rows INTEGER,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            updated_at REAL,
+            PRIMARY KEY (indicator, url)
+        )""",
+        ]
+
+    def __init__(self, path, api=None, max_workers=4, retries=3, backoff=1.0,
+            progress=None):
+        self.path = path
+        self.api = api if api is not None else IndicatorAPI()
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.progress = progress
+        self._conn = None
+        self._lock = threading.RLock()
+        self._indicator_ids = {}
+        self._country_ids = {}
+
+    def run(self, indicators=None, country_codes=None, **kwargs):
+        """Download every chunk that isn't already done, and return a
+        ``MirrorResult``.
+
+        :param indicators:
+            List of indicator codes. If None, every indicator from
+            ``get_indicators()``.
+
+        :param country_codes:
+            List of country codes. If None, all countries.
+
+        :param kwargs:
+            Query args, as for ``get_dataset()``. If neither ``date`` nor
+            ``mrv`` is given, every year from 1960 is requested.
+
+        """
+        if indicators is None:
+            indicators = sorted(self.api.get_indicators())
+        if "date" not in kwargs and "mrv" not in kwargs:
+            kwargs["date"] = "1960:{0}".format(datetime.date.today().year)
+
+        first_pages = [(indicator, url) for indicator in indicators for url in
+            self.api._dataset_urls(indicator, country_codes, **kwargs)]
+        with self._lock:
+            self._connection().executemany("INSERT OR IGNORE INTO chunks "
+                "(indicator, url, status) VALUES (?, ?, 'pending')",
+                first_pages)
+            rows = self._connection().execute(
+                "SELECT indicator, url, status FROM chunks").fetchall()
+
+        # Later pages of a dataset are checkpointed as they're found, so
+        # resume any of those too.
+        base_urls = set(url for _, url in first_pages)
+        chunks = [(indicator, url, status) for indicator, url, status in rows
+            if url.split("&page=")[0] in base_urls]
+        pending = [(indicator, url) for indicator, url, status in chunks
+            if status != "done"]
+        state = dict(done=0, finished=0, total=len(pending), failed=[])
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = set(executor.submit(self._download, indicator, url,
+                state) for indicator, url in pending)
+            while futures:
+                finished, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    for indicator, url in future.result():
+                        futures.add(executor.submit(self._download,
+                            indicator, url, state))
+        return MirrorResult(state["done"], len(chunks) - len(pending),
+            state["failed"])
+
+    def dataset(self, indicator):
+        """Return an ``IndicatorDataset`` of the mirrored data for an
+        indicator. Raises ``KeyError`` if it has no mirrored data."""
+        rows = list(self._iter_rows([indicator]))
+        if not rows:
+            raise KeyError(indicator)
+        return IndicatorDataset.from_rows(rows,
+            date_of_call=self._download_date([indicator]))
+
+    def panel(self, indicators):
+        """Return an ``IndicatorPanel`` of the mirrored data for a list of
+        indicators."""
+        return IndicatorPanel.from_rows(self._iter_rows(indicators),
+            date_of_call=self._download_date(indicators))
+
+    def status(self):
+        """Return the number of chunks with each status, eg.
+        ``{"done": 7950, "failed": 3, "pending": 47}``."""
+        with self._lock:
+            return dict(self._connection().execute(
+                "SELECT status, COUNT(*) FROM chunks GROUP BY status"))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _download(self, indicator, url, state):
+        """Download and store one chunk, and return any further chunks of
+        the dataset to download."""
+        attempts = 0
+        try:
+            while True:
+                attempts += 1
+                try:
+                    header, rows = self._fetch_page(url)
+                    break
+                except RETRY_ERRORS:
+                    if attempts > self.retries:
+                        raise
+                    time.sleep(self.backoff * 2 ** (attempts - 1))
+            # Indicators without any data have an empty first page, which is
+            # stored as a done chunk with no rows.
+            self.api._raise_if_bad_response([header], url, allow_empty=True)
+            next_chunks = self._save(indicator, url, header, rows, attempts)
+        except Exception as e:
+            self._save_error(indicator, url, e, attempts)
+            self._report(state, indicator, url, "failed", error=e)
+            return []
+        self._report(state, indicator, url, "done", new=len(next_chunks))
+        return next_chunks
+
+    def _fetch_page(self, url):
+        """Return the ``(header, rows)`` of a response, without checking
+        it for an error message. Responses aren't added to the cache, as a
+        full mirror would fill it."""
+        fetch_chunks = getattr(self.api.fetch, "fetch_chunks", None)
+        if fetch_chunks is not None:
+            chunks = fetch_chunks(url, cache_response=False)
+        else:
+            chunks = [self.api.fetch(url)]
+        header, rows = utils.parse_response_stream(chunks)
+        return header, list(rows)
+
+    def _save(self, indicator, url, header, rows, attempts):
+        """Store the rows of a chunk and mark it done, in one transaction."""
+        next_chunks = []
+        if "&page=" not in url:
+            next_chunks = [(indicator, url + "&page={0}".format(page)) for
+                page in range(2, int(header["pages"]) + 1)]
+
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN")
+            try:
+                observations = []
+                for row in rows:
+                    value = self.api._dataset_row(row)[2]
+                    if value is None:
+                        continue
+                    observations.append((
+                        self._get_id(conn, "indicators", self._indicator_ids,
+                            row["indicator"]),
+                        self._get_id(conn, "countries", self._country_ids,
+                            row["country"]),
+                        row["date"], value))
+                conn.executemany("INSERT OR REPLACE INTO observations "
+                    "(indicator_id, country_id, date, value) "
+                    "VALUES (?, ?, ?, ?)", observations)
+                conn.executemany("INSERT OR IGNORE INTO chunks "
+                    "(indicator, url, status) VALUES (?, ?, 'pending')",
+                    next_chunks)
+                conn.execute("UPDATE chunks SET status = 'done', rows = ?, "
+                    "attempts = attempts + ?, error = NULL, updated_at = ? "
+                    "WHERE indicator = ? AND url = ?",
+                    (len(observations), attempts, time.time(), indicator,
+                        url))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                # IDs added in the rolled back transaction no longer exist.
+                self._indicator_ids.clear()
+                self._country_ids.clear()
+                raise
+        return next_chunks
+
+    def _save_error(self, indicator, url, error, attempts):
+        with self._lock:
+            self._connection().execute("UPDATE chunks SET status = 'failed', "
+                "attempts = attempts + ?, error = ?, updated_at = ? "
+                "WHERE indicator = ? AND url = ?",
+                (attempts, repr(error), time.time(), indicator, url))
+
+    def _report(self, state, indicator, url, status, new=0, error=None):
+        with self._lock:
+            state["finished"] += 1
+            state["total"] += new
+            if error is None:
+                state["done"] += 1
+            else:
+                state["failed"].append((indicator, url, error))
+            if self.progress:
+                self.progress(state["finished"], state["total"], indicator,
+                    url, status)
+
+    @staticmethod
+    def _get_id(conn, table, ids, entity):
+        """Return the integer ID for an ``{"id": code, "value": name}``
+        entity from a response row, adding it to ``table`` if it's new."""
+        code = entity["id"]
+        if code not in ids:
+            conn.execute("INSERT OR IGNORE INTO {0} (code, name) "
+                "VALUES (?, ?)".format(table), (code, entity["value"]))
+            ids[code] = conn.execute("SELECT id FROM {0} WHERE code = ?"
+                .format(table), (code,)).fetchone()[0]
+        return ids[code]
+
+    def _iter_rows(self, indicators):
+        """Yield the mirrored observations for some indicators, in the same
+        form as the rows of an API response."""
+        for indicator in indicators:
+            with self._lock:
+                rows = self._connection().execute(
+                    "SELECT i.code, i.name, c.code, c.name, o.date, o.value "
+                    "FROM observations o "
+                    "JOIN indicators i ON i.id = o.indicator_id "
+                    "JOIN countries c ON c.id = o.country_id "
+                    "WHERE i.code = ? ORDER BY c.code, o.date DESC",
+                    (indicator,)).fetchall()
+            for ind_code, ind_name, country_code, country_name, date, value \
+                    in rows:
+                yield {
+                    "indicator": {"id": ind_code, "value": ind_name},
+                    "country": {"id": country_code, "value": country_name},
+                    "date": date,
+                    "value": value,
+                    }
+
+    def _download_date(self, indicators):
+        """Return the date of the latest finished chunk for the
+        indicators."""
+        with self._lock:
+            latest = self._connection().execute(
+                "SELECT MAX(updated_at) FROM chunks WHERE status = 'done' "
+                "AND indicator IN ({0})".format(",".join("?" * len(
+                    indicators))), list(indicators)).fetchone()[0]
+        if latest is None:
+            return None
+        return datetime.date.fromtimestamp(latest)
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            # Autocommit mode, with explicit transactions for each chunk.
+            conn = sqlite3.connect(self.path, timeout=30,
+                isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+
+def _print_progress(done, total, indicator, url, status):
+    sys.stderr.write("[{0}/{1}] {2} {3}\n".format(done, total, status, url))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Mirror Indicators API datasets into a local store.")
+    parser.add_argument("path", help="SQLite file to store the mirror in")
+    parser.add_argument("--indicators", nargs="+",
+        help="Indicator codes to mirror (default: all)")
+    parser.add_argument("--countries", nargs="+",
+        help="Country codes to mirror (default: all)")
+    parser.add_argument("--date", help="Date range to request, eg. 2000:2020 "
+        "(default: 1960 to this year)")
+    parser.add_argument("--workers", type=int, default=4,
+        help="Number of chunks to download at once (default: 4)")
+    parser.add_argument("--retries", type=int, default=3,
+        help="Number of retries for each chunk (default: 3)")
+    parser.add_argument("--quiet", action="store_true",
+        help="Don't report progress")
+    args = parser.parse_args(argv)
+
+    mirror = Mirror(args.path, max_workers=args.workers,
+        retries=args.retries,
+        progress=None if args.quiet else _print_progress)
+    kwargs = dict(date=args.date) if args.date else {}
+    result = mirror.run(args.indicators, args.countries, **kwargs)
+    mirror.close()
+
+    if not args.quiet:
+        sys.stderr.write("{0} chunks downloaded, {1} already done, {2} "
+            "failed\n".format(result.done, result.skipped,
+                len(result.failed)))
+    for indicator, url, error in result.failed:
+        sys.stderr.write("Failed: {0} ({1})\n".format(url, error))
+    return 1 if result.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
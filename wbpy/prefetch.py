@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""Fill the cache ahead of time for a known workload.
+
+A manifest lists the requests that a job is going to make, and
+``Prefetcher`` downloads any of their responses that aren't already fresh in
+the cache, so the job itself can run from the cache (eg. with
+``WBPY_OFFLINE`` set). The manifest is a dict, or a JSON file, like::
+
+    {
+        "indicators": [
+            {
+                "indicators": ["SP.POP.TOTL", "NY.GDP.MKTP.CD"],
+                "country_groups": [["GB", "FR", "DE"], ["BR", "AR"]],
+                "dates": ["2000:2020", "1980:1999"]
+            }
+        ],
+        "climate": [
+            {
+                "type": "modelled",
+                "data_types": ["pr", "tas"],
+                "intervals": ["annualavg"],
+                "locations": ["GB", "FR"]
+            }
+        ]
+    }
+
+Each ``indicators`` entry requests every combination of its indicators,
+country groups and dates, as ``IndicatorAPI.get_dataset()`` would.
+``country_groups`` and ``dates`` are optional; without them, all countries
+and the API's default dates are used. Any other keys (eg. ``frequency``,
+``mrv``, ``language``) are passed to ``get_dataset()`` as query args.
+
+Each ``climate`` entry has a ``type`` of ``instrumental`` or ``modelled``, and
+requests every combination of its data types and intervals for the
+locations, as ``ClimateAPI.get_instrumental()`` or ``get_modelled()`` would.
+
+From the command line::
+
+    python -m wbpy.prefetch manifest.json --cache /data/wbpy.sqlite3
+
+"""
+import argparse
+import collections
+import itertools
+import json
+import sys
+import threading
+
+from . import cache as wbpy_cache
+from . import utils
+from .indicators import IndicatorAPI
+from .climate import ClimateAPI
+
+# ``skipped`` are the URLs that were already fresh, and ``failed`` is a list
+# of ``(url, exception)`` tuples.
+PrefetchResult = collections.namedtuple("PrefetchResult",
+    ["urls", "skipped", "fetched", "failed"])
+
+
+class Prefetcher(object):
+
+    """Download the responses for a workload manifest into the cache.
+
+    :param fetcher:
+        The ``utils.Fetcher`` whose cache gets filled. By default, a new
+        ``Fetcher`` using the default cache.
+
+    :param max_workers:
+        Number of URLs to download at once.
+
+    :param progress:
+        Called as ``progress(done, total, url, status)`` after each URL that
+        needed downloading, where ``status`` is "fetched" or "failed". It may
+        be called from several threads, but never at the same time.
+
+    """
+
+    def __init__(self, fetcher=None, max_workers=utils.DEFAULT_MAX_WORKERS,
+            progress=None):
+        self.fetcher = fetcher if fetcher is not None else utils.Fetcher()
+        self.max_workers = max_workers
+        self.progress = progress
+        self.indicator_api = IndicatorAPI(fetch=self.fetcher)
+        self.climate_api = ClimateAPI(fetch=self.fetcher)
+
+    def plan(self, manifest):
+        """Return the URLs for a manifest, in order and without duplicates.
+
+        :param manifest:
+            A manifest dict, or the path to a JSON manifest file.
+
+        """
+        if not isinstance(manifest, dict):
+            with open(manifest) as f:
+                manifest = json.load(f)
+        urls = itertools.chain(
+            itertools.chain.from_iterable(self._indicator_urls(entry) for
+                entry in manifest.get("indicators", [])),
+            itertools.chain.from_iterable(self._climate_urls(entry) for
+                entry in manifest.get("climate", [])))
+        return list(collections.OrderedDict.fromkeys(urls))
+
+    def run(self, manifest):
+        """Download every URL for a manifest that isn't fresh in the cache,
+        and return a ``PrefetchResult``.
+
+        A URL that fails to download doesn't stop the others; it's listed in
+        ``failed``.
+        """
+        urls = self.plan(manifest)
+        skipped = [url for url in urls if self.fetcher.is_fresh(url)]
+        fresh = set(skipped)
+        stale = [url for url in urls if url not in fresh]
+
+        lock = threading.Lock()
+        done = [0]
+        fetched = []
+        failed = []
+
+        def warm(url):
+            try:
+                self.fetcher.warm(url)
+            except Exception as e:
+                status = "failed"
+                error = e
+            else:
+                status = "fetched"
+                error = None
+            with lock:
+                done[0] += 1
+                if error is None:
+                    fetched.append(url)
+                else:
+                    failed.append((url, error))
+                if self.progress:
+                    self.progress(done[0], len(stale), url, status)
+
+        utils.map_concurrently(warm, stale, self.max_workers)
+        # Report in manifest order, whatever order the downloads finished in.
+        order = dict((url, i) for i, url in enumerate(urls))
+        fetched.sort(key=order.get)
+        failed.sort(key=lambda item: order[item[0]])
+        return PrefetchResult(urls, skipped, fetched, failed)
+
+    def _indicator_urls(self, entry):
+        entry = dict(entry)
+        indicators = entry.pop("indicators")
+        country_groups = entry.pop("country_groups", None) or [None]
+        dates = entry.pop("dates", None) or [None]
+        for indicator, countries, date in itertools.product(indicators,
+                country_groups, dates):
+            kwargs = dict(entry)
+            if date is not None:
+                kwargs["date"] = date
+            for url in self.indicator_api._dataset_urls(indicator, countries,
+                    **kwargs):
+                yield url
+
+    def _climate_urls(self, entry):
+        api = self.climate_api
+        if entry["type"] == "instrumental":
+            clean_args, get_urls = (api._clean_instrumental_args,
+                api._instrumental_urls)
+        elif entry["type"] == "modelled":
+            clean_args, get_urls = api._clean_modelled_args, api._modelled_urls
+        else:
+            raise ValueError("Unknown climate request type %r" %
+                entry["type"])
+        for data_type, interval in itertools.product(entry["data_types"],
+                entry["intervals"]):
+            data_type, interval = clean_args(data_type, interval)
+            for url in get_urls(data_type, interval, entry["locations"]):
+                yield url
+
+
+def _print_progress(done, total, url, status):
+    sys.stderr.write("[{0}/{1}] {2} {3}\n".format(done, total, status, url))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Fill the wbpy cache with the responses for a manifest.")
+    parser.add_argument("manifest", help="Path to a JSON manifest file")
+    parser.add_argument("--cache", help="SQLite cache file to fill, instead "
+        "of the default cache")
+    parser.add_argument("--workers", type=int,
+        default=utils.DEFAULT_MAX_WORKERS,
+        help="Number of URLs to download at once (default: %(default)s)")
+    parser.add_argument("--dry-run", action="store_true",
+        help="List the URLs that would be downloaded, without downloading")
+    parser.add_argument("--quiet", action="store_true",
+        help="Don't report progress")
+    args = parser.parse_args(argv)
+
+    cache = wbpy_cache.SQLiteCache(args.cache) if args.cache else None
+    prefetcher = Prefetcher(utils.Fetcher(cache=cache, memory_cache=False),
+        max_workers=args.workers,
+        progress=None if args.quiet else _print_progress)
+
+    if args.dry_run:
+        for url in prefetcher.plan(args.manifest):
+            if not prefetcher.fetcher.is_fresh(url):
+                print(url)
+        return 0
+
+    result = prefetcher.run(args.manifest)
+    if not args.quiet:
+        sys.stderr.write("{0} URLs: {1} already fresh, {2} fetched, {3} "
+            "failed\n".format(len(result.urls), len(result.skipped),
+                len(result.fetched), len(result.failed)))
+    for url, error in result.failed:
+        sys.stderr.write("Failed: {0} ({1})\n".format(url, error))
+    return 1 if result.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
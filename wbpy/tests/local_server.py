@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import time
+from six.moves import socketserver
+from six.moves.BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serve canned JSON responses over keep-alive HTTP/1.1 connections."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        self.server.headers.append(dict(self.headers.items()))
+        if self.path.startswith("/redirect"):
+            self.send_response(302)
+            self.send_header("Location", "/data")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if self.path.startswith("/slow"):
+            time.sleep(0.2)
+
+        if self.path.startswith("/etag") or self.path.startswith("/new-etag"):
+            if self.headers.get("If-None-Match") == '"v1"':
+                # /new-etag sends new validators with the 304.
+                self.send_response(304)
+                if self.path.startswith("/new-etag"):
+                    self.send_header("ETag", '"v2"')
+                    self.send_header("Last-Modified",
+                        "Tue, 02 Jan 2024 00:00:00 GMT")
+                else:
+                    self.send_header("ETag", '"v1"')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Last-Modified", "Mon, 01 Jan 2024 00:00:00 GMT")
+            body = json.dumps([{"path": self.path}]).encode("utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        body = json.dumps(self.server.responses.get(self.path,
+            [{"path": self.path}])).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalServer(socketserver.ThreadingMixIn, HTTPServer):
+    """HTTP server on a free localhost port, run in a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, responses=None):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), Handler)
+        self.responses = responses or {}
+        self.requests = []
+        self.headers = []
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def url(self, path="/data"):
+        return "http://127.0.0.1:%d%s" % (self.server_address[1], path)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
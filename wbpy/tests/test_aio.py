@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+try:
+    # py2.6
+    import unittest2 as unittest
+except ImportError:
+    # py2.7+
+    import unittest
+
+import mock
+
+import wbpy
+from wbpy.tests.indicator_data import Yearly
+from wbpy.tests.climate_data import InstrumentalMonth
+
+
+class AsyncFetch(object):
+    """Async fetch that serves canned responses and records concurrency."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, url):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return self.responses(url)
+
+
+class TestAsyncIndicatorAPI(unittest.TestCase):
+
+    def test_get_dataset_returns_dataset(self):
+        data = Yearly()
+        api = wbpy.AsyncIndicatorAPI(AsyncFetch(
+            lambda url: json.dumps(data.response)))
+        dataset = asyncio.run(api.get_dataset("SP.POP.TOTL", ["GB", "AR"]))
+        self.assertIsInstance(dataset, wbpy.IndicatorDataset)
+        self.assertEqual(dataset.as_dict(), data.dataset.as_dict())
+        self.assertIn("GBR;ARG", dataset.api_url)
+
+    def test_get_dataset_without_keeping_response(self):
+        data = Yearly()
+        api = wbpy.AsyncIndicatorAPI(AsyncFetch(
+            lambda url: json.dumps(data.response)))
+        dataset = asyncio.run(api.get_dataset("SP.POP.TOTL",
+            keep_response=False))
+        self.assertEqual(dataset.as_dict(), data.dataset.as_dict())
+        self.assertNotIn("keep_response", dataset.api_url)
+
+    def test_country_chunks_merged(self):
+        data = Yearly()
+
+        def responses(url):
+            codes = url.split("countries/")[1].split("/")[0].split(";")
+            rows = [row for row in data.response[1] if
+                wbpy.utils.convert_country_code(row["country"]["id"],
+                    "alpha3") in codes]
+            return json.dumps([data.response[0], rows])
+
+        api = wbpy.AsyncIndicatorAPI(AsyncFetch(responses))
+        # Room for one country code per URL.
+        api.MAX_URL_LENGTH = len(api._dataset_url("X"))
+        dataset = asyncio.run(api.get_dataset("X", list(data.dataset.countries)))
+        self.assertEqual(len(dataset.api_urls), len(data.dataset.countries))
+        self.assertEqual(dataset.as_dict(), data.dataset.as_dict())
+
+    def test_country_chunks_without_data_skipped(self):
+        data = Yearly()
+
+        def responses(url):
+            if "countries/GBR/" in url:
+                return json.dumps([{"page": 0, "pages": 0, "total": 0},
+                    None])
+            return json.dumps(data.response)
+
+        api = wbpy.AsyncIndicatorAPI(AsyncFetch(responses))
+        api.MAX_URL_LENGTH = len(api._dataset_url("X"))
+        dataset = asyncio.run(api.get_dataset("X", ["GB", "AR"]))
+        self.assertEqual(len(dataset.api_urls), 2)
+        self.assertEqual(dataset.as_dict(), data.dataset.as_dict())
+
+    def test_get_datasets_returns_panel(self):
+        data = Yearly()
+
+        def responses(url):
+            indicator = url.split("indicators/")[1].split("?")[0]
+            rows = [dict(row, indicator={"id": indicator, "value": indicator})
+                for row in data.response[1]]
+            return json.dumps([data.response[0], rows])
+
+        fetch = AsyncFetch(responses)
+        api = wbpy.AsyncIndicatorAPI(fetch, max_concurrency=2)
+        panel = asyncio.run(api.get_datasets(["A", "B", "C"]))
+        self.assertIsInstance(panel, wbpy.IndicatorPanel)
+        self.assertEqual(list(panel), ["A", "B", "C"])
+        self.assertEqual(panel["B"].as_dict(), data.dataset.as_dict())
+        self.assertEqual(fetch.max_in_flight, 2)
+
+    def test_get_datasets_skips_indicators_without_data(self):
+        data = Yearly()
+
+        def responses(url):
+            if "indicators/B?" in url:
+                return json.dumps([{"page": 0, "pages": 0, "total": 0},
+                    None])
+            return json.dumps(data.response)
+
+        api = wbpy.AsyncIndicatorAPI(AsyncFetch(responses))
+        panel = asyncio.run(api.get_datasets(["A", "B"]))
+        self.assertEqual(list(panel), [data.dataset.indicator_code])
+
+    def test_pages_requested_concurrently(self):
+        def responses(url):
+            page = int(url.split("&page=")[1]) if "&page=" in url else 1
+            header = {"page": page, "pages": 10}
+            return json.dumps([header, [{"id": str(page), "value": page}]])
+
+        fetch = AsyncFetch(responses)
+        api = wbpy.AsyncIndicatorAPI(fetch, max_concurrency=3)
+        topics = asyncio.run(api.get_topics())
+        self.assertEqual([v["value"] for v in topics.values()],
+            list(range(1, 11)))
+        self.assertEqual(fetch.max_in_flight, 3)
+
+    def test_iter_dataset_rows(self):
+        data = Yearly()
+
+        def responses(url):
+            page = int(url.split("&page=")[1]) if "&page=" in url else 1
+            header = {"page": page, "pages": 2}
+            return json.dumps([header, data.response[1][page - 1::2]])
+
+        async def collect(api):
+            return [row async for row in api.iter_dataset_rows("X",
+                per_page=4)]
+
+        rows = asyncio.run(collect(wbpy.AsyncIndicatorAPI(AsyncFetch(
+            responses))))
+        self.assertEqual(len(rows), len(data.response[1]))
+        as_dict = data.dataset.as_dict()
+        for country, date, value in rows:
+            self.assertEqual(as_dict[country][date], value)
+
+    def test_iter_dataset_rows_parses_pages_incrementally(self):
+        data = Yearly()
+        text = json.dumps(data.response)
+        fetcher = mock.Mock(spec=["fetch_chunks", "fetch_json"])
+        fetcher.fetch_chunks.side_effect = lambda url: iter(
+            [text[i:i + 100] for i in range(0, len(text), 100)])
+        api = wbpy.AsyncIndicatorAPI()
+        api._blocking_fetch = fetcher
+
+        async def collect():
+            return [row async for row in api.iter_dataset_rows("X")]
+
+        rows = asyncio.run(collect())
+        self.assertEqual(len(rows), len(data.response[1]))
+        self.assertEqual(fetcher.fetch_chunks.call_count, 1)
+        self.assertFalse(fetcher.fetch_json.called)
+
+    def test_iter_dataset_rows_chunks_countries(self):
+        data = Yearly()
+        requested = []
+        empty = ["GBR"]
+
+        def responses(url):
+            requested.append(url)
+            codes = url.split("countries/")[1].split("/")[0].split(";")
+            if set(codes) <= set(empty):
+                return json.dumps([{"page": 0, "pages": 0, "total": 0},
+                    None])
+            rows = [row for row in data.response[1] if
+                wbpy.utils.convert_country_code(row["country"]["id"],
+                    "alpha3") in codes]
+            return json.dumps([{"page": 1, "pages": 1}, rows])
+
+        async def collect(api, countries):
+            return [row async for row in api.iter_dataset_rows("X",
+                countries, per_page=4)]
+
+        api = wbpy.AsyncIndicatorAPI(AsyncFetch(responses))
+        # Room for one country code per URL.
+        api.MAX_URL_LENGTH = len(api._dataset_url("X", per_page=4))
+        countries = list(data.dataset.countries)
+        rows = asyncio.run(collect(api, countries))
+        self.assertEqual(len(requested), len(countries))
+        self.assertEqual(requested, api._dataset_urls("X", countries,
+            per_page=4))
+        as_dict = data.dataset.as_dict()
+        self.assertEqual(set(country for country, _, _ in rows),
+            set(countries) - set(["GB"]))
+        for country, date, value in rows:
+            self.assertEqual(as_dict[country][date], value)
+
+        empty.extend(wbpy.utils.convert_country_code(code, "alpha3") for
+            code in countries)
+        self.assertRaises(ValueError, asyncio.run, collect(api, countries))
+
+    def test_default_fetch_uses_running_loop(self):
+        data = Yearly()
+        api = wbpy.AsyncIndicatorAPI()
+        api._blocking_fetch = lambda url: json.dumps(data.response)
+
+        async def get_both():
+            return await asyncio.gather(api.get_dataset("X", ["GB", "AR"]),
+                api.get_dataset("X", ["GB", "AR"], keep_response=False))
+
+        with mock.patch("asyncio.get_event_loop",
+                side_effect=AssertionError("Use get_running_loop()")):
+            datasets = asyncio.run(get_both())
+        for dataset in datasets:
+            self.assertEqual(dataset.as_dict(), data.dataset.as_dict())
+
+    def test_bad_response_raises(self):
+        api = wbpy.AsyncIndicatorAPI(AsyncFetch(
+            lambda url: json.dumps([{"message": "Invalid value"}])))
+        self.assertRaises(ValueError, asyncio.run, api.get_dataset("X"))
+
+
+class TestAsyncClimateAPI(unittest.TestCase):
+
+    def test_get_instrumental_returns_dataset(self):
+        data = InstrumentalMonth()
+        resps = dict((call["url"].split("/")[-1].upper(), call["resp"])
+            for call in data.data)
+        api = wbpy.AsyncClimateAPI(AsyncFetch(
+            lambda url: json.dumps(resps[url.split("/")[-1]])))
+        dataset = asyncio.run(api.get_instrumental("tas", "month",
+            ["GB", "ES"]))
+        self.assertIsInstance(dataset, wbpy.InstrumentalDataset)
+        self.assertEqual(dataset.as_dict(), data.dataset.as_dict())
+
+    def test_get_modelled_respects_concurrency_limit(self):
+        fetch = AsyncFetch(lambda url: "[]")
+        api = wbpy.AsyncClimateAPI(fetch, max_concurrency=4)
+        dataset = asyncio.run(api.get_modelled("pr", "mavg", ["GB"]))
+        self.assertIsInstance(dataset, wbpy.ModelledDataset)
+        self.assertEqual(len(dataset.api_calls), 16)
+        self.assertEqual(fetch.max_in_flight, 4)
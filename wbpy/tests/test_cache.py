@@ -0,0 +1,599 @@
+# -*- coding: utf-8 -*-
+import gc
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+try:
+    # py2.6
+    import unittest2 as unittest
+except ImportError:
+    # py2.7+
+    import unittest
+
+import mock
+from ddt import ddt, data
+
+import wbpy
+from wbpy import cache, utils
+from wbpy.tests.indicator_data import Yearly
+from wbpy.tests.local_server import LocalServer
+
+
+def file_cache(directory, **kwargs):
+    return cache.FileCache(directory, **kwargs)
+
+
+def sqlite_cache(directory, **kwargs):
+    return cache.SQLiteCache(os.path.join(directory, "cache.sqlite3"),
+        **kwargs)
+
+
+@ddt
+class TestCacheBackends(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        # Close any SQLite connections that are only left in reference
+        # cycles, so they don't remove their WAL files during rmtree().
+        gc.collect()
+        shutil.rmtree(self.directory)
+
+    def test_backends_must_implement_interface(self):
+        self.assertRaises(TypeError, cache.BaseCache)
+
+        class GetOnly(cache.BaseCache):
+            def get(self, url):
+                return None
+
+        self.assertRaises(TypeError, GetOnly)
+
+    @data(file_cache, sqlite_cache)
+    def test_get_missing_url(self, make_cache):
+        self.assertIsNone(make_cache(self.directory).get("http://a"))
+
+    @data(file_cache, sqlite_cache)
+    def test_set_and_get(self, make_cache):
+        c = make_cache(self.directory)
+        body = u'["caf\xe9"]'.encode("utf-8")
+        c.set("http://a", body)
+        entry = c.get("http://a")
+        self.assertEqual(entry.body, body)
+        self.assertEqual(entry.ttl, cache.DEFAULT_TTL)
+        self.assertLess(time.time() - entry.fetched_at, 60)
+
+    @data(file_cache, sqlite_cache)
+    def test_validators_stored(self, make_cache):
+        c = make_cache(self.directory)
+        c.set("http://a", b"[]", etag='"abc"',
+            last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+        entry = c.get("http://a")
+        self.assertEqual(entry.etag, '"abc"')
+        self.assertEqual(entry.last_modified, "Mon, 01 Jan 2024 00:00:00 GMT")
+        c.set("http://a", b"[]")
+        self.assertIsNone(c.get("http://a").etag)
+
+    @data(file_cache, sqlite_cache)
+    def test_touch_refreshes_fetch_time(self, make_cache):
+        c = make_cache(self.directory)
+        c.set("http://a", b"[]", fetched_at=time.time() - 2 * 86400)
+        c.touch("http://a")
+        self.assertLess(time.time() - c.get("http://a").fetched_at, 60)
+        self.assertEqual(c.expire(), 0)
+
+    @data(file_cache, sqlite_cache)
+    def test_touch_keeps_validators_not_given(self, make_cache):
+        c = make_cache(self.directory)
+        c.set("http://a", b"[]", etag='"v1"',
+            last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+        c.touch("http://a", etag='"v2"')
+        entry = c.get("http://a")
+        self.assertEqual(entry.etag, '"v2"')
+        self.assertEqual(entry.last_modified, "Mon, 01 Jan 2024 00:00:00 GMT")
+
+    @data(file_cache, sqlite_cache)
+    def test_delete(self, make_cache):
+        c = make_cache(self.directory)
+        c.set("http://a", b"[]")
+        c.delete("http://a")
+        c.delete("http://not-cached")
+        self.assertIsNone(c.get("http://a"))
+
+    @data(file_cache, sqlite_cache)
+    def test_expire_removes_only_expired(self, make_cache):
+        c = make_cache(self.directory)
+        c.set("http://old", b"[]", fetched_at=time.time() - 2 * 86400)
+        c.set("http://new", b"[]")
+        self.assertEqual(c.expire(), 1)
+        self.assertIsNone(c.get("http://old"))
+        self.assertIsNotNone(c.get("http://new"))
+
+    @data(file_cache, sqlite_cache)
+    def test_ttl_stored_per_url(self, make_cache):
+        c = make_cache(self.directory)
+        two_days_ago = time.time() - 2 * 86400
+        c.set("http://short", b"[]", ttl=60)
+        c.set("http://long", b"[]", ttl=7 * 86400, fetched_at=two_days_ago)
+        c.set("http://default", b"[]", fetched_at=two_days_ago)
+        self.assertEqual(c.get("http://short").ttl, 60)
+        self.assertEqual(c.get("http://long").ttl, 7 * 86400)
+        self.assertEqual(c.get("http://default").ttl, cache.DEFAULT_TTL)
+
+        self.assertEqual(c.expire(now=time.time() + 120), 2)
+        self.assertIsNone(c.get("http://short"))
+        self.assertIsNone(c.get("http://default"))
+        self.assertIsNotNone(c.get("http://long"))
+
+    @data(file_cache, sqlite_cache)
+    def test_clear(self, make_cache):
+        c = make_cache(self.directory)
+        c.set("http://a", b"[]")
+        c.set("http://b", b"[]")
+        c.clear()
+        self.assertIsNone(c.get("http://a"))
+        self.assertIsNone(c.get("http://b"))
+
+    @data(file_cache, sqlite_cache)
+    def test_max_entries_evicts_least_recently_used(self, make_cache):
+        c = make_cache(self.directory, max_entries=3)
+        for url in ["http://a", "http://b", "http://c"]:
+            c.set(url, b"[]")
+            time.sleep(0.01)
+        c.get("http://a")
+        c.set("http://d", b"[]")
+        self.assertIsNone(c.get("http://b"))
+        for url in ["http://a", "http://c", "http://d"]:
+            self.assertIsNotNone(c.get(url))
+
+    @data(file_cache, sqlite_cache)
+    def test_max_bytes_evicts_until_within_budget(self, make_cache):
+        body = os.urandom(1000)  # Random, so it doesn't compress.
+        c = make_cache(self.directory, max_bytes=3500)
+        for i in range(5):
+            c.set("http://%d" % i, body)
+            time.sleep(0.01)
+        self.assertIsNone(c.get("http://0"))
+        self.assertIsNone(c.get("http://1"))
+        for i in range(2, 5):
+            self.assertIsNotNone(c.get("http://%d" % i))
+
+    @data(
+        (file_cache, "zlib"), (file_cache, "lzma"),
+        (sqlite_cache, None), (sqlite_cache, "lzma"),
+        )
+    def test_compression_round_trip(self, args):
+        make_cache, compression = args
+        c = make_cache(self.directory, compression=compression)
+        body = json.dumps([{"page": 1}, [Yearly.response[1][0]] * 200])
+        body = body.encode("utf-8")
+        c.set("http://a", body)
+        self.assertEqual(c.get("http://a").body, body)
+
+    def test_file_cache_compressed_entries_are_marked_and_smaller(self):
+        c = file_cache(self.directory, compression="zlib")
+        body = json.dumps([{"page": 1}, [Yearly.response[1][0]] * 200])
+        body = body.encode("utf-8")
+        c.set("http://a", body)
+        with open(os.path.join(self.directory, cache.url_hash("http://a")),
+                "rb") as f:
+            stored = f.read()
+        self.assertTrue(stored.startswith(b"\x00wbpy:zlib\n"))
+        self.assertLess(len(stored) * 5, len(body))
+
+    def test_file_cache_size_includes_validators(self):
+        def disk_bytes():
+            return sum(os.path.getsize(os.path.join(self.directory, name))
+                for name in os.listdir(self.directory))
+
+        c = file_cache(self.directory)
+        for url in ["http://a", "http://b"]:
+            c.set(url, b"[" + b"1" * 200 + b"]", ttl=60, etag='"v1"')
+        c.touch("http://a", etag='"a much longer etag than before"')
+        self.assertEqual(c._index_bytes, disk_bytes())
+        reloaded = file_cache(self.directory)
+        reloaded._load_index()
+        self.assertEqual(reloaded._index_bytes, disk_bytes())
+
+        # The bodies alone would fit.
+        c = file_cache(self.directory, max_bytes=disk_bytes() - 1)
+        c.set("http://b", b"[" + b"1" * 200 + b"]", ttl=60, etag='"v1"')
+        self.assertIsNone(c.get("http://a"))
+        self.assertLessEqual(disk_bytes(), c.max_bytes)
+
+    def test_file_cache_reads_uncompressed_files(self):
+        file_cache(self.directory).set("http://a", b"[1]")
+        c = file_cache(self.directory, compression="zlib")
+        self.assertEqual(c.get("http://a").body, b"[1]")
+
+    @data("zlib", "lzma")
+    def test_file_cache_corrupt_entry_is_a_miss(self, compression):
+        c = file_cache(self.directory, compression=compression)
+        c.set("http://a", b"[1]")
+        path = os.path.join(self.directory, cache.url_hash("http://a"))
+        with open(path, "wb") as f:
+            f.write(cache.FileCache.MARKER + compression.encode("ascii") +
+                b"\nnot compressed")
+        self.assertIsNone(c.get("http://a"))
+        self.assertFalse(os.path.exists(path))
+
+    @data("zlib", "lzma")
+    def test_sqlite_corrupt_entry_is_a_miss(self, compression):
+        c = sqlite_cache(self.directory, compression=compression)
+        c.set("http://a", b"[1]")
+        c._execute("UPDATE responses SET body = ?",
+            (sqlite3.Binary(b"not compressed"),))
+        self.assertIsNone(c.get("http://a"))
+        self.assertEqual(c.totals()[0], 0)
+        c.close()
+
+    def test_unknown_compression_raises(self):
+        self.assertRaises(ValueError, file_cache, self.directory,
+            compression="gzip")
+
+    def test_sqlite_totals_track_replace_and_delete(self):
+        c = sqlite_cache(self.directory)
+        c.set("http://a", b"[1]")
+        c.set("http://a", b"[1]")
+        c.set("http://b", b"[2]")
+        self.assertEqual(c.totals()[0], 2)
+        c.delete("http://a")
+        c.delete("http://b")
+        self.assertEqual(c.totals(), (0, 0))
+
+    def test_sqlite_delete_prefix(self):
+        c = sqlite_cache(self.directory)
+        c.set("http://api/v2/topic?x", b"[]")
+        c.set("http://api/v2/topic?y", b"[]")
+        c.set("http://api/v2/source?x", b"[]")
+        self.assertEqual(c.delete_prefix("http://api/v2/topic"), 2)
+        self.assertIsNotNone(c.get("http://api/v2/source?x"))
+
+    def test_sqlite_cache_is_single_file(self):
+        c = sqlite_cache(self.directory)
+        for i in range(20):
+            c.set("http://a/%d" % i, b"[]")
+        names = [n for n in os.listdir(self.directory)
+            if not n.endswith(("-wal", "-shm"))]
+        self.assertEqual(names, ["cache.sqlite3"])
+
+
+class TestCacheFetchedAt(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_backends(self):
+        for backend in [cache.FileCache(self.directory),
+                cache.SQLiteCache(os.path.join(self.directory, "c.sqlite3"))]:
+            self.assertIsNone(backend.fetched_at("http://a"))
+            backend.set("http://a", b"[]", fetched_at=1000)
+            self.assertEqual(backend.fetched_at("http://a"), 1000)
+
+    def test_fetcher_is_fresh(self):
+        backend = cache.SQLiteCache(os.path.join(self.directory, "c.sqlite3"))
+        fetcher = utils.Fetcher(cache=backend)
+        self.assertFalse(fetcher.is_fresh("http://a"))
+        backend.set("http://a", b"[]")
+        self.assertTrue(fetcher.is_fresh("http://a"))
+        backend.set("http://a", b"[]", fetched_at=time.time() - 2 * 86400)
+        self.assertFalse(fetcher.is_fresh("http://a"))
+
+
+@ddt
+class TestFetchWithCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = sqlite_cache(self.directory)
+        self.server = LocalServer()
+
+    def tearDown(self):
+        self.server.stop()
+        gc.collect()
+        shutil.rmtree(self.directory)
+
+    def test_second_fetch_served_from_cache(self):
+        url = self.server.url()
+        first = utils.fetch(url, cache=self.cache, memory_cache=False)
+        second = utils.fetch(url, cache=self.cache, memory_cache=False)
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_expired_entry_is_refetched(self):
+        url = self.server.url()
+        self.cache.set(url, b"[]", fetched_at=time.time() - 2 * 86400)
+        self.assertEqual(utils.fetch(url, cache=self.cache,
+            memory_cache=False), '[{"path": "/data"}]')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_expired_entry_is_revalidated(self):
+        url = self.server.url("/etag")
+        utils.fetch(url, cache=self.cache, memory_cache=False)
+        entry = self.cache.get(url)
+        self.cache.set(url, entry.body, fetched_at=time.time() - 2 * 86400,
+            etag=entry.etag, last_modified=entry.last_modified)
+
+        res = utils.fetch(url, cache=self.cache, memory_cache=False)
+        self.assertEqual(res, '[{"path": "/etag"}]')
+        self.assertEqual(self.server.headers[1]["If-None-Match"], '"v1"')
+        self.assertIn("If-Modified-Since", self.server.headers[1])
+        self.assertLess(time.time() - self.cache.get(url).fetched_at, 60)
+
+    @data(file_cache, sqlite_cache)
+    def test_revalidation_stores_new_validators(self, make_cache):
+        c = make_cache(self.directory + "/backend")
+        url = self.server.url("/new-etag")
+        c.set(url, b"[1]", ttl=3600, fetched_at=time.time() - 2 * 86400,
+            etag='"v1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+
+        self.assertEqual(utils.fetch(url, cache=c, memory_cache=False), "[1]")
+        self.assertEqual(self.server.headers[0]["If-None-Match"], '"v1"')
+        entry = c.get(url)
+        self.assertEqual(entry.etag, '"v2"')
+        self.assertEqual(entry.last_modified, "Tue, 02 Jan 2024 00:00:00 GMT")
+        self.assertEqual(entry.ttl, 3600)
+        self.assertLess(time.time() - entry.fetched_at, 60)
+
+    def test_no_conditional_request_without_validators(self):
+        url = self.server.url()
+        self.cache.set(url, b"[]", fetched_at=time.time() - 2 * 86400)
+        utils.fetch(url, cache=self.cache, memory_cache=False)
+        self.assertNotIn("If-None-Match", self.server.headers[0])
+
+    def test_fetcher_uses_given_cache(self):
+        fetcher = utils.Fetcher(cache=self.cache, memory_cache=False)
+        fetcher(self.server.url())
+        self.assertIsNotNone(self.cache.get(self.server.url()))
+
+    def test_fetch_chunks_uses_cache(self):
+        url = self.server.url()
+        memory = cache.MemoryCache()
+        chunks = list(utils.fetch_chunks(url, cache=self.cache,
+            memory_cache=memory, chunk_size=4))
+        self.assertEqual("".join(chunks), '[{"path": "/data"}]')
+        self.assertEqual(len(chunks), 5)
+        self.assertIsNotNone(self.cache.get(url))
+        # The response text isn't built for the memory cache.
+        self.assertIsNone(memory.get(url))
+
+        chunks = utils.fetch_chunks(url, cache=self.cache, memory_cache=False)
+        self.assertEqual("".join(chunks), '[{"path": "/data"}]')
+        self.assertEqual(len(self.server.requests), 1)
+
+
+class TestOfflineFetch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = sqlite_cache(self.directory)
+        self.server = LocalServer()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def test_expired_entry_is_served_and_kept(self):
+        url = self.server.url()
+        self.cache.set(url, b"[]", fetched_at=time.time() - 30 * 86400)
+        self.assertEqual(utils.fetch(url, cache=self.cache,
+            memory_cache=False, offline=True), "[]")
+        self.assertEqual(self.server.requests, [])
+        self.assertEqual(self.cache.get(url).body, b"[]")
+
+    def test_miss_raises(self):
+        url = self.server.url()
+        with self.assertRaises(wbpy.CacheMissError) as cm:
+            utils.fetch(url, cache=self.cache, memory_cache=False,
+                offline=True)
+        self.assertEqual(cm.exception.url, url)
+        self.assertIsInstance(cm.exception, IOError)
+        with self.assertRaises(cache.CacheMissError):
+            list(utils.fetch_chunks(url, cache=self.cache,
+                memory_cache=False, offline=True))
+        self.assertEqual(self.server.requests, [])
+
+    def test_environment_variable(self):
+        url = self.server.url()
+        fetcher = utils.Fetcher(cache=self.cache, memory_cache=False)
+        for value in ["1", "true"]:
+            with mock.patch.dict(os.environ, {"WBPY_OFFLINE": value}):
+                with self.assertRaises(cache.CacheMissError):
+                    fetcher(url)
+        # offline=False takes precedence over the environment.
+        fetcher = utils.Fetcher(cache=self.cache, memory_cache=False,
+            offline=False)
+        with mock.patch.dict(os.environ, {"WBPY_OFFLINE": "1"}):
+            fetcher(url)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_api_offline(self):
+        api = wbpy.IndicatorAPI(offline=True)
+        api.fetch.cache = self.cache
+        api.fetch.memory_cache = False
+        url = api._dataset_url("SP.POP.TOTL", ["GB"], date="2010:2012")
+        self.cache.set(url, json.dumps(Yearly.response).encode("utf-8"),
+            fetched_at=time.time() - 30 * 86400)
+        dataset = api.get_dataset("SP.POP.TOTL", ["GB"], date="2010:2012")
+        self.assertEqual(dataset.api_url, url)
+        self.assertTrue(wbpy.ClimateAPI(offline=True).fetch.offline)
+
+
+class TestMemoryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = sqlite_cache(self.directory)
+        self.server = LocalServer()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def test_memory_hit_skips_backend(self):
+        memory = cache.MemoryCache()
+        url = self.server.url()
+        utils.fetch(url, cache=self.cache, memory_cache=memory)
+        self.cache.get = mock.Mock(side_effect=AssertionError)
+        self.assertEqual(utils.fetch(url, cache=self.cache,
+            memory_cache=memory), '[{"path": "/data"}]')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_backend_hit_fills_memory(self):
+        memory = cache.MemoryCache()
+        self.cache.set("http://a", b"[1]")
+        utils.fetch("http://a", cache=self.cache, memory_cache=memory)
+        self.assertEqual(memory.get(utils._memory_key("http://a", self.cache,
+            None)), "[1]")
+
+    def test_not_shared_between_backends(self):
+        memory = cache.MemoryCache()
+        url = self.server.url()
+        other = sqlite_cache(self.directory + "/other")
+        self.addCleanup(other.close)
+        utils.fetch(url, cache=self.cache, memory_cache=memory)
+        utils.fetch(url, cache=other, memory_cache=memory)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_expires_with_backend_ttl(self):
+        memory = cache.MemoryCache()
+        url = self.server.url()
+        fetched_at = time.time() - 2 * cache.DEFAULT_TTL
+        self.cache.set(url, b"[1]", fetched_at=fetched_at)
+        long_ttl = cache.TTLPolicy(default=3 * cache.DEFAULT_TTL)
+        self.assertEqual(utils.fetch(url, cache=self.cache,
+            memory_cache=memory, ttl_policy=long_ttl), "[1]")
+        key = utils._memory_key(url, self.cache, long_ttl)
+        self.assertLessEqual(memory._entries[key][0],
+            fetched_at + 3 * cache.DEFAULT_TTL)
+
+        # The entry is stale with the default TTL, so isn't served from
+        # memory.
+        self.assertEqual(utils.fetch(url, cache=self.cache,
+            memory_cache=memory), '[{"path": "/data"}]')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_not_held_past_backend_ttl(self):
+        memory = cache.MemoryCache()
+        fetched_at = time.time() - 50
+        self.cache.set("http://a", b"[1]", fetched_at=fetched_at)
+        policy = cache.TTLPolicy(default=60)
+        utils.fetch("http://a", cache=self.cache, memory_cache=memory,
+            ttl_policy=policy)
+        key = utils._memory_key("http://a", self.cache, policy)
+        # Sooner than the memory cache's own TTL of 300 seconds.
+        self.assertEqual(memory._entries[key][0], fetched_at + 60)
+
+    def test_shared_between_api_instances(self):
+        url = self.server.url()
+        with mock.patch("wbpy.cache.MEMORY_CACHE", cache.MemoryCache()):
+            wbpy.IndicatorAPI(fetch=utils.Fetcher(cache=self.cache)).fetch(url)
+            other = wbpy.IndicatorAPI(fetch=utils.Fetcher(cache=self.cache))
+            self.cache.get = mock.Mock(side_effect=AssertionError)
+            other.fetch(url)
+
+    def test_parsed_json_is_kept(self):
+        memory = cache.MemoryCache(parse_json=True)
+        url = self.server.url()
+        first = utils.fetch_json(url, cache=self.cache, memory_cache=memory)
+        second = utils.fetch_json(url, cache=self.cache, memory_cache=memory)
+        self.assertIs(first, second)
+
+    def test_ttl(self):
+        memory = cache.MemoryCache(ttl=0)
+        memory.set("http://a", "[]")
+        self.assertIsNone(memory.get("http://a"))
+
+    def test_size_limits(self):
+        memory = cache.MemoryCache(max_entries=2, max_bytes=200)
+        memory.set("http://a", "[1]")
+        memory.set("http://b", "[2]")
+        memory.get("http://a")
+        memory.set("http://c", "[3]")
+        self.assertIsNone(memory.get("http://b"))
+        self.assertEqual(memory.get("http://a"), "[1]")
+        memory.set("http://d", "[" + "4" * 200 + "]")
+        self.assertIsNone(memory.get("http://d"))
+
+    def test_max_bytes_counts_memory_not_characters(self):
+        ascii_text = "a" * 100
+        memory = cache.MemoryCache(max_bytes=sys.getsizeof(ascii_text))
+        memory.set("http://a", ascii_text)
+        self.assertEqual(memory.get("http://a"), ascii_text)
+        memory.set("http://b", u"\u20ac" * 100)
+        self.assertIsNone(memory.get("http://b"))
+        self.assertEqual(memory.get("http://a"), ascii_text)
+
+    def test_disabled(self):
+        url = self.server.url()
+        utils.fetch(url, cache=self.cache, memory_cache=False)
+        utils.fetch(url, cache=self.cache, check_cache=False,
+            memory_cache=False)
+        self.assertEqual(len(self.server.requests), 2)
+
+
+@ddt
+class TestTTLPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = cache.TTLPolicy()
+        self.api = wbpy.IndicatorAPI()
+        self.climate_api = wbpy.ClimateAPI()
+
+    def indicator_data_url(self, rest_url, api_ids=None, **kwargs):
+        return self.api._indicator_data_url({"rest_url": rest_url}, api_ids,
+            **kwargs)
+
+    @data("topic", "source", "region", "incomelevel", "lendingtype")
+    def test_reference_lists_cached_for_a_month(self, rest_url):
+        for url in [self.indicator_data_url(rest_url),
+                self.indicator_data_url(rest_url, [1, 2], language="fr")]:
+            self.assertEqual(self.policy.ttl_for(url), 30 * cache.DEFAULT_TTL)
+
+    def test_indicators_by_source_not_matched_as_sources(self):
+        url = self.indicator_data_url("indicator", source=15)
+        self.assertEqual(self.policy.ttl_for(url), cache.DEFAULT_TTL)
+
+    def test_instrumental_cached_for_a_year(self):
+        url = self.climate_api._instrumental_urls("pr", "year", ["GB"])[0]
+        self.assertEqual(self.policy.ttl_for(url), 365 * cache.DEFAULT_TTL)
+
+    def test_modelled_uses_default(self):
+        url = self.climate_api._modelled_urls("pr", "mavg", ["GB"])[0]
+        self.assertEqual(self.policy.ttl_for(url), cache.DEFAULT_TTL)
+
+    def test_most_recent_value_datasets_cached_briefly(self):
+        url = self.api._dataset_url("SP.POP.TOTL", ["GB"])
+        self.assertEqual(self.policy.ttl_for(url), cache.DEFAULT_TTL / 4)
+        url = self.api._dataset_url("SP.POP.TOTL", ["GB"], mrv=10)
+        self.assertEqual(self.policy.ttl_for(url), cache.DEFAULT_TTL)
+
+    def test_added_rules_take_precedence(self):
+        url = self.api._dataset_url("SP.POP.TOTL", ["GB"], date="2000")
+        self.policy.add("get_dataset", 60)
+        self.policy.add(r"SP\.POP\.TOTL", 120)
+        self.assertEqual(self.policy.ttl_for(url), 120)
+
+    def test_custom_rules_and_default(self):
+        policy = cache.TTLPolicy([("get_countries", 5)], default=10)
+        self.assertEqual(policy.ttl_for(self.indicator_data_url("country")),
+            5)
+        self.assertEqual(policy.ttl_for(self.indicator_data_url("topic")), 10)
+
+    def test_fetch_uses_policy(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        c = sqlite_cache(directory)
+        url = "http://127.0.0.1:1/never-requested"
+        c.set(url, b"[]", fetched_at=time.time() - 2 * cache.DEFAULT_TTL)
+        policy = cache.TTLPolicy([("never-requested", 3 * cache.DEFAULT_TTL)])
+        fetcher = utils.Fetcher(cache=c, memory_cache=False,
+            ttl_policy=policy)
+        self.assertEqual(fetcher(url), "[]")
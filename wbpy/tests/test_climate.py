@@ -1,5 +1,11 @@
 # -*- coding: utf-8 -*-
 import datetime
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
 try:
     # py2.6
     import unittest2 as unittest
@@ -8,6 +14,14 @@ except ImportError:
     import unittest
 
 from ddt import ddt, data
+try:
+    import pandas
+except ImportError:
+    pandas = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
 import wbpy
 from wbpy.tests.climate_data import (
@@ -232,6 +246,92 @@ class TestModelledModelDictFn(unittest.TestCase):
         self.assertEqual(res, 12.463586228230714)
 
 
+@ddt
+@unittest.skipIf(pandas is None, "pandas not installed")
+class TestDatasetFrames(unittest.TestCase):
+
+    def test_instrumental_month_frame(self):
+        frame = InstrumentalMonth().dataset.to_frame(wide=True)
+        self.assertEqual(frame.index.name, "month")
+        self.assertEqual(list(frame.index), list(range(1, 13)))
+        self.assertEqual(frame.loc[4, "GB"], 7.046495)
+
+    @data(InstrumentalYear(), InstrumentalDecade())
+    def test_instrumental_frame_matches_as_dict(self, data):
+        frame = data.dataset.to_frame()
+        self.assertEqual(frame["region"].dtype, "category")
+        self.assertIsInstance(frame.index, pandas.DatetimeIndex)
+        results = data.dataset.as_dict(use_datetime=True)
+        self.assertEqual(len(frame), sum(len(r) for r in results.values()))
+        for date, row in frame.iterrows():
+            self.assertEqual(row["value"], results[row["region"]][date.date()])
+
+    def test_instrumental_period_index(self):
+        frame = InstrumentalYear().dataset.to_frame(wide=True, period=True)
+        self.assertIsInstance(frame.index, pandas.PeriodIndex)
+        self.assertEqual(frame.loc[pandas.Period("1902", "Y"), "BR"], 25.09181)
+
+    @data(ModelledVarAANOM(), ModelledStat())
+    def test_modelled_frame_matches_as_dict(self, data):
+        results = data.dataset.as_dict(sres="b1", use_datetime=True)
+        frame = data.dataset.to_frame(sres="b1")
+        self.assertEqual(frame["gcm"].dtype, "category")
+        for key, row in frame.iterrows():
+            if isinstance(key, tuple):
+                date, month = key
+                expected = results[row["gcm"]][row["region"]][date.date()][
+                    month - 1]
+            else:
+                expected = results[row["gcm"]][row["region"]][key.date()]
+            self.assertEqual(row["value"], expected)
+
+    def test_modelled_wide_frame(self):
+        data = ModelledVarMAVG()
+        results = data.dataset.as_dict()
+        frame = data.dataset.to_frame(wide=True)
+        self.assertEqual(frame.index.names, ["date", "month"])
+        self.assertEqual(frame.columns.names, ["gcm", "region"])
+        self.assertEqual(frame.loc[(pandas.Timestamp("2039"), 1),
+            ("bccr_bcm2_0", "BR")], results["bccr_bcm2_0"]["BR"]["2039"][0])
+
+
+@ddt
+@unittest.skipIf(pyarrow is None, "pyarrow not installed")
+class TestModelledArrow(unittest.TestCase):
+
+    def test_table_schema(self):
+        table = ModelledVarAANOM().dataset.to_arrow()
+        self.assertEqual(table.column_names,
+            ["gcm", "region", "period", "sres", "month", "value"])
+        self.assertEqual(table.column("month").null_count, table.num_rows)
+        self.assertEqual(set(table.column("sres").to_pylist()),
+            set(["a2", "b1"]))
+
+    def test_monthly_rows(self):
+        table = ModelledVarMAVG().dataset.to_arrow()
+        self.assertEqual(table.column("month").to_pylist()[:13],
+            list(range(1, 13)) + [1])
+
+    @data(ModelledVarMAVG, ModelledVarAANOM, ModelledStat)
+    def test_parquet_round_trip(self, data_class):
+        dataset = data_class().dataset
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "dataset.parquet")
+        dataset.to_parquet(path)
+
+        loaded = wbpy.ModelledDataset.from_parquet(path)
+        for sres in ["a2", "b1"]:
+            self.assertEqual(loaded.as_dict(sres=sres),
+                dataset.as_dict(sres=sres))
+        self.assertEqual(loaded.dates(), dataset.dates())
+        self.assertEqual(loaded.gcms, dataset.gcms)
+        self.assertEqual(loaded.data_type, dataset.data_type)
+        self.assertEqual(loaded.interval, dataset.interval)
+        self.assertEqual(loaded.api_call_date, dataset.api_call_date)
+        self.assertTrue(loaded.to_arrow().equals(dataset.to_arrow()))
+
+
 class TestClimateAPI(unittest.TestCase):
     def setUp(self):
         self.api = wbpy.ClimateAPI()
@@ -314,6 +414,62 @@ class TestModelledFn(TestClimateAPI):
         self.assertIn("302", regions)
 
 
+class TestModelledFanOut(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def fetch(self, url):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(random.random() / 100)
+        with self.lock:
+            self.in_flight -= 1
+        return "[]"
+
+    def test_api_calls_order_is_deterministic(self):
+        api = wbpy.ClimateAPI(fetch=self.fetch, max_workers=8)
+        locs = ["GB", "FR", 302]
+        dataset = api.get_modelled("pr", "mavg", locs)
+        expected = api._modelled_urls("pr", "mavg", locs)
+        self.assertEqual(len(expected), 48)
+        self.assertEqual([call["url"] for call in dataset.api_calls],
+            expected)
+
+    def test_default_max_workers_shared_with_indicator_api(self):
+        self.assertEqual(wbpy.ClimateAPI().max_workers,
+            wbpy.IndicatorAPI().max_workers)
+        self.assertEqual(wbpy.ClimateAPI().max_workers,
+            wbpy.utils.DEFAULT_MAX_WORKERS)
+
+    def test_max_workers_limits_requests_in_flight(self):
+        # The first three requests only return once all three are in
+        # flight, so this fails (rather than passing by luck) if the
+        # requests aren't made concurrently.
+        barrier = threading.Barrier(3, timeout=10)
+        calls = []
+
+        def fetch(url):
+            with self.lock:
+                calls.append(url)
+                first = len(calls) <= 3
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            if first:
+                barrier.wait()
+            with self.lock:
+                self.in_flight -= 1
+            return "[]"
+
+        api = wbpy.ClimateAPI(fetch=fetch, max_workers=3)
+        api.get_modelled("tas", "aavg", ["GB", "FR"])
+        self.assertEqual(len(calls), 32)
+        self.assertEqual(self.max_in_flight, 3)
+
+
 class TestLocationCodes(TestClimateAPI):
     def test_alpha2_codes_work_as_location_arg(self):
         locs = ["GB"]
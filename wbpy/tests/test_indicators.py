@@ -1,5 +1,11 @@
 # -*- coding: utf-8 -*-
 import datetime
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
 try:
     # py2.6
     import unittest2 as unittest
@@ -7,9 +13,23 @@ except ImportError:
     # py2.7+
     import unittest
 
+import mock
 from ddt import ddt, data
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import pandas
+except ImportError:
+    pandas = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
 import wbpy
+from wbpy import utils
 from wbpy.tests.indicator_data import Yearly, Monthly, Quarterly
 
 @ddt
@@ -169,6 +189,206 @@ class TestIndicatorDatasetDictFn(unittest.TestCase):
                 100.18916509029)
 
 
+def make_dataset(rows):
+    """Build a dataset from ``(country, date, value)`` tuples."""
+    response = [{"page": 1, "pages": 1}, [dict(
+        indicator={"id": "X", "value": "X name"},
+        country={"id": country, "value": country + " name"},
+        date=date, value=value) for country, date, value in rows]]
+    return wbpy.IndicatorDataset(response)
+
+
+class TestIndicatorDatasetColumns(unittest.TestCase):
+
+    def make_dataset(self, rows):
+        return make_dataset(rows)
+
+    def test_accessors_dont_reparse_response(self):
+        data = Yearly()
+        expected = data.dataset.as_dict()
+        # Replace the rows rather than clearing them, as the fixture's
+        # response is shared between tests.
+        data.dataset.api_response = [data.response[0], []]
+        self.assertEqual(data.dataset.as_dict(), expected)
+        self.assertEqual(data.dataset.dates(), ["2011", "2012"])
+
+    def test_missing_values_are_none(self):
+        dataset = self.make_dataset([("GB", "2010", None), ("GB", "2011", ""),
+            ("GB", "2012", "1.5")])
+        self.assertEqual(dataset.as_dict(),
+            {"GB": {"2010": None, "2011": None, "2012": 1.5}})
+
+    def test_first_value_for_country_and_date_is_used(self):
+        dataset = self.make_dataset([("GB", "2010", "1"), ("FR", "2010", "3"),
+            ("GB", "2010", "2")])
+        self.assertEqual(dataset.as_dict(),
+            {"GB": {"2010": 1.0}, "FR": {"2010": 3.0}})
+
+    def test_duplicate_tracking_is_compact(self):
+        rows = [(c, str(y), "1") for c in ["GB", "FR", "ES"]
+            for y in range(1960, 2020)]
+        columns = self.make_dataset(rows + rows[:10])._columns
+        self.assertEqual(len(columns.values), 180)
+        # One flag per country and date, rather than an object per row.
+        self.assertEqual(sorted(len(flags) for flags in
+            columns._seen.values()), [60, 60, 60])
+
+    def test_panel_keeps_same_country_and_date_for_each_indicator(self):
+        rows = [dict(indicator={"id": code, "value": code},
+            country={"id": "GB", "value": "GB name"}, date="2010",
+            value=value) for code, value in [("A", "1"), ("B", "2"),
+                ("A", "3")]]
+        panel = wbpy.IndicatorPanel.from_rows(rows)
+        self.assertEqual(panel.as_dict(), {"A": {"GB": {"2010": 1.0}},
+            "B": {"GB": {"2010": 2.0}}})
+
+    def test_dates_sorted_and_distinct(self):
+        dataset = self.make_dataset([("GB", "2012", "1"), ("GB", "2010", "1"),
+            ("FR", "2011", "1"), ("FR", "2012", "1")])
+        self.assertEqual(dataset.dates(), ["2010", "2011", "2012"])
+
+    def test_each_date_converted_to_datetime_once(self):
+        rows = [(c, str(y), "1") for c in ["GB", "FR", "ES"]
+            for y in range(1960, 2020)]
+        dataset = self.make_dataset(rows)
+        convert = utils.worldbank_date_to_datetime
+        with mock.patch("wbpy.utils.worldbank_date_to_datetime",
+                side_effect=convert) as convert_fn:
+            dates = dataset.dates(use_datetime=True)
+            dataset.dates(use_datetime=True)
+            dataset.as_dict(use_datetime=True)
+        self.assertEqual(convert_fn.call_count, 60)
+        self.assertEqual(dates[0], datetime.date(1960, 1, 1))
+        self.assertEqual(len(dates), 60)
+
+    def test_dates_returns_new_list(self):
+        dataset = self.make_dataset([("GB", "2010", "1")])
+        dataset.dates().append("2011")
+        self.assertEqual(dataset.dates(), ["2010"])
+
+    def test_as_dict_returns_new_dicts(self):
+        dataset = self.make_dataset([("GB", "2010", "1")])
+        dataset.as_dict()["GB"]["2010"] = 5
+        self.assertEqual(dataset.as_dict(), {"GB": {"2010": 1.0}})
+
+
+@unittest.skipIf(numpy is None, "numpy not installed")
+class TestIndicatorDatasetNumpy(unittest.TestCase):
+
+    def test_matrix_matches_as_dict(self):
+        dataset = Yearly().dataset
+        values, countries, dates = dataset.to_numpy()
+        self.assertEqual(values.dtype, numpy.float64)
+        self.assertEqual(values.shape, (len(countries), len(dates)))
+        self.assertEqual(list(dates), dataset.dates())
+        as_dict = dataset.as_dict()
+        for i, country in enumerate(countries):
+            for j, date in enumerate(dates):
+                self.assertEqual(values[i, j], as_dict[country][date])
+
+    def test_labels_sorted_and_missing_values_nan(self):
+        dataset = make_dataset([("GB", "2012", "1"), ("FR", "2010", "2"),
+            ("GB", "2010", None), ("FR", "2010", "3")])
+        values, countries, dates = dataset.to_numpy()
+        self.assertEqual(list(countries), ["FR", "GB"])
+        self.assertEqual(list(dates), ["2010", "2012"])
+        numpy.testing.assert_array_equal(values,
+            [[2.0, numpy.nan], [numpy.nan, 1.0]])
+
+    def test_datetime_labels(self):
+        dataset = make_dataset([("GB", "2012M02", "1"), ("GB", "2011M12", "2")])
+        values, countries, dates = dataset.to_numpy(use_datetime=True)
+        self.assertEqual(dates.dtype, numpy.dtype("datetime64[D]"))
+        self.assertEqual(list(dates.astype(object)),
+            [datetime.date(2011, 12, 1), datetime.date(2012, 2, 1)])
+        numpy.testing.assert_array_equal(values, [[2.0, 1.0]])
+
+    def test_missing_numpy_raises_import_error(self):
+        with mock.patch.dict("sys.modules", {"numpy": None}):
+            with self.assertRaises(ImportError) as cm:
+                make_dataset([("GB", "2010", "1")]).to_numpy()
+        self.assertIn("wbpy[numpy]", str(cm.exception))
+
+
+@unittest.skipIf(pandas is None, "pandas not installed")
+class TestIndicatorDatasetFrame(unittest.TestCase):
+
+    def test_long_frame(self):
+        dataset = make_dataset([("GB", "2011", "2"), ("FR", "2010", "3"),
+            ("GB", "2010", "1"), ("FR", "2011", None)])
+        frame = dataset.to_frame()
+        self.assertIsInstance(frame.index, pandas.DatetimeIndex)
+        self.assertEqual(frame.index.name, "date")
+        self.assertEqual(frame["country"].dtype, "category")
+        self.assertEqual(list(frame["country"]), ["FR", "FR", "GB", "GB"])
+        self.assertEqual(list(frame.index.year), [2010, 2011, 2010, 2011])
+        numpy.testing.assert_array_equal(frame["value"],
+            [3.0, numpy.nan, 1.0, 2.0])
+
+    def test_wide_frame_matches_as_dict(self):
+        dataset = Yearly().dataset
+        frame = dataset.to_frame(wide=True)
+        as_dict = dataset.as_dict(use_datetime=True)
+        self.assertEqual(sorted(frame.columns), sorted(as_dict))
+        for country, values in as_dict.items():
+            for date, value in values.items():
+                self.assertEqual(frame.loc[pandas.Timestamp(date), country],
+                    value)
+
+    def test_period_index(self):
+        frame = Monthly().dataset.to_frame(period=True)
+        self.assertIsInstance(frame.index, pandas.PeriodIndex)
+        self.assertEqual(frame.index.freqstr, "M")
+        dataset = Quarterly().dataset
+        frame = dataset.to_frame(wide=True, period=True)
+        self.assertEqual(frame.index.freqstr, "Q-DEC")
+        self.assertEqual([str(p) for p in frame.index], dataset.dates())
+
+
+@ddt
+@unittest.skipIf(pyarrow is None, "pyarrow not installed")
+class TestIndicatorDatasetArrow(unittest.TestCase):
+
+    def test_table_schema(self):
+        table = Yearly().dataset.to_arrow()
+        self.assertEqual(table.column_names,
+            ["indicator", "country", "date", "value"])
+        self.assertTrue(pyarrow.types.is_dictionary(
+            table.schema.field("country").type))
+        self.assertEqual(table.schema.field("value").type, pyarrow.float64())
+
+    def test_missing_values_are_null(self):
+        dataset = make_dataset([("GB", "2010", None), ("GB", "2011", "2")])
+        table = dataset.to_arrow()
+        self.assertEqual(table.column("value").to_pylist(), [None, 2.0])
+        loaded = wbpy.IndicatorDataset.from_arrow(table)
+        self.assertEqual(loaded.as_dict(), {"GB": {"2010": None, "2011": 2.0}})
+
+    @data(Yearly, Monthly, Quarterly)
+    def test_parquet_round_trip(self, data_class):
+        dataset = data_class().dataset
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "dataset.parquet")
+        dataset.to_parquet(path)
+
+        loaded = wbpy.IndicatorDataset.from_parquet(path)
+        self.assertEqual(loaded.as_dict(), dataset.as_dict())
+        self.assertEqual(loaded.dates(), dataset.dates())
+        self.assertEqual(loaded.countries, dataset.countries)
+        self.assertEqual(loaded.indicator_code, dataset.indicator_code)
+        self.assertEqual(loaded.indicator_name, dataset.indicator_name)
+        self.assertEqual(loaded.api_url, dataset.api_url)
+        self.assertEqual(loaded.api_call_date, dataset.api_call_date)
+
+    def test_loaded_dataset_builds_api_response(self):
+        dataset = Yearly().dataset
+        loaded = wbpy.IndicatorDataset.from_arrow(dataset.to_arrow())
+        rebuilt = wbpy.IndicatorDataset(loaded.api_response)
+        self.assertEqual(rebuilt.as_dict(), dataset.as_dict())
+        self.assertEqual(rebuilt.countries, dataset.countries)
+
+
 class TestIndicatorAPI(unittest.TestCase):
     def setUp(self):
         self.api = wbpy.IndicatorAPI()
@@ -316,6 +536,310 @@ class TestGetDatasetFn(TestIndicatorAPI):
                 mrv="2", frequency="M")
         self.assertRaises(ValueError, request_with_no_data)
 
+
+class TestPagedResponses(unittest.TestCase):
+
+    def paged_fetch(self, pages):
+        requested = []
+        lock = threading.Lock()
+
+        def fetch(url):
+            match = re.search(r"&page=(\d+)$", url)
+            page = int(match.group(1)) if match else 1
+            with lock:
+                requested.append(url)
+            header = {"page": page, "pages": pages, "per_page": "1"}
+            return json.dumps([header, [{"id": str(page), "n": page}]])
+        return fetch, requested
+
+    def test_pages_concatenated_in_order(self):
+        fetch, requested = self.paged_fetch(20)
+        api = wbpy.IndicatorAPI(fetch=fetch, max_workers=8)
+        results = api.get_topics()
+        self.assertEqual(len(results), 20)
+        self.assertEqual([v["n"] for v in results.values()],
+            list(range(1, 21)))
+        # Every page URL only has its own page number.
+        self.assertEqual(len(requested), 20)
+        self.assertTrue(all(url.count("&page=") == 1 for url in requested[1:]))
+
+    def test_many_pages_dont_hit_recursion_limit(self):
+        fetch, requested = self.paged_fetch(2000)
+        api = wbpy.IndicatorAPI(fetch=fetch)
+        self.assertEqual(len(api.get_topics()), 2000)
+
+
+class TestGetDatasets(unittest.TestCase):
+
+    indicators = ["A", "B", "C"]
+
+    def setUp(self):
+        self.requested = []
+        self.lock = threading.Lock()
+        self.api = wbpy.IndicatorAPI(fetch=self.fetch)
+
+    def fetch(self, url):
+        with self.lock:
+            self.requested.append(url)
+        indicator = re.search(r"indicators/([^?]+)\?", url).group(1)
+        if indicator == "EMPTY":
+            return json.dumps([{"page": 0, "pages": 0, "per_page": "10000",
+                "total": 0}, None])
+        response = Yearly().response
+        rows = []
+        for row in response[1]:
+            value = row["value"]
+            # Give each indicator some of its own values.
+            if indicator == "B" and row["country"]["id"] == "GB":
+                value = None
+            rows.append(dict(row, value=value,
+                indicator={"id": indicator, "value": indicator + " name"}))
+        return json.dumps([response[0], rows])
+
+    def test_panel_matches_datasets(self):
+        panel = self.api.get_datasets(self.indicators, ["GB", "AR"], mrv=2)
+        self.assertIsInstance(panel, wbpy.IndicatorPanel)
+        self.assertEqual(list(panel), self.indicators)
+        self.assertEqual(panel.indicators["B"], "B name")
+        self.assertEqual(len(self.requested), 3)
+        self.assertEqual(sorted(panel.api_urls), sorted(self.requested))
+
+        as_dict = panel.as_dict()
+        for indicator in self.indicators:
+            dataset = self.api.get_dataset(indicator, ["GB", "AR"], mrv=2)
+            self.assertEqual(as_dict[indicator], dataset.as_dict())
+            self.assertEqual(panel[indicator].as_dict(), dataset.as_dict())
+            self.assertEqual(panel[indicator].api_url, dataset.api_url)
+            self.assertEqual(panel.countries, dataset.countries)
+            self.assertEqual(panel.dates(), dataset.dates())
+        self.assertIsNone(as_dict["B"]["GB"]["2012"])
+
+    def test_unknown_indicator_raises_key_error(self):
+        panel = self.api.get_datasets(["A"])
+        self.assertNotIn("B", panel)
+        self.assertRaises(KeyError, panel.__getitem__, "B")
+
+    def test_indicators_without_data_are_left_out(self):
+        panel = self.api.get_datasets(["C", "EMPTY", "A"], ["GB", "AR"])
+        self.assertEqual(list(panel), ["C", "A"])
+        self.assertNotIn("EMPTY", panel)
+        self.assertEqual(panel["A"].as_dict(),
+            self.api.get_dataset("A", ["GB", "AR"]).as_dict())
+
+        responses = [json.loads(self.fetch("indicators/{0}?".format(code)))
+            for code in ["C", "EMPTY", "A"]]
+        self.assertEqual(list(wbpy.IndicatorPanel(responses)), ["C", "A"])
+
+    def test_panel_from_responses(self):
+        responses = [json.loads(self.fetch("indicators/{0}?".format(code)))
+            for code in self.indicators]
+        panel = wbpy.IndicatorPanel(responses)
+        self.assertEqual(panel.as_dict(),
+            self.api.get_datasets(self.indicators).as_dict())
+
+    @unittest.skipIf(numpy is None, "numpy not installed")
+    def test_to_numpy(self):
+        panel = self.api.get_datasets(self.indicators)
+        values, indicators, countries, dates = panel.to_numpy()
+        self.assertEqual(values.shape, (3, 4, 2))
+        self.assertEqual(list(indicators), self.indicators)
+        as_dict = panel.as_dict()
+        for i, indicator in enumerate(indicators):
+            for j, country in enumerate(countries):
+                for k, date in enumerate(dates):
+                    expected = as_dict[indicator][country][date]
+                    if expected is None:
+                        self.assertTrue(numpy.isnan(values[i, j, k]))
+                    else:
+                        self.assertEqual(values[i, j, k], expected)
+
+    @unittest.skipIf(pandas is None, "pandas not installed")
+    def test_to_frame(self):
+        panel = self.api.get_datasets(self.indicators)
+        frame = panel.to_frame()
+        self.assertEqual(len(frame), 3 * 4 * 2)
+        self.assertEqual(list(frame["indicator"].cat.categories),
+            self.indicators)
+        wide = panel.to_frame(wide=True)
+        self.assertEqual(list(wide.columns), self.indicators)
+        self.assertEqual(wide.index.names, ["country", "date"])
+        self.assertEqual(wide.loc[("AR", pandas.Timestamp("2012")), "C"],
+            panel.as_dict()["C"]["AR"]["2012"])
+        self.assertTrue(numpy.isnan(wide.loc[("GB",
+            pandas.Timestamp("2012")), "B"]))
+
+
+class TestIncrementalDataset(unittest.TestCase):
+
+    def test_matches_parsed_dataset(self):
+        data = Yearly()
+        api = wbpy.IndicatorAPI(fetch=lambda url: json.dumps(data.response,
+            indent=2))
+        dataset = api.get_dataset("SP.POP.TOTL", keep_response=False)
+        self.assertEqual(dataset.as_dict(), data.dataset.as_dict())
+        self.assertEqual(dataset.countries, data.dataset.countries)
+        self.assertEqual(dataset.indicator_name, data.dataset.indicator_name)
+        self.assertEqual(len(dataset.api_response[1]),
+            len(data.response[1]))
+
+    def test_uses_fetch_chunks(self):
+        text = json.dumps(Yearly().response)
+        fetch = mock.Mock(spec=["fetch_chunks"])
+        fetch.fetch_chunks.return_value = iter([text[i:i + 10] for i in
+            range(0, len(text), 10)])
+        api = wbpy.IndicatorAPI(fetch=fetch)
+        dataset = api.get_dataset("SP.POP.TOTL", keep_response=False)
+        self.assertEqual(dataset.as_dict(), Yearly().dataset.as_dict())
+        self.assertEqual(fetch.fetch_chunks.call_count, 1)
+
+    def test_bad_response_raises(self):
+        api = wbpy.IndicatorAPI(fetch=lambda url: json.dumps(
+            [{"message": "Invalid value"}]))
+        self.assertRaises(ValueError, api.get_dataset, "X",
+            keep_response=False)
+
+
+@ddt
+class TestCountryChunking(unittest.TestCase):
+
+    codes = ["GBR", "FRA", "ESP", "DEU", "ITA", "PRT", "NLD", "BEL", "AUT",
+        "CHE", "POL", "SWE"]
+
+    def setUp(self):
+        self.requested = []
+        self.lock = threading.Lock()
+        self.api = wbpy.IndicatorAPI(fetch=self.fetch)
+        self.api.MAX_URL_LENGTH = len(self.api._dataset_url("X",
+            date="2010")) + 10
+        # Countries that the API has no data for.
+        self.empty = set()
+
+    def fetch(self, url):
+        with self.lock:
+            self.requested.append(url)
+        codes = re.search(r"countries/([^/]+)/", url).group(1).split(";")
+        if set(codes) <= self.empty:
+            return json.dumps([{"page": 0, "pages": 0, "per_page": "10000",
+                "total": 0}, None])
+        rows = [dict(
+            indicator={"id": "X", "value": "X name"},
+            country={"id": code, "value": code + " name"},
+            date="2010", value=str(i)) for i, code in enumerate(codes)]
+        header = {"page": 1, "pages": 1, "per_page": "10000",
+            "total": len(rows)}
+        return json.dumps([header, rows])
+
+    def test_urls_within_max_length(self):
+        urls = self.api._dataset_urls("X", self.codes, date="2010")
+        self.assertGreater(len(urls), 1)
+        for url in urls:
+            self.assertLessEqual(len(url), self.api.MAX_URL_LENGTH)
+        codes = [re.search(r"countries/([^/]+)/", url).group(1) for url in
+            urls]
+        self.assertEqual(";".join(codes), ";".join(self.codes))
+
+    @data(True, False)
+    def test_chunks_merged_into_one_dataset(self, keep_response):
+        dataset = self.api.get_dataset("X", self.codes, date="2010",
+            keep_response=keep_response)
+        self.assertEqual(sorted(dataset.countries), sorted(self.codes))
+        self.assertEqual(dataset.countries["FRA"], "FRA name")
+        self.assertEqual(len(dataset.as_dict()), len(self.codes))
+        self.assertEqual(dataset.api_url,
+            self.api._dataset_url("X", self.codes, date="2010"))
+        self.assertEqual(sorted(dataset.api_urls), sorted(self.requested))
+        self.assertEqual(len(dataset.api_response[1]), len(self.codes))
+
+    def test_short_country_list_not_split(self):
+        dataset = self.api.get_dataset("X", ["GB"], date="2010")
+        self.assertEqual(dataset.api_urls, [dataset.api_url])
+        self.assertEqual(len(self.requested), 1)
+
+    def test_iter_dataset_rows_covers_all_chunks(self):
+        rows = list(self.api.iter_dataset_rows("X", self.codes, date="2010"))
+        self.assertEqual([row[0] for row in rows], self.codes)
+        self.assertGreater(len(self.requested), 1)
+
+    @data(True, False)
+    def test_chunks_without_data_are_skipped(self, keep_response):
+        url = self.api._dataset_urls("X", self.codes, date="2010")[1]
+        self.empty = set(re.search(r"countries/([^/]+)/", url).group(1)
+            .split(";"))
+        dataset = self.api.get_dataset("X", self.codes, date="2010",
+            keep_response=keep_response)
+        self.assertEqual(sorted(dataset.countries),
+            sorted(set(self.codes) - self.empty))
+        self.assertEqual(len(dataset.api_urls), len(self.requested))
+        rows = list(self.api.iter_dataset_rows("X", self.codes, date="2010"))
+        self.assertEqual(len(rows), len(self.codes) - len(self.empty))
+
+    @data(True, False)
+    def test_raises_if_no_chunk_has_data(self, keep_response):
+        self.empty = set(self.codes)
+        self.assertRaises(ValueError, self.api.get_dataset, "X", self.codes,
+            date="2010", keep_response=keep_response)
+        self.assertRaises(ValueError, list, self.api.iter_dataset_rows("X",
+            self.codes, date="2010"))
+
+    def test_codes_converted_once(self):
+        with mock.patch.object(utils, "convert_country_code",
+                wraps=utils.convert_country_code) as convert:
+            self.api._dataset_urls("X", self.codes, date="2010")
+        self.assertEqual(convert.call_count, len(self.codes))
+
+
+class TestIterDatasetRows(unittest.TestCase):
+
+    def dataset_fetch(self, pages, rows_per_page=2):
+        requested = []
+
+        def fetch(url):
+            requested.append(url)
+            match = re.search(r"&page=(\d+)$", url)
+            page = int(match.group(1)) if match else 1
+            header = {"page": page, "pages": pages,
+                "per_page": str(rows_per_page)}
+            rows = [dict(
+                indicator={"id": "X", "value": "X name"},
+                country={"id": "GB", "value": "United Kingdom"},
+                date=str(2000 + (page - 1) * rows_per_page + i),
+                value=None if i else str(page),
+                ) for i in range(rows_per_page)]
+            return json.dumps([header, rows])
+        return fetch, requested
+
+    def test_rows_yielded_in_order(self):
+        fetch, requested = self.dataset_fetch(3)
+        api = wbpy.IndicatorAPI(fetch=fetch)
+        rows = list(api.iter_dataset_rows("X", ["GB"], date="2000:2005"))
+        self.assertEqual(rows, [
+            ("GB", "2000", 1.0), ("GB", "2001", None),
+            ("GB", "2002", 2.0), ("GB", "2003", None),
+            ("GB", "2004", 3.0), ("GB", "2005", None),
+            ])
+        self.assertEqual(len(requested), 3)
+        self.assertIn("per_page=1000", requested[0])
+        self.assertIn("date=2000%3A2005", requested[0])
+        self.assertTrue(requested[2].endswith("&page=3"))
+
+    def test_pages_requested_lazily(self):
+        fetch, requested = self.dataset_fetch(5)
+        api = wbpy.IndicatorAPI(fetch=fetch)
+        rows = api.iter_dataset_rows("X", per_page=2)
+        self.assertEqual(requested, [])
+        next(rows)
+        next(rows)
+        self.assertEqual(len(requested), 1)
+        self.assertIn("per_page=2", requested[0])
+        next(rows)
+        self.assertEqual(len(requested), 2)
+
+    def test_bad_response_raises(self):
+        api = wbpy.IndicatorAPI(fetch=lambda url: json.dumps(
+            [{"message": "Invalid value"}]))
+        self.assertRaises(ValueError, list, api.iter_dataset_rows("X"))
+
+
 class TestInit(TestIndicatorAPI):
     def test_can_pass_own_cache_object(self):
         from six.moves.urllib import request
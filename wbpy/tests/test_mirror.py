@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import sqlite3
+import tempfile
+try:
+    # py2.6
+    import unittest2 as unittest
+except ImportError:
+    # py2.7+
+    import unittest
+
+import mock
+
+import wbpy
+from wbpy import cache, mirror, utils
+from wbpy.tests.local_server import LocalServer
+
+
+def make_row(indicator, country, date, value):
+    return {
+        "indicator": {"id": indicator, "value": "Indicator " + indicator},
+        "country": {"id": country, "value": "Country " + country},
+        "date": date,
+        "value": value,
+        }
+
+
+ROWS = {
+    "A": [make_row("A", "GB", "2011", "2.5"), make_row("A", "GB", "2010", "1"),
+        make_row("A", "FR", "2011", None), make_row("A", "FR", "2010", "3")],
+    "B": [make_row("B", "GB", "2010", "10")],
+    }
+
+
+class TestMirror(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = LocalServer()
+        self.cache = cache.SQLiteCache(os.path.join(self.directory,
+            "cache.sqlite3"))
+        self.api = wbpy.IndicatorAPI(fetch=utils.Fetcher(cache=self.cache,
+            memory_cache=False))
+        self.api.BASE_URL = self.server.url("/")
+        self.kwargs = dict(date="2010:2011", per_page=3)
+        self.path = os.path.join(self.directory, "mirror.sqlite3")
+
+        # Serve each indicator's rows in pages of 3.
+        for indicator, rows in ROWS.items():
+            url = self.api._dataset_url(indicator, **self.kwargs)
+            pages = [rows[i:i + 3] for i in range(0, len(rows), 3)]
+            for page, page_rows in enumerate(pages, 1):
+                page_url = url if page == 1 else url + "&page=%d" % page
+                path = page_url[len(self.server.url("")):]
+                self.server.responses[path] = [{"page": page,
+                    "pages": len(pages), "per_page": 3, "total": len(rows)},
+                    page_rows]
+
+        self.progress = []
+        self.mirror = self.make_mirror()
+
+    def tearDown(self):
+        self.mirror.close()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def make_mirror(self, **kwargs):
+        return mirror.Mirror(self.path, api=self.api, backoff=0,
+            progress=lambda *args: self.progress.append(args), **kwargs)
+
+    def test_mirrors_all_pages(self):
+        result = self.mirror.run(["A", "B"], **self.kwargs)
+        self.assertEqual(result, mirror.MirrorResult(3, 0, []))
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.mirror.status(), {"done": 3})
+        self.assertEqual([args[0] for args in self.progress], [1, 2, 3])
+        self.assertEqual(self.progress[-1][1], 3)
+
+        dataset = self.mirror.dataset("A")
+        self.assertEqual(dataset.indicator_name, "Indicator A")
+        self.assertEqual(dataset.as_dict(), {
+            "GB": {"2010": 1.0, "2011": 2.5},
+            "FR": {"2010": 3.0},
+            })
+        self.assertEqual(dataset.countries, {"GB": "Country GB",
+            "FR": "Country FR"})
+
+        panel = self.mirror.panel(["A", "B"])
+        self.assertEqual(panel.as_dict()["B"], {"GB": {"2010": 10.0}})
+
+    def test_store_is_compact(self):
+        # With one worker, IDs are given in the order the indicators are run.
+        self.make_mirror(max_workers=1).run(["A", "B"], **self.kwargs)
+        conn = sqlite3.connect(self.path)
+        self.assertEqual(conn.execute("SELECT * FROM observations ORDER BY "
+            "indicator_id, country_id, date").fetchall(), [
+                (1, 1, "2010", 1.0), (1, 1, "2011", 2.5), (1, 2, "2010", 3.0),
+                (2, 1, "2010", 10.0)])
+        conn.close()
+
+    def test_responses_not_cached(self):
+        self.mirror.run(["A"], **self.kwargs)
+        self.assertEqual(self.cache.totals()[0], 0)
+
+    def test_resumes_after_failure(self):
+        fetch_chunks = self.api.fetch.fetch_chunks
+        page_2 = self.api._dataset_url("A", **self.kwargs) + "&page=2"
+
+        def broken(url, **kwargs):
+            if url == page_2:
+                raise IOError("Connection reset")
+            return fetch_chunks(url, **kwargs)
+
+        with mock.patch.object(self.api.fetch, "fetch_chunks", broken):
+            result = self.make_mirror(retries=0).run(["A", "B"],
+                **self.kwargs)
+        self.assertEqual(result.done, 2)
+        self.assertEqual([failed[:2] for failed in result.failed],
+            [("A", page_2)])
+        self.assertEqual(self.mirror.status(), {"done": 2, "failed": 1})
+
+        requests = len(self.server.requests)
+        result = self.make_mirror().run(["A", "B"], **self.kwargs)
+        self.assertEqual(result, mirror.MirrorResult(1, 2, []))
+        self.assertEqual(self.server.requests[requests:],
+            [page_2[len(self.server.url("")):]])
+        self.assertEqual(self.mirror.dataset("A").as_dict()["FR"],
+            {"2010": 3.0})
+
+    def test_only_new_chunks_downloaded(self):
+        self.mirror.run(["A"], **self.kwargs)
+        result = self.mirror.run(["A", "B"], **self.kwargs)
+        self.assertEqual(result, mirror.MirrorResult(1, 2, []))
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_retries(self):
+        fetch_chunks = self.api.fetch.fetch_chunks
+        errors = [IOError("Timed out"), ValueError("Truncated")]
+
+        def flaky(url, **kwargs):
+            if errors:
+                raise errors.pop(0)
+            return fetch_chunks(url, **kwargs)
+
+        with mock.patch.object(self.api.fetch, "fetch_chunks", flaky):
+            result = self.mirror.run(["B"], **self.kwargs)
+        self.assertEqual(result, mirror.MirrorResult(1, 0, []))
+        conn = sqlite3.connect(self.path)
+        self.assertEqual(conn.execute("SELECT attempts FROM chunks")
+            .fetchall(), [(3,)])
+        conn.close()
+
+    def serve(self, indicator, response):
+        url = self.api._dataset_url(indicator, **self.kwargs)
+        self.server.responses[url[len(self.server.url("")):]] = response
+
+    def test_indicator_without_data_is_done(self):
+        self.serve("C", [{"page": 0, "pages": 0, "per_page": 3, "total": 0},
+            None])
+        result = self.mirror.run(["C"], **self.kwargs)
+        self.assertEqual(result, mirror.MirrorResult(1, 0, []))
+        self.assertEqual(len(self.server.requests), 1)
+        conn = sqlite3.connect(self.path)
+        self.assertEqual(conn.execute("SELECT status, rows, attempts FROM "
+            "chunks").fetchall(), [("done", 0, 1)])
+        conn.close()
+
+        result = self.mirror.run(["C"], **self.kwargs)
+        self.assertEqual(result, mirror.MirrorResult(0, 1, []))
+        with self.assertRaises(KeyError):
+            self.mirror.dataset("C")
+
+    def test_api_error_message_not_retried(self):
+        self.serve("X", [{"message": [{"id": "120", "key": "Invalid value",
+            "value": "The provided parameter value is not valid"}]}])
+        result = self.mirror.run(["X"], **self.kwargs)
+        self.assertEqual(len(result.failed), 1)
+        self.assertIsInstance(result.failed[0][2], ValueError)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.mirror.status(), {"failed": 1})
+
+    def test_all_indicators_by_default(self):
+        with mock.patch.object(self.api, "get_indicators",
+                return_value={"A": {}, "B": {}}):
+            result = self.mirror.run(**self.kwargs)
+        self.assertEqual(result.done, 3)
+
+    def test_missing_indicator(self):
+        with self.assertRaises(KeyError):
+            self.mirror.dataset("A")
+
+    def test_cli(self):
+        with mock.patch.object(mirror.Mirror, "run",
+                return_value=mirror.MirrorResult(2, 1, [])) as run:
+            self.assertEqual(mirror.main([self.path, "--indicators", "A",
+                "B", "--date", "2000:2010", "--quiet"]), 0)
+        run.assert_called_once_with(["A", "B"], None, date="2000:2010")
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import tempfile
+import time
+try:
+    # py2.6
+    import unittest2 as unittest
+except ImportError:
+    # py2.7+
+    import unittest
+
+import mock
+
+import wbpy
+from wbpy import cache, prefetch, utils
+from wbpy.tests.local_server import LocalServer
+
+
+MANIFEST = {
+    "indicators": [
+        {
+            "indicators": ["SP.POP.TOTL", "NY.GDP.MKTP.CD"],
+            "country_groups": [["GB", "FR"], ["BR"]],
+            "dates": ["2000:2010"],
+            "frequency": "Y",
+        },
+        # Duplicates the first request above.
+        {
+            "indicators": ["SP.POP.TOTL"],
+            "country_groups": [["GB", "FR"]],
+            "dates": ["2000:2010"],
+            "frequency": "Y",
+        },
+    ],
+    "climate": [
+        {
+            "type": "instrumental",
+            "data_types": ["pr", "tas"],
+            "intervals": ["year"],
+            "locations": ["GB"],
+        },
+    ],
+}
+
+
+class TestPrefetchPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.prefetcher = prefetch.Prefetcher(utils.Fetcher(
+            memory_cache=False))
+
+    def test_urls_match_api_calls(self):
+        ind_api = wbpy.IndicatorAPI()
+        climate_api = wbpy.ClimateAPI()
+        expected = []
+        for indicator in ["SP.POP.TOTL", "NY.GDP.MKTP.CD"]:
+            for countries in [["GB", "FR"], ["BR"]]:
+                expected.extend(ind_api._dataset_urls(indicator, countries,
+                    date="2000:2010", frequency="Y"))
+        for data_type in ["pr", "tas"]:
+            expected.extend(climate_api._instrumental_urls(data_type, "year",
+                ["GB"]))
+        self.assertEqual(self.prefetcher.plan(MANIFEST), expected)
+
+    def test_defaults_to_all_countries_and_api_dates(self):
+        urls = self.prefetcher.plan({"indicators": [
+            {"indicators": ["SP.POP.TOTL"]}]})
+        self.assertEqual(urls, [wbpy.IndicatorAPI()._dataset_url(
+            "SP.POP.TOTL")])
+
+    def test_modelled_urls(self):
+        urls = self.prefetcher.plan({"climate": [{"type": "modelled",
+            "data_types": ["pr"], "intervals": ["mavg"],
+            "locations": ["GB"]}]})
+        self.assertEqual(urls, wbpy.ClimateAPI()._modelled_urls("pr", "mavg",
+            ["GB"]))
+
+    def test_manifest_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "manifest.json")
+        with open(path, "w") as f:
+            json.dump(MANIFEST, f)
+        self.assertEqual(self.prefetcher.plan(path),
+            self.prefetcher.plan(MANIFEST))
+
+    def test_unknown_climate_type(self):
+        with self.assertRaises(ValueError):
+            self.prefetcher.plan({"climate": [{"type": "forecast",
+                "data_types": ["pr"], "intervals": ["year"],
+                "locations": ["GB"]}]})
+
+
+class TestPrefetchRun(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = cache.SQLiteCache(os.path.join(self.directory,
+            "cache.sqlite3"))
+        self.server = LocalServer()
+        self.progress = []
+        self.prefetcher = prefetch.Prefetcher(utils.Fetcher(cache=self.cache,
+            memory_cache=False), max_workers=4,
+            progress=lambda *args: self.progress.append(args))
+        base_url = self.server.url("/")
+        self.prefetcher.indicator_api.BASE_URL = base_url
+        self.prefetcher.climate_api.BASE_URL = base_url
+        self.urls = self.prefetcher.plan(MANIFEST)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def test_fetches_urls_into_cache(self):
+        result = self.prefetcher.run(MANIFEST)
+        self.assertEqual(result.urls, self.urls)
+        self.assertEqual(result.fetched, self.urls)
+        self.assertEqual(result.skipped, [])
+        self.assertEqual(result.failed, [])
+        self.assertEqual(len(self.server.requests), len(self.urls))
+        for url in self.urls:
+            self.assertIsNotNone(self.cache.get(url))
+
+        self.assertEqual(len(self.progress), len(self.urls))
+        self.assertEqual(sorted(done for done, _, _, _ in self.progress),
+            list(range(1, len(self.urls) + 1)))
+        self.assertEqual(set(total for _, total, _, _ in self.progress),
+            set([len(self.urls)]))
+
+    def test_fresh_urls_are_skipped(self):
+        self.cache.set(self.urls[0], b"[]")
+        self.cache.set(self.urls[1], b"[]", fetched_at=time.time() - 2 * 86400)
+        result = self.prefetcher.run(MANIFEST)
+        self.assertEqual(result.skipped, [self.urls[0]])
+        self.assertEqual(result.fetched, self.urls[1:])
+        self.assertEqual(len(self.server.requests), len(self.urls) - 1)
+
+        result = self.prefetcher.run(MANIFEST)
+        self.assertEqual(result.skipped, self.urls)
+        self.assertEqual(result.fetched, [])
+
+    def test_works_when_offline(self):
+        with mock.patch.dict(os.environ, {"WBPY_OFFLINE": "1"}):
+            result = self.prefetcher.run(MANIFEST)
+        self.assertEqual(result.fetched, self.urls)
+
+    def test_failures_dont_stop_other_urls(self):
+        warm = self.prefetcher.fetcher.warm
+        error = IOError("Connection refused")
+
+        def flaky_warm(url):
+            if url == self.urls[1]:
+                raise error
+            return warm(url)
+
+        with mock.patch.object(self.prefetcher.fetcher, "warm", flaky_warm):
+            result = self.prefetcher.run(MANIFEST)
+        self.assertEqual(result.failed, [(self.urls[1], error)])
+        self.assertEqual(result.fetched, self.urls[:1] + self.urls[2:])
+        self.assertIn("failed", [status for _, _, _, status in
+            self.progress])
+
+    def test_cli(self):
+        path = os.path.join(self.directory, "manifest.json")
+        with open(path, "w") as f:
+            json.dump(MANIFEST, f)
+        with mock.patch.object(prefetch, "Prefetcher",
+                return_value=self.prefetcher) as prefetcher_cls:
+            self.assertEqual(prefetch.main([path, "--cache",
+                os.path.join(self.directory, "other.sqlite3"), "--quiet"]), 0)
+        fetcher = prefetcher_cls.call_args[0][0]
+        self.assertEqual(fetcher.cache.path,
+            os.path.join(self.directory, "other.sqlite3"))
+        self.assertEqual(len(self.server.requests), len(self.urls))
+
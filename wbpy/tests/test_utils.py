@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
+import os
 import sys
 import json
+import socket
+import subprocess
+import threading
+import time
 try:
     # py2.6
     import unittest2 as unittest
@@ -10,7 +15,9 @@ except ImportError:
 
 import mock
 
+import wbpy
 from wbpy import utils
+from wbpy.tests.local_server import LocalServer
 
 
 class TestFetchFn(unittest.TestCase):
@@ -37,11 +44,278 @@ class TestFetchFn(unittest.TestCase):
         # Make call once so we know it's been cached
         utils.fetch(self.url, check_cache=False, cache_response=True)
 
-        # Make sure reading from file, rather than calling url
-        urlopen_fn = mock.patch("six.moves.urllib.request.urlopen").start()
+        # Make sure reading from the cache, rather than calling url
+        request_fn = mock.patch.object(utils.ConnectionPool,
+            "request").start()
         res = utils.fetch(self.url, check_cache=True)
-        self.assertFalse(urlopen_fn.called)
+        self.assertFalse(request_fn.called)
 
         # The response will be json-decoded, so make sure not have
         # str/unicode/byte problems.
         self.assertTrue(json.loads(res))
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalServer()
+        self.pool = utils.ConnectionPool()
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+
+    def test_connection_is_reused(self):
+        for _ in range(3):
+            utils.fetch(self.server.url(), check_cache=False,
+                cache_response=False, pool=self.pool)
+        self.assertEqual(self.pool.stats, {"new": 1, "reused": 2})
+
+    def test_follows_redirects(self):
+        res = utils.fetch(self.server.url("/redirect"), check_cache=False,
+            cache_response=False, pool=self.pool)
+        self.assertEqual(json.loads(res), [{"path": "/data"}])
+        self.assertEqual(self.server.requests, ["/redirect", "/data"])
+
+    def test_http_requests_use_proxy_from_environment(self):
+        proxy = self.server.url("").replace("http://",
+            "http://user:pass@")
+        url = "http://api.example.invalid/v2/data?format=json"
+        with mock.patch.dict(os.environ, {"http_proxy": proxy,
+                "no_proxy": ""}):
+            res = utils.fetch(url, check_cache=False, cache_response=False,
+                pool=self.pool)
+        self.assertEqual(json.loads(res), [{"path": url}])
+        self.assertEqual(self.server.requests, [url])
+        self.assertEqual(self.server.headers[0]["Proxy-Authorization"],
+            "Basic dXNlcjpwYXNz")
+
+    def test_no_proxy_is_respected(self):
+        with mock.patch.dict(os.environ, {"http_proxy": "http://proxy.invalid",
+                "no_proxy": "127.0.0.1"}):
+            utils.fetch(self.server.url(), check_cache=False,
+                cache_response=False, pool=self.pool)
+        self.assertEqual(self.server.requests, ["/data"])
+
+    @mock.patch("wbpy.utils.http_client.HTTPSConnection")
+    def test_https_requests_tunnel_through_proxy(self, connection_cls):
+        with mock.patch.dict(os.environ, {"https_proxy": "proxy:3128",
+                "no_proxy": ""}):
+            proxy = self.pool._proxy_for("https", "api.worldbank.org")
+        conn = self.pool._new_connection(("https", "api.worldbank.org", None,
+            proxy))
+        connection_cls.assert_called_once_with("proxy", 3128, timeout=60)
+        conn.set_tunnel.assert_called_once_with("api.worldbank.org", None,
+            headers={})
+
+    def test_fresh_connection_closed_if_retry_fails(self):
+        idle, fresh = mock.Mock(), mock.Mock()
+        for conn in [idle, fresh]:
+            conn.request.side_effect = socket.error("Connection reset")
+        with mock.patch.object(self.pool, "_get_connection",
+                return_value=(idle, True)):
+            with mock.patch.object(self.pool, "_new_connection",
+                    return_value=fresh):
+                self.assertRaises(socket.error, self.pool.request,
+                    self.server.url())
+        idle.close.assert_called_once_with()
+        fresh.close.assert_called_once_with()
+
+    def test_api_instances_have_own_pool(self):
+        api = wbpy.IndicatorAPI()
+        other_api = wbpy.IndicatorAPI()
+        api.fetch(self.server.url(), check_cache=False, cache_response=False)
+        api.fetch(self.server.url(), check_cache=False, cache_response=False)
+        self.assertEqual(api.fetch.pool.stats, {"new": 1, "reused": 1})
+        self.assertEqual(other_api.fetch.pool.stats, {"new": 0, "reused": 0})
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalServer()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_concurrent_fetches_share_one_download(self):
+        url = self.server.url("/slow")
+        results = []
+        before = utils.SINGLE_FLIGHT.coalesced
+
+        def fetch():
+            results.append(utils.fetch(url, check_cache=False,
+                cache_response=False, pool=utils.ConnectionPool()))
+
+        threads = [threading.Thread(target=fetch) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.server.requests, ["/slow"])
+        self.assertEqual(results, ['[{"path": "/slow"}]'] * 5)
+        self.assertEqual(utils.SINGLE_FLIGHT.coalesced - before, 4)
+
+    def test_error_is_shared(self):
+        flight = utils.SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        errors = []
+
+        def fail():
+            started.set()
+            release.wait()
+            raise ValueError("failed")
+
+        def call():
+            try:
+                flight.do("key", fail)
+            except ValueError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=call)
+        follower.start()
+        # Only fail once the follower is waiting on the leader's call.
+        while flight.coalesced == 0:
+            time.sleep(0.001)
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(flight.coalesced, 1)
+
+    def test_downloads_only_shared_with_same_cache(self):
+        keys = []
+
+        def do(key, func):
+            keys.append(key)
+            return func()
+
+        url = self.server.url()
+        cache_a, cache_b = mock.Mock(), mock.Mock()
+        with mock.patch.object(utils.SINGLE_FLIGHT, "do", do):
+            for cache, cache_response in [(cache_a, True), (cache_a, True),
+                    (cache_b, True), (cache_a, False)]:
+                utils.fetch(url, check_cache=False,
+                    cache_response=cache_response, cache=cache,
+                    memory_cache=False)
+        self.assertEqual(keys[0], keys[1])
+        self.assertEqual(len(set(keys)), 3)
+        # Each cache gets its own copy of the response.
+        self.assertEqual(cache_a.set.call_count, 2)
+        self.assertEqual(cache_b.set.call_count, 1)
+
+
+class TestParseResponseStream(unittest.TestCase):
+
+    def parse(self, text, size):
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        header, rows = utils.parse_response_stream(chunks)
+        return [header, list(rows)]
+
+    def test_matches_json_loads_for_any_chunk_size(self):
+        response = [{"page": 1, "pages": 1}, [
+            {"country": {"id": "GB"}, "date": "2010", "value": 1234.5e-1},
+            {"country": {"id": "FR"}, "date": "2011", "value": None},
+            {"country": {"id": "ES"}, "date": "2012", "value": "café"},
+            ]]
+        for text in [json.dumps(response), json.dumps(response, indent=4)]:
+            for size in [1, 2, 3, 10, len(text)]:
+                self.assertEqual(self.parse(text, size), json.loads(text))
+
+    def test_numbers_split_between_chunks(self):
+        self.assertEqual(self.parse("[12, [345, 6.5e2]]", 1),
+            [12, [345, 650.0]])
+
+    def test_responses_without_rows(self):
+        self.assertEqual(self.parse('[{"message": "error"}]', 3),
+            [{"message": "error"}, []])
+        self.assertEqual(self.parse('[{"pages": 0}, null]', 3),
+            [{"pages": 0}, []])
+        self.assertEqual(self.parse('[{"pages": 0}, [ ]]', 3),
+            [{"pages": 0}, []])
+
+    def test_rows_parsed_as_chunks_are_read(self):
+        read = []
+
+        def chunks():
+            for chunk in ['[{"pages": 1}, [', '{"n": 1}, ', '{"n": 2}]]']:
+                read.append(chunk)
+                yield chunk
+
+        header, rows = utils.parse_response_stream(chunks())
+        self.assertEqual(len(read), 1)
+        self.assertEqual(next(rows), {"n": 1})
+        self.assertEqual(len(read), 2)
+        self.assertEqual(next(rows), {"n": 2})
+        self.assertEqual(len(read), 3)
+
+    def test_invalid_json_raises(self):
+        for text in ["", "{}", "[1, [2", "[1, [2 3]]", "[1, [5.]]"]:
+            with self.assertRaises(ValueError):
+                self.parse(text, 2)
+
+    def test_decoded_chunks(self):
+        body = json.dumps([{}, ["\u00fc\u20ac" * 5]],
+            ensure_ascii=False).encode("utf-8")
+        chunks = list(utils.iter_decoded(body, chunk_size=1))
+        self.assertEqual("".join(chunks), body.decode("utf-8"))
+        header, rows = utils.parse_response_stream(chunks)
+        self.assertEqual(list(rows), ["\u00fc\u20ac" * 5])
+
+
+class TestConvertCountryCode(unittest.TestCase):
+
+    def test_iso_codes(self):
+        for code, alpha2, alpha3 in [("GB", "GB", "GBR"), ("gbr", "GB", "GBR"),
+                ("BR", "BR", "BRA"), ("bra", "BR", "BRA")]:
+            self.assertEqual(utils.convert_country_code(code, "alpha2"), alpha2)
+            self.assertEqual(utils.convert_country_code(code, "alpha3"), alpha3)
+
+    def test_non_iso_codes(self):
+        for code in ["1W", "WLD", "1w"]:
+            self.assertEqual(utils.convert_country_code(code, "alpha2"), "1W")
+            self.assertEqual(utils.convert_country_code(code, "alpha3"), "WLD")
+
+    def test_unknown_codes_returned_upper_case(self):
+        for code in ["302", "abcd", "zz"]:
+            self.assertEqual(utils.convert_country_code(code, "alpha3"),
+                code.upper())
+
+    def test_lookup_tables_built_once(self):
+        codes = utils._CountryCodes()
+        with mock.patch.object(utils._CountryCodes, "_build",
+                wraps=utils._CountryCodes._build) as build:
+            self.assertEqual(codes.to_alpha3["GB"], "GBR")
+            self.assertEqual(codes.to_alpha2["GBR"], "GB")
+            self.assertEqual(codes.iso_names["GB"], "United Kingdom")
+        self.assertEqual(build.call_count, 1)
+
+
+class TestLazyImports(unittest.TestCase):
+
+    def test_import_doesnt_load_slow_modules(self):
+        script = ("import sys, wbpy; print(','.join(m for m in "
+            "['pycountry', 'asyncio', 'wbpy.aio'] if m in sys.modules))")
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        output = subprocess.check_output([sys.executable, "-c", script],
+            cwd=root, universal_newlines=True)
+        self.assertEqual(output.strip(), "")
+
+    def test_non_standard_regions(self):
+        regions = utils.NON_STANDARD_REGIONS
+        self.assertEqual(regions["1W"]["id"], "WLD")
+        self.assertIs(wbpy.IndicatorAPI.NON_STANDARD_REGIONS, regions)
+        self.assertIs(wbpy.IndicatorAPI().NON_STANDARD_REGIONS, regions)
+
+    def test_async_classes_available(self):
+        from wbpy import aio
+        self.assertIs(wbpy.AsyncIndicatorAPI, aio.AsyncIndicatorAPI)
+        self.assertIs(wbpy.AsyncClimateAPI, aio.AsyncClimateAPI)
+        with self.assertRaises(AttributeError):
+            wbpy.NotAClass
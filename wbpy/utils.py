@@ -1,133 +1,820 @@
 # -*- coding: utf-8 -*-
+import base64
+import codecs
 import os
-import tempfile
-from six.moves.urllib import request
+import re
+import socket
+import threading
 import time
 import logging
 import datetime
-import hashlib
+import importlib
 import json
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
-import pycountry  # For ISO 1366 code conversions
+from six.moves import http_client
+from six.moves.urllib.error import HTTPError
+from six.moves.urllib.parse import unquote, urljoin, urlsplit
+from six.moves.urllib.request import getproxies, proxy_bypass
+
+from . import cache as wbpy_cache
 
 logger = logging.getLogger(__name__)
 
 EXC_MSG = "The URL %s returned a bad response: %s"
 
+# Size of the chunks that response bodies are decoded in for incremental
+# parsing.
+CHUNK_SIZE = 64 * 1024
+
+# Default number of threads the API classes request URLs with. It matches
+# ``ConnectionPool(maxsize=8)``, so every thread's connection is kept alive.
+DEFAULT_MAX_WORKERS = 8
+
 # The Indicators API (but not Climate API) uses a few non-ISO 2-digit and
 # 3-digit codes, for either regions or groups of regions. Make them accessible
 # so that they can be converted, and users can see them.
 #
 # The file contains the results of IndicatorAPI.get_countries(), with all the
-# ISO countries excluded.
+# ISO countries excluded. It's read on first use, rather than at import.
 path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
     "non_ISO_region_codes.json")
-NON_STANDARD_REGIONS = json.loads(open(path).read())
+_non_standard_regions = None
+
+
+def non_standard_regions():
+    """Return the non-ISO region codes, reading the file the first time."""
+    global _non_standard_regions
+    if _non_standard_regions is None:
+        with open(path) as f:
+            _non_standard_regions = json.load(f)
+    return _non_standard_regions
+
+
+def __getattr__(name):
+    # Module __getattr__ (Python 3.7+) keeps ``utils.NON_STANDARD_REGIONS``
+    # working without reading the file at import.
+    if name == "NON_STANDARD_REGIONS":
+        return non_standard_regions()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+if sys.version_info < (3, 7):
+    NON_STANDARD_REGIONS = non_standard_regions()
+
+
+class ConnectionPool(object):
+
+    """Keep-alive HTTP connections that are reused between requests.
+
+    Idle connections are kept per (scheme, host, port), so consecutive
+    requests to the same API host skip the TCP (and TLS) handshake. The
+    ``new_connections`` and ``reused_connections`` counters show how many
+    requests had to open a connection, and how many picked up an idle one.
+
+    Proxies are taken from the environment (``HTTP_PROXY``, ``HTTPS_PROXY``
+    and ``NO_PROXY``), as for ``urlopen()``. HTTPS requests are tunnelled
+    through the proxy with ``CONNECT``.
+
+    :param maxsize:
+        Maximum number of idle connections to keep for each host.
+
+    :param timeout:
+        Socket timeout in seconds for new connections.
+
+    """
+
+    MAX_REDIRECTS = 5
+
+    def __init__(self, maxsize=8, timeout=60):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.new_connections = 0
+        self.reused_connections = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self):
+        """Dictionary of the ``new`` and ``reused`` connection counts."""
+        return {
+            "new": self.new_connections,
+            "reused": self.reused_connections,
+            }
+
+    def request(self, url, headers=None):
+        """Make a GET request for a URL, following any redirects.
+
+        :returns:
+            Tuple of (status, headers, body), where the body is a bytestring.
+
+        """
+        for _ in range(self.MAX_REDIRECTS + 1):
+            resp, body = self._request_once(url, headers)
+            location = resp.getheader("location")
+            if resp.status in (301, 302, 303, 307, 308) and location:
+                url = urljoin(url, location)
+                continue
+            if resp.status >= 400:
+                raise HTTPError(url, resp.status, resp.reason, resp.msg, None)
+            return resp.status, resp.msg, body
+        raise HTTPError(url, resp.status, "Too many redirects", resp.msg, None)
 
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def _request_once(self, url, headers):
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        proxy = self._proxy_for(scheme, parts.hostname)
+        key = (scheme, parts.hostname, parts.port, proxy)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        if proxy is not None and scheme == "http":
+            # Plain HTTP proxies are sent the absolute URL.
+            path = "%s://%s%s" % (scheme, parts.netloc, path)
+            headers = dict(headers or {}, **self._proxy_headers(proxy))
+
+        conn, reused = self._get_connection(key)
+        try:
+            resp, body = self._send(conn, path, headers)
+        except (http_client.HTTPException, socket.error):
+            conn.close()
+            if not reused:
+                raise
+            # The server may have dropped the connection while it was idle,
+            # so retry once on a fresh one.
+            conn = self._new_connection(key)
+            try:
+                resp, body = self._send(conn, path, headers)
+            except BaseException:
+                conn.close()
+                raise
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self._put_connection(key, conn)
+        return resp, body
+
+    def _send(self, conn, path, headers):
+        all_headers = {"User-Agent": "wbpy"}
+        all_headers.update(headers or {})
+        conn.request("GET", path, headers=all_headers)
+        resp = conn.getresponse()
+        # The body has to be read in full before the connection can be used
+        # for another request.
+        return resp, resp.read()
+
+    def _get_connection(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self.reused_connections += 1
+                return idle.pop(), True
+        return self._new_connection(key), False
+
+    def _new_connection(self, key):
+        scheme, host, port, proxy = key
+        conn_host, conn_port = host, port
+        if proxy is not None:
+            proxy_parts = urlsplit(proxy)
+            conn_host, conn_port = proxy_parts.hostname, proxy_parts.port
+        if scheme == "https":
+            conn = http_client.HTTPSConnection(conn_host, conn_port,
+                timeout=self.timeout)
+            if proxy is not None:
+                conn.set_tunnel(host, port,
+                    headers=self._proxy_headers(proxy))
+        else:
+            conn = http_client.HTTPConnection(conn_host, conn_port,
+                timeout=self.timeout)
+        with self._lock:
+            self.new_connections += 1
+        return conn
+
+    @staticmethod
+    def _proxy_for(scheme, host):
+        """Return the URL of the proxy to use for a host, or None."""
+        proxy = getproxies().get(scheme)
+        if not proxy or proxy_bypass(host):
+            return None
+        if "://" not in proxy:
+            proxy = "http://" + proxy
+        return proxy
+
+    @staticmethod
+    def _proxy_headers(proxy):
+        """Return the headers to authenticate with a proxy, if its URL has
+        a username."""
+        parts = urlsplit(proxy)
+        if parts.username is None:
+            return {}
+        credentials = "%s:%s" % (unquote(parts.username),
+            unquote(parts.password or ""))
+        token = base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+        return {"Proxy-Authorization": "Basic " + token}
+
+    def _put_connection(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxsize:
+                idle.append(conn)
+                return
+        conn.close()
+
+
+_DEFAULT_POOL = ConnectionPool()
+
+
+class SingleFlight(object):
+
+    """Coalesce concurrent calls that share a key into one call.
+
+    The first caller for a key runs the function. Callers that arrive with
+    the same key while it's running wait for it and get the same result (or
+    exception). ``coalesced`` counts the calls that were saved.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
 
-def fetch(url, check_cache=True, cache_response=True):
-    """Return response from a URL, and cache results for one day."""
-    # Use system tempfile for cache path.
-    cache_dir = os.path.join(tempfile.gettempdir(), "wbpy")
-    if not os.path.exists(cache_dir):
-        os.makedirs(cache_dir)
-        logger.debug("Created cache directory " + cache_dir)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# Shared by all fetch() calls, so that concurrent requests for the same URL
+# make a single download. See ``SINGLE_FLIGHT.coalesced``.
+SINGLE_FLIGHT = SingleFlight()
+
+
+class Fetcher(object):
+
+    """The default ``fetch`` callable used by the API classes.
+
+    Each instance has its own ``ConnectionPool``, so all requests made through
+    one API object share keep-alive connections. See ``pool.stats`` for the
+    number of new and reused connections.
+
+    :param cache:
+        Cache backend to use instead of the default, eg.
+        ``wbpy.cache.SQLiteCache("/data/wbpy.sqlite3")``.
+
+    :param memory_cache:
+        In-process cache tier to use instead of the shared
+        ``wbpy.cache.MEMORY_CACHE``, or False to disable it.
+
+    :param ttl_policy:
+        ``wbpy.cache.TTLPolicy`` to use instead of the default one.
+
+    :param offline:
+        If True, only serve responses from the cache; see ``fetch()``. If
+        None, the ``WBPY_OFFLINE`` environment variable decides.
+
+    """
+
+    def __init__(self, pool=None, cache=None, memory_cache=None,
+            ttl_policy=None, offline=None):
+        self.pool = pool if pool is not None else ConnectionPool()
+        self.cache = cache
+        self.memory_cache = memory_cache
+        self.ttl_policy = ttl_policy
+        self.offline = offline
+
+    def __call__(self, url, check_cache=True, cache_response=True):
+        return fetch(url, check_cache=check_cache,
+            cache_response=cache_response, **self._fetch_kwargs())
+
+    def fetch_json(self, url, check_cache=True, cache_response=True):
+        """Return the response for a URL, parsed as JSON."""
+        return fetch_json(url, check_cache=check_cache,
+            cache_response=cache_response, **self._fetch_kwargs())
+
+    def fetch_chunks(self, url, check_cache=True, cache_response=True):
+        """Return the response for a URL as an iterator of text chunks."""
+        return fetch_chunks(url, check_cache=check_cache,
+            cache_response=cache_response, **self._fetch_kwargs())
+
+    def is_fresh(self, url):
+        """Return True if the cache has a response for a URL that's within
+        its TTL."""
+        cache = self.cache if self.cache is not None else \
+            wbpy_cache.default_cache()
+        ttl_policy = self.ttl_policy if self.ttl_policy is not None else \
+            wbpy_cache.DEFAULT_TTL_POLICY
+        fetched_at = cache.fetched_at(url)
+        return (fetched_at is not None and
+            time.time() - fetched_at < ttl_policy.ttl_for(url))
+
+    def warm(self, url):
+        """Make sure the cache has a fresh response for a URL, requesting it
+        (or revalidating an expired entry) if needed, even in offline mode.
+        The response isn't decoded or added to the memory cache.
+
+        Returns True if a request was made.
+        """
+        _, from_cache, _ = _fetch_body(url, True, True, self.pool,
+            self.cache, self.ttl_policy, offline=False)
+        return not from_cache
+
+    def _fetch_kwargs(self):
+        return dict(pool=self.pool, cache=self.cache,
+            memory_cache=self.memory_cache, ttl_policy=self.ttl_policy,
+            offline=self.offline)
+
+
+def fetch(url, check_cache=True, cache_response=True, pool=None, cache=None,
+        memory_cache=None, ttl_policy=None, offline=None):
+    """Return response from a URL, and cache the results.
+
+    How long a response is cached for depends on the URL; see
+    ``wbpy.cache.DEFAULT_TTL_RULES``. Most responses are cached for one day.
+
+    Once a cached response has expired, it's revalidated with a conditional
+    request if the server gave an ``ETag`` or ``Last-Modified`` header. A
+    ``304 Not Modified`` response just refreshes the cache entry.
+
+    :param pool:
+        The ``ConnectionPool`` to make the request with. If None, a pool
+        shared at module level is used.
+
+    :param cache:
+        The cache backend to use, eg. ``wbpy.cache.SQLiteCache``. If None,
+        ``wbpy.cache.default_cache()`` is used.
+
+    :param memory_cache:
+        The in-process ``MemoryCache`` checked before ``cache``. If None, the
+        shared ``wbpy.cache.MEMORY_CACHE`` is used. False disables it.
+
+    :param ttl_policy:
+        The ``TTLPolicy`` that gives the TTL for the URL. If None,
+        ``wbpy.cache.DEFAULT_TTL_POLICY`` is used.
+
+    :param offline:
+        If True, never make a request. The cached response is returned even
+        if it has expired, and ``wbpy.cache.CacheMissError`` is raised if the
+        URL isn't cached. If None, it's True when the ``WBPY_OFFLINE``
+        environment variable is set.
+
+    """
+    if memory_cache is None:
+        memory_cache = wbpy_cache.MEMORY_CACHE
 
     logger.debug("Fetching url: %s ...", url)
 
-    # Python3 hashlib requires bytestring
-    url_hash = hashlib.md5(url.encode("utf-8")).hexdigest()
-    cache_path = os.path.join(cache_dir, url_hash)
+    if memory_cache:
+        key = _memory_key(url, cache, ttl_policy)
+    if check_cache and memory_cache:
+        response = memory_cache.get(key)
+        if response is not None:
+            logger.debug("Retrieving response from memory cache.")
+            return response
+
+    body, from_cache, expires_at = _fetch_body(url, check_cache,
+        cache_response, pool, cache, ttl_policy, offline)
+
+    # py3 returns bytestring
+    response = body.decode("utf-8")
+    if memory_cache and (from_cache or cache_response):
+        memory_cache.set(key, response, expires_at)
+    return response
+
+
+def fetch_chunks(url, check_cache=True, cache_response=True, pool=None,
+        cache=None, memory_cache=None, ttl_policy=None, offline=None,
+        chunk_size=CHUNK_SIZE):
+    """Return the response from a URL as an iterator of text chunks, for
+    incremental parsing.
+
+    Takes the same arguments as ``fetch()``, and uses the same caches, but the
+    response isn't added to the memory cache, so the whole response text is
+    never built.
+
+    :param chunk_size:
+        Number of bytes of the response to decode at a time.
+
+    """
+    if memory_cache is None:
+        memory_cache = wbpy_cache.MEMORY_CACHE
 
-    # If the cache file is < one day old, return cache, else get new response.
+    if check_cache and memory_cache:
+        response = memory_cache.get(_memory_key(url, cache, ttl_policy))
+        if response is not None:
+            return iter([response])
+
+    body, _, _ = _fetch_body(url, check_cache, cache_response, pool, cache,
+        ttl_policy, offline)
+    return iter_decoded(body, chunk_size)
+
+
+def iter_decoded(body, chunk_size=CHUNK_SIZE):
+    """Decode a UTF-8 bytestring ``chunk_size`` bytes at a time, yielding
+    the text of each chunk."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    view = memoryview(body)
+    for start in range(0, len(view), chunk_size):
+        text = decoder.decode(view[start:start + chunk_size])
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def _memory_key(url, cache, ttl_policy):
+    """Return the key of a URL's response in the memory cache. Responses
+    from different cache backends, or with a different TTL, are held
+    separately."""
+    if cache is None:
+        cache = wbpy_cache.default_cache()
+    if ttl_policy is None:
+        ttl_policy = wbpy_cache.DEFAULT_TTL_POLICY
+    return url, id(cache), ttl_policy.ttl_for(url)
+
+
+def _fetch_body(url, check_cache, cache_response, pool, cache, ttl_policy,
+        offline=None):
+    """Return ``(body, from_cache, expires_at)`` for a URL, where ``body``
+    is the response bytestring, from the cache backend if it's fresh, and
+    ``expires_at`` is the time at which it stops being fresh."""
+    if cache is None:
+        cache = wbpy_cache.default_cache()
+    if offline is None:
+        offline = wbpy_cache.offline_from_env()
+    if ttl_policy is None:
+        ttl_policy = wbpy_cache.DEFAULT_TTL_POLICY
+    ttl = ttl_policy.ttl_for(url)
+
+    if offline:
+        entry = cache.get(url)
+        if entry is None:
+            raise wbpy_cache.CacheMissError(url)
+        logger.debug("Offline, retrieving response from cache.")
+        return entry.body, True, entry.fetched_at + ttl
+
+    # If the cached response is within its TTL, return it, else get new
+    # response.
+    entry = None
     if check_cache:
-        if os.path.exists(cache_path):
+        entry = cache.get(url)
+        if entry is not None:
             logger.debug("URL found in cache...")
-            secs_in_day = 86400
-            if int(time.time()) - os.path.getmtime(cache_path) < secs_in_day:
+            if time.time() - entry.fetched_at < ttl:
                 logger.debug("Retrieving response from cache.")
-                response = open(cache_path, "rb").read().decode("utf-8")
-                return response
+                return entry.body, True, entry.fetched_at + ttl
             else:
-                logger.debug("Cache file has expired, removing...")
-                os.remove(cache_path)
+                # Keep the expired entry, as the server may confirm that it
+                # hasn't changed.
+                logger.debug("Cache entry has expired.")
         else:
             logger.debug("URL not found in cache....")
 
-    logger.debug("Getting web response...")
-    response = request.urlopen(url).read()
+    if pool is None:
+        pool = _DEFAULT_POOL
 
-    # py3 returns bytestring
-    if sys.version_info >= (3,):
-        response = response.decode("utf-8")
+    def download():
+        headers = _conditional_headers(entry)
+        logger.debug("Getting web response...")
+        status, resp_headers, response = pool.request(url, headers)
 
-    logger.debug("Response received.")
-    if cache_response:
-        logger.debug("Caching response... ")
-        _cache_response(response, url, cache_path)
-    return response
+        if status == 304:
+            logger.debug("Response not modified, refreshing cache entry.")
+            if cache_response:
+                # The 304 may carry newer validators (RFC 7232 section 4.1).
+                cache.touch(url, etag=resp_headers.get("ETag"),
+                    last_modified=resp_headers.get("Last-Modified"))
+            return entry.body
+
+        logger.debug("Response received.")
+        if cache_response:
+            logger.debug("Caching response... ")
+            _cache_response(response, url, cache, resp_headers, ttl)
+        return response
+
+    # If other threads are already downloading this URL into the same cache,
+    # wait for their response rather than making another request. The cache
+    # can't be garbage collected, and its id() reused, while the download
+    # holds a reference to it.
+    key = (wbpy_cache.url_hash(url), id(cache), cache_response, ttl)
+    return SINGLE_FLIGHT.do(key, download), False, time.time() + ttl
+
+
+def fetch_json(url, check_cache=True, cache_response=True, pool=None,
+        cache=None, memory_cache=None, ttl_policy=None, offline=None):
+    """Return the response from a URL parsed as JSON.
+
+    Takes the same arguments as ``fetch()``. If the memory cache has
+    ``parse_json`` set, the parsed response is kept in memory too.
+
+    """
+    if memory_cache is None:
+        memory_cache = wbpy_cache.MEMORY_CACHE
+
+    if memory_cache:
+        key = _memory_key(url, cache, ttl_policy)
+    if check_cache and memory_cache:
+        parsed = memory_cache.get_json(key)
+        if parsed is not None:
+            return parsed
+
+    parsed = json.loads(fetch(url, check_cache=check_cache,
+        cache_response=cache_response, pool=pool, cache=cache,
+        memory_cache=memory_cache, ttl_policy=ttl_policy, offline=offline))
+    if cache_response and memory_cache:
+        memory_cache.set_json(key, parsed)
+    return parsed
+
+
+def load_json(fetch, url):
+    """Call a ``fetch`` function and return the parsed JSON response.
+
+    Uses the function's ``fetch_json()`` method if it has one (eg.
+    ``Fetcher``), so that it can make use of parsed responses held in memory.
+
+    """
+    fetch_json = getattr(fetch, "fetch_json", None)
+    if fetch_json is not None:
+        return fetch_json(url)
+    return json.loads(fetch(url))
+
+
+def load_chunks(fetch, url):
+    """Call a ``fetch`` function and return the response as an iterable of
+    text chunks.
+
+    Uses the function's ``fetch_chunks()`` method if it has one (eg.
+    ``Fetcher``), so that the response is decoded a chunk at a time.
+
+    """
+    fetch_chunks = getattr(fetch, "fetch_chunks", None)
+    if fetch_chunks is not None:
+        return fetch_chunks(url)
+    return [fetch(url)]
+
+
+def parse_response_stream(chunks):
+    """Incrementally parse an Indicators API response, ie. a JSON array of
+    ``[header, rows]``, from an iterable of text chunks.
+
+    Only the header is parsed straight away. Each row is parsed when it's
+    reached, so the rows can be used as they arrive, without the whole
+    response being in memory at once.
+
+    :returns:
+        Tuple of ``(header, rows)``, where ``rows`` is a generator of the row
+        dicts. It's empty if the response has no rows, eg. an error message.
+
+    """
+    stream = _JSONStream(chunks)
+    stream.expect("[")
+    header = stream.value()
+    return header, _iter_response_rows(stream)
+
+
+def _iter_response_rows(stream):
+    if stream.expect(",]") == "]":
+        return
+    if stream.peek() != "[":
+        stream.value()  # eg. null
+        return
+    stream.expect("[")
+    if stream.peek() == "]":
+        return
+    while True:
+        yield stream.value()
+        if stream.expect(",]") == "]":
+            return
+
+
+class _JSONStream(object):
+
+    """Reads JSON values one at a time from an iterable of text chunks.
+
+    Chunks are only read as they're needed, and text that has been parsed is
+    dropped from the buffer when the next chunk is read.
+    """
+
+    _whitespace = re.compile(r"[ \t\n\r]*")
+    _delimiters = frozenset(" \t\n\r,:]}")
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = ""
+        self._pos = 0
+        self._decoder = json.JSONDecoder()
+
+    def peek(self):
+        """Return the next non-whitespace character, or "" at the end of the
+        stream."""
+        while True:
+            self._pos = self._whitespace.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read():
+                return ""
 
+    def expect(self, chars):
+        """Consume and return the next character, which must be in
+        ``chars``."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError("Expected one of %r in JSON stream, got %r" % (
+                chars, char or "end of stream"))
+        self._pos += 1
+        return char
 
-def _cache_response(response, url, cache_path):
-    fd, tempname = tempfile.mkstemp()
-    f = os.fdopen(fd, "w")
-    f.write(response)
-    f.close()
-    os.rename(tempname, cache_path)
+    def value(self):
+        """Parse and return the next JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                # Probably an incomplete value.
+                if not self._read():
+                    raise
+                continue
+            # A number may continue in the next chunk, so a value is only
+            # complete once it's followed by a delimiter.
+            if (end == len(self._buffer) or
+                    self._buffer[end] not in self._delimiters):
+                if self._read():
+                    continue
+            self._pos = end
+            return value
+
+    def _read(self):
+        """Add the next chunk to the buffer, returning False if there are no
+        more."""
+        for chunk in self._chunks:
+            if chunk:
+                self._buffer = self._buffer[self._pos:] + chunk
+                self._pos = 0
+                return True
+        return False
+
+
+def _conditional_headers(entry):
+    """Return the headers to revalidate an expired cache entry with."""
+    headers = {}
+    if entry is not None:
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+    return headers
+
+
+def _cache_response(response, url, cache, headers=None, ttl=None):
+    headers = headers or {}
+    cache.set(url, response, ttl=ttl, etag=headers.get("ETag"),
+        last_modified=headers.get("Last-Modified"))
     logger.debug("New url saved to cache: %s" % url)
 
 
+def map_concurrently(func, items, max_workers):
+    """Return ``[func(item) for item in items]``, calling ``func`` from a pool
+    of up to ``max_workers`` threads.
+
+    Results are returned in the same order as ``items``. If any call raises,
+    the exception is re-raised here.
+
+    """
+    items = list(items)
+    if not max_workers or max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as ex:
+        return list(ex.map(func, items))
+
+
+def import_optional(module, extra):
+    """Import an optional dependency, raising an ImportError that names the
+    wbpy extra to install if it's missing."""
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise ImportError("This requires %s. Install it with "
+            "`pip install wbpy[%s]`." % (module, extra))
+
+
+class _CountryCodes(object):
+
+    """Lookup tables for country codes, covering both the ISO 1366 countries
+    from pycountry and the World Bank's non-ISO codes.
+
+    They're built the first time they're needed, so that each conversion is
+    then a single dictionary lookup. pycountry is only imported then too, as
+    loading its databases is slow.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables = None
+
+    @property
+    def to_alpha2(self):
+        return self._get_tables()[0]
+
+    @property
+    def to_alpha3(self):
+        return self._get_tables()[1]
+
+    @property
+    def iso_names(self):
+        """ISO alpha-2 codes to country names."""
+        return self._get_tables()[2]
+
+    def _get_tables(self):
+        if self._tables is None:
+            with self._lock:
+                if self._tables is None:
+                    self._tables = self._build()
+        return self._tables
+
+    @staticmethod
+    def _build():
+        import pycountry  # For ISO 1366 code conversions
+
+        to_alpha2 = {}
+        to_alpha3 = {}
+        iso_names = {}
+        for alpha2, region in non_standard_regions().items():
+            to_alpha3[alpha2] = region["id"]
+            to_alpha2[region["id"]] = alpha2
+
+        # ISO codes take precedence over the non-ISO ones. Old pycountry
+        # versions use alpha2/alpha3 rather than alpha_2/alpha_3.
+        for country in pycountry.countries:
+            alpha2 = getattr(country, "alpha_2", None) or country.alpha2
+            alpha3 = getattr(country, "alpha_3", None) or country.alpha3
+            to_alpha3[alpha2] = alpha3
+            to_alpha2[alpha3] = alpha2
+            iso_names[alpha2] = country.name
+        return to_alpha2, to_alpha3, iso_names
+
+
+COUNTRY_CODES = _CountryCodes()
+
+
 def convert_country_code(code, return_alpha):
     """Convert ISO code into either alpha-2 or alpha-3.
 
+    The World Bank's non-ISO region codes (see ``NON_STANDARD_REGIONS``) are
+    converted too.
+
     :param code:
-        The code to convert. If it isn't a valid ISO code, it gets returned as
-        given.
+        The code to convert. If it isn't a known code, it gets returned as
+        given (in upper case).
 
     :param return_alpha:
         "alpha2" or "alpha3".
 
     """
-    try:
-        # Try to get code from ISO 1366 standard
-        code = code.upper()
-        country = None
-        if len(code) == 2:
-            try:
-                country = pycountry.countries.get(alpha_2=code)
-            except KeyError:
-                country = pycountry.countries.get(alpha2=code)
-        elif len(code) == 3:
-            try:
-                country = pycountry.countries.get(alpha_3=code)
-            except KeyError:
-                country = pycountry.countries.get(alpha3=code)
-        else:
-            raise ValueError("`code` is not a valid alpha-2 or alpha-3 code")
-        if country is None:
-            # Ugly way to get to the except branch below. Pycountry will raise
-            # KeyError automatically in versions < 18.12.8
-            raise KeyError
-        try:
-            return getattr(country, return_alpha)
-        except AttributeError:
-            if "_" not in return_alpha:
-                return_alpha = return_alpha.replace("2", "_2").replace("3", "_3")
-                return getattr(country, return_alpha)
-
-    except (KeyError, ValueError):
-        # Try the world bank non-standard codes
-        if "2" in return_alpha and code in NON_STANDARD_REGIONS:
-            return NON_STANDARD_REGIONS[code]["id"]
-
-        elif "3" in return_alpha:
-            for alpha2, vals in NON_STANDARD_REGIONS.items():
-                if vals["id"] == code:
-                    return alpha2
-
-        # No match found
-        return code
+    code = code.upper()
+    if "2" in return_alpha:
+        return COUNTRY_CODES.to_alpha2.get(code, code)
+    return COUNTRY_CODES.to_alpha3.get(code, code)
 
 
 def worldbank_date_to_datetime(date):
@@ -141,3 +828,33 @@ def worldbank_date_to_datetime(date):
         return datetime.date(int(year), int(month), 1)
 
     return datetime.date(int(date), 1, 1)
+
+
+def date_index(pd, dates, period=False):
+    """Return a pandas DatetimeIndex for a sequence of World Bank date strings,
+    converting each distinct date only once.
+
+    :param pd:
+        The pandas module.
+
+    :param dates:
+        World Bank date strings, eg. ``2010``, ``2010Q1`` or ``2010M01``.
+
+    :param period:
+        Return a PeriodIndex instead, with a yearly, quarterly or monthly
+        frequency to match the dates.
+
+    """
+    codes, distinct = pd.factorize(pd.Index(dates, dtype=object))
+    index = pd.DatetimeIndex([worldbank_date_to_datetime(date) for date in
+        distinct], name="date")
+    if period:
+        first = distinct[0] if len(distinct) else ""
+        if "Q" in first:
+            freq = "Q"
+        elif "M" in first:
+            freq = "M"
+        else:
+            freq = "Y"
+        index = index.to_period(freq)
+    return index.take(codes)